@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Serve the app through an ASGI server (e.g. ``uvicorn daruka.asgi:application``)
+when the realtime event stream is in use: each /api/realtime/events/
+subscriber is then a coroutine on the event loop instead of a blocked worker
+thread. Every process runs its own broker and polls the shared ChangeEvent
+table for events written by the others, so any number of workers can be run.
 """
 
 import os
@@ -0,0 +1,177 @@
+"""
+``POST /api/batch/``: run several API calls in one HTTP request.
+
+Request body::
+
+    {"parallel": true,
+     "requests": [{"id": "p", "method": "GET", "path": "/api/projects/3/?user_email=a@x.io"},
+                  {"id": "s", "method": "GET", "path": "/api/analytics/summary/?site=7"}]}
+
+Only the project, site, analytics and other data endpoints listed in
+``ALLOWED_PREFIXES`` can be called; account, admin and debug views cannot.
+Each sub-request is resolved against the URLconf and its view is called
+directly, skipping the middleware stack. Sub-requests reuse the outer
+request's session, user and headers, so authentication happens once. CSRF is
+also checked once, on the batch request itself. Content negotiation headers
+(``Accept-Encoding``, ``If-None-Match``) are not passed on: every sub-response
+is embedded as plain JSON in the batch response.
+
+Calls run in order on the outer request's thread and database connection.
+With ``"parallel": true``, consecutive read-only calls run together on a
+small thread pool instead. Writes still run alone, in order, and act as
+barriers between the parallel groups.
+"""
+
+import contextvars
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+ALLOWED_METHODS = SAFE_METHODS + ('POST', 'PUT', 'PATCH', 'DELETE')
+# Data endpoints that may be batched; accounts, admin and debug views may not.
+# Realtime streams are left out, and other streamed answers (exports) are
+# reported as errors by _run.
+ALLOWED_PREFIXES = (
+    '/api/projects/', '/api/sites/', '/api/analytics/', '/api/dashboard/', '/api/search/', '/api/changes/',
+    '/api/maps/clusters/', '/api/jobs/',
+)
+# Would let a sub-request return compressed bytes or an empty 304.
+DROPPED_HEADERS = ('HTTP_CONTENT_LENGTH', 'HTTP_ACCEPT_ENCODING', 'HTTP_IF_NONE_MATCH')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _parse(entry, index):
+    if not isinstance(entry, dict):
+        raise BatchError(f'requests[{index}] must be an object')
+    method = str(entry.get('method', 'GET')).upper()
+    if method not in ALLOWED_METHODS:
+        raise BatchError(f'requests[{index}]: unsupported method {method}')
+    path = entry.get('path')
+    if (not isinstance(path, str) or not path.startswith(ALLOWED_PREFIXES)
+            or {'.', '..', ''} & set(urlsplit(path).path.split('/')[1:-1])):
+        raise BatchError(f'requests[{index}]: path must be a project, site or analytics API URL')
+    return {'id': entry.get('id', index), 'method': method, 'path': path, 'body': entry.get('body')}
+
+
+def _build_request(outer, method, path, body):
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in outer.META.items()
+        if key.startswith('HTTP_') or key in ('REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SCRIPT_NAME')
+    }
+    for key in DROPPED_HEADERS:
+        environ.pop(key, None)
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json' if body is not None else '',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': outer.scheme,
+    })
+    request = WSGIRequest(environ)
+    # Authenticated once by the outer request's middleware.
+    request.user = getattr(outer, 'user', None)
+    request.session = getattr(outer, 'session', None)
+    request._dont_enforce_csrf_checks = True
+    return request
+
+
+def _run(outer, call):
+    request = _build_request(outer, call['method'], call['path'], call['body'])
+    try:
+        match = resolve(request.path_info)
+        request.resolver_match = match
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+    except Resolver404:
+        return {'id': call['id'], 'status': status.HTTP_404_NOT_FOUND, 'body': {'error': 'Not found'}}
+    except Exception as exc:
+        response = response_for_exception(request, exc)
+
+    if response.streaming:
+        return {'id': call['id'], 'status': status.HTTP_400_BAD_REQUEST,
+                'body': {'error': 'Streaming responses cannot be batched'}}
+
+    content = response.content
+    content_type = response.get('Content-Type', '')
+    try:
+        if content_type.startswith('application/json') and content:
+            body = json.loads(content)
+        else:
+            body = content.decode(response.charset, errors='replace') if content else None
+    except ValueError:
+        # UnicodeDecodeError and JSONDecodeError are both ValueErrors.
+        return {'id': call['id'], 'status': status.HTTP_502_BAD_GATEWAY,
+                'body': {'error': 'Sub-request returned a body that is not valid JSON'}}
+    headers = {name: value for name, value in response.items() if name in ('ETag', 'Location', 'Content-Type')}
+    return {'id': call['id'], 'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def _run_in_thread(context, outer, call):
+    try:
+        # Carries the outer request's state (e.g. replica pinning) into the thread.
+        return context.copy().run(_run, outer, call)
+    finally:
+        connections.close_all()
+
+
+def _groups(calls, parallel):
+    """Split calls into runs of consecutive read-only calls and single writes."""
+    group = []
+    for call in calls:
+        if parallel and call['method'] in SAFE_METHODS:
+            group.append(call)
+            continue
+        if group:
+            yield group
+            group = []
+        yield [call]
+    if group:
+        yield group
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch(request):
+    """Run a list of API sub-requests and return all of their responses"""
+    entries = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return Response({'error': 'requests must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(entries) > settings.BATCH_MAX_REQUESTS:
+        return Response({'error': f'At most {settings.BATCH_MAX_REQUESTS} requests per batch'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        calls = [_parse(entry, index) for index, entry in enumerate(entries)]
+    except BatchError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    outer = request._request
+    parallel = bool(request.data.get('parallel')) and settings.BATCH_MAX_WORKERS > 1
+    responses = []
+    for group in _groups(calls, parallel):
+        if len(group) == 1:
+            responses.append(_run(outer, group[0]))
+            continue
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(len(group), settings.BATCH_MAX_WORKERS)) as pool:
+            responses.extend(pool.map(lambda call: _run_in_thread(context, outer, call), group))
+    return Response({'responses': responses})
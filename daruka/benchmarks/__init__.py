@@ -0,0 +1,90 @@
+"""
+Microbenchmarks for the hot paths: geometry math, serializers, analytics
+endpoints and bulk inserts.
+
+Run with ``manage.py run_benchmarks``. Cases run against a throwaway test
+database (in-memory on the default SQLite setup), so the suite needs no
+network and leaves no data behind. Each case is timed like pytest-benchmark:
+one warm-up call, then ``rounds`` rounds of as many iterations as fill
+``min_time`` seconds, reporting per-call min, median, mean and standard
+deviation.
+
+Results are compared with ``baseline.json`` next to this file; a case whose
+chosen statistic is more than ``threshold`` slower than its baseline is a
+regression and makes the command fail.
+"""
+
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+STATISTICS = ('min', 'median', 'mean')
+
+
+class Case:
+    def __init__(self, name, func, group=''):
+        self.name = name
+        self.func = func
+        self.group = group or name.split('[')[0]
+
+
+def measure(func, rounds=5, min_time=0.1):
+    """Time ``func``; returns per-call statistics in seconds."""
+    started = time.perf_counter()
+    func()  # Warm-up, also used to calibrate the iterations per round
+    once = max(time.perf_counter() - started, 1e-9)
+    iterations = max(1, int(min_time / once))
+
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - started) / iterations)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'rounds': rounds,
+        'iterations': iterations,
+    }
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text()).get('benchmarks', {})
+
+
+def save_baseline(results, path=BASELINE_PATH, merge=True):
+    """Write ``results`` as the baseline, keeping cases that were not run when ``merge``."""
+    benchmarks = load_baseline(path) if merge else {}
+    benchmarks.update(results)
+    document = {'machine': machine_info(), 'benchmarks': dict(sorted(benchmarks.items()))}
+    Path(path).write_text(json.dumps(document, indent=2) + '\n')
+
+
+def compare(results, baseline, threshold=0.25, stat='min'):
+    """``[(name, current, baseline, change)]`` for every case slower than ``threshold`` allows."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name, {}).get(stat)
+        if not previous:
+            continue
+        change = result[stat] / previous - 1
+        if change > threshold:
+            regressions.append((name, result[stat], previous, change))
+    return regressions
@@ -0,0 +1,130 @@
+"""Benchmark cases and the fixtures they run against."""
+
+import math
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from projects.models import Project, Site
+from projects.serializers import ProjectSerializer, SiteGeoJSONSerializer
+from stats.models import SiteAnalytics
+from stats.views import SiteAnalyticsViewSet
+
+from . import Case
+
+VERTEX_COUNTS = (16, 256, 4096, 65536)
+# Analytics fixtures: one observation per site per day over this many days,
+# ending on HISTORY_END, with as many sites as the row count needs.
+HISTORY_DAYS = 3650
+HISTORY_END = date(2025, 12, 31)
+
+
+def polygon(vertices, lon=0.0, lat=0.0, radius=0.01):
+    ring = [
+        [lon + radius * math.cos(2 * math.pi * i / vertices), lat + radius * math.sin(2 * math.pi * i / vertices)]
+        for i in range(vertices)
+    ]
+    return {'type': 'Polygon', 'coordinates': [ring + [ring[0]]]}
+
+
+def _analytics(site_id, count, end=HISTORY_END):
+    # One row per day, the latest on ``end``.
+    start = end - timedelta(days=count - 1)
+    for i in range(count):
+        yield SiteAnalytics(
+            site_id=site_id, date=start + timedelta(days=i),
+            carbon_sequestered=i % 50, carbon_offset=i % 40, species_count=i % 45,
+            vegetation_index=(i % 100) / 100, tree_cover_percentage=i % 75,
+            soil_quality_index=i % 90, water_retention=i % 500,
+        )
+
+
+def _sites(project, user, count, offset=0):
+    return [
+        Site(
+            project=project, created_by=user, name=f'Site {offset + i}', description='Benchmark site',
+            geometry=polygon(16, lon=(offset + i) % 360 - 180, lat=(offset + i) // 360 % 170 - 85), area=1.0,
+        )
+        for i in range(count)
+    ]
+
+
+def build_cases(row_counts, object_count, vertex_counts=VERTEX_COUNTS, stdout=None):
+    """Create the fixtures and return the list of ``Case``."""
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    cases = []
+    for vertices in vertex_counts:
+        site = Site(geometry=polygon(vertices))
+        cases.append(Case(f'geometry.calculate_area[{vertices}]', site.calculate_area))
+
+    log(f'Creating {object_count} projects and sites')
+    user = get_user_model().objects.create(username='benchmark', email='benchmark@example.com')
+    Project.objects.bulk_create(
+        [Project(name=f'Project {i}', description='Benchmark project', created_by=user) for i in range(object_count)],
+        batch_size=1000,
+    )
+    project = Project.objects.order_by('pk').first()
+    Site.objects.bulk_create(_sites(project, user, object_count), batch_size=1000)
+
+    projects = list(Project.objects.select_related('created_by').order_by('pk')[:object_count])
+    sites = list(Site.objects.select_related('project', 'created_by').order_by('pk')[:object_count])
+    cases.append(Case(
+        f'serializers.ProjectSerializer[{object_count}]',
+        lambda: ProjectSerializer(projects, many=True).data,
+    ))
+    cases.append(Case(
+        f'serializers.SiteGeoJSONSerializer[{object_count}]',
+        lambda: SiteGeoJSONSerializer(sites, many=True).data,
+    ))
+
+    factory = APIRequestFactory()
+    views = {
+        'summary': SiteAnalyticsViewSet.as_view({'get': 'summary'}),
+        'time_series': SiteAnalyticsViewSet.as_view({'get': 'time_series'}),
+    }
+
+    def call(view, site_id):
+        def run():
+            response = view(factory.get('/', {'site': site_id}))
+            response.render()
+        return run
+
+    created = 0
+    longest = None  # (site id, rows) of the longest history so far
+    for rows in sorted(row_counts):
+        # The table grows to ``rows`` in total; each case reads the history of
+        # one site, as the dashboard does, while the others fill the table.
+        log(f'Creating {rows} analytics rows')
+        while created < rows:
+            count = min(HISTORY_DAYS, rows - created)
+            site = Site.objects.create(
+                project=project, created_by=user, name=f'Analytics {created}', geometry=polygon(16), area=1.0,
+            )
+            SiteAnalytics.objects.bulk_create(_analytics(site.id, count), batch_size=5000)
+            if longest is None or count > longest[1]:
+                longest = (site.id, count)
+            created += count
+        for action, view in views.items():
+            cases.append(Case(f'analytics.{action}[{rows}]', call(view, longest[0])))
+
+    insert_count = min(object_count, 10000)
+    insert_site = sites[0]
+
+    def insert_analytics():
+        with transaction.atomic():
+            SiteAnalytics.objects.bulk_create(_analytics(insert_site.id, insert_count), batch_size=1000)
+            transaction.set_rollback(True)
+
+    def insert_sites():
+        with transaction.atomic():
+            Site.objects.bulk_create(_sites(project, user, insert_count, offset=object_count), batch_size=1000)
+            transaction.set_rollback(True)
+
+    cases.append(Case(f'bulk_insert.SiteAnalytics[{insert_count}]', insert_analytics))
+    cases.append(Case(f'bulk_insert.Site[{insert_count}]', insert_sites))
+    return cases
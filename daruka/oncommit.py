@@ -0,0 +1,55 @@
+"""
+Per-transaction batching of ``transaction.on_commit`` work.
+
+``CommitBatch(flush).add(item)`` collects items while a transaction is open
+and calls ``flush(items)`` once after it commits, with each item once however
+often it was added. Outside a transaction the item is flushed straight away.
+
+Every ``add`` registers its own ``on_commit`` callback. Django runs the
+callbacks of a committed transaction in order, so the first one to run sends
+everything added since it was registered and the rest find nothing left.
+Items whose callbacks were discarded by a rollback are older than that first
+callback and are dropped instead of leaking into the next transaction. Items
+added inside a savepoint that rolled back still go out with the rest of the
+outer transaction, so ``flush`` must tolerate items that no longer apply.
+"""
+
+import itertools
+import threading
+from functools import partial
+
+from django.db import transaction
+
+
+class CommitBatch:
+    def __init__(self, flush):
+        self.flush = flush
+        self._local = threading.local()
+        self._sequence = itertools.count()
+
+    def _state(self):
+        state = self._local.__dict__
+        if 'pending' not in state:
+            # item -> number of its latest add, in the order of those adds
+            state['pending'] = {}
+            state['live'] = set()
+        return state['pending'], state['live']
+
+    def add(self, item):
+        number = next(self._sequence)
+        pending, live = self._state()
+        previous = pending.pop(item, None)
+        if previous is not None:
+            live.discard(previous)
+        pending[item] = number
+        live.add(number)
+        transaction.on_commit(partial(self._run, number))
+
+    def _run(self, number):
+        pending, live = self._state()
+        if number not in live:
+            return  # Already sent, or added again later in the transaction
+        items = [item for item, added in pending.items() if added >= number]
+        pending.clear()
+        live.clear()
+        self.flush(items)
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for huge admin changelists.
+
+    ``COUNT(*)`` over millions of rows is a full scan on Postgres. For an
+    unfiltered changelist the planner's row estimate from ``pg_class`` is used
+    instead once it passes ``ADMIN_ESTIMATED_COUNT_THRESHOLD``; filtered lists
+    (and other databases) are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimate(queryset)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def _estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed.
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,91 @@
+"""
+Database routing for the optional read replica.
+
+Reads only go to the ``replica`` alias inside a ``replica_reads()`` block, which
+the heavy read-only endpoints (analytics aggregates, GeoJSON site lists and
+exports) opt into. Any write made during a request pins the rest of that request
+to the primary, and ``ReplicaPinningMiddleware`` keeps the same client on the
+primary for ``REPLICA_STICKY_SECONDS`` afterwards so it always reads its own
+writes.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'daruka_db_pin'
+
+_replica_allowed = ContextVar('replica_allowed', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads in this block to be served by the replica."""
+    token = _replica_allowed.set(True)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+def use_replica(func):
+    """Decorator form of ``replica_reads`` for views and view actions."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_allowed.get() and not _pinned.get() and replica_available():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so relations are always allowed.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Pin a client to the primary for a short time after it writes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+        if wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
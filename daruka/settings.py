@@ -28,6 +28,9 @@ INSTALLED_APPS = [
     'accounts',
     'projects',
     'stats',
+    'maps',
+    'realtime',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -99,11 +102,59 @@ else:
         }
     }
 
+# Optional read replica for analytics aggregates, GeoJSON site lists and exports.
+# Clients that just wrote stay on the primary for REPLICA_STICKY_SECONDS.
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(REPLICA_DATABASE_URL, conn_max_age=600, ssl_require=True)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['daruka.routers.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.sessions.middleware.SessionMiddleware'),
+        'daruka.routers.ReplicaPinningMiddleware',
+    )
+
+# Derived-data caches (GeoJSON blobs, spatial indexes) are invalidated through
+# versions stored here, so multi-worker deployments must set REDIS_URL to
+# share them between processes (gunicorn.conf.py refuses to start more than one
+# worker without it).
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    # Token buckets per client and endpoint (daruka/throttling.py). Scopes are
+    # "<basename>.<action>" for viewsets and the view name for function views;
+    # "default" covers everything else. Every limit is off unless its variable
+    # is set (e.g. THROTTLE_SUMMARY_RATE=600/min). Buckets live in the default
+    # cache, so enable limits only with a shared cache (REDIS_URL): with the
+    # per-process LocMemCache each worker keeps its own buckets.
+    'DEFAULT_THROTTLE_CLASSES': ['daruka.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'default': os.getenv("THROTTLE_DEFAULT_RATE") or None,
+        'analytics.summary': os.getenv("THROTTLE_SUMMARY_RATE") or None,
+        'analytics.time_series': os.getenv("THROTTLE_TIME_SERIES_RATE") or None,
+        'site.list': os.getenv("THROTTLE_SITE_LIST_RATE") or None,
+    },
 }
 
 # Password validation
@@ -183,4 +234,120 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
-]
\ No newline at end of file
+]
+
+# Precompressed per-project GeoJSON FeatureCollections (see projects/caching.py).
+# Entries are versioned per project, so the timeout only bounds memory use.
+SITE_GEOJSON_CACHE_TIMEOUT = int(os.getenv("SITE_GEOJSON_CACHE_TIMEOUT", str(60 * 60 * 24)))
+
+# Site centroid clustering (see maps/clustering.py). Cells are 2**MAP_CLUSTER_CELL_BITS
+# per map tile side, so 3 gives 32px cells on 256px tiles.
+MAP_CLUSTER_MAX_ZOOM = int(os.getenv("MAP_CLUSTER_MAX_ZOOM", "16"))
+MAP_CLUSTER_CELL_BITS = int(os.getenv("MAP_CLUSTER_CELL_BITS", "3"))
+
+# Site geometries are quantized to this many decimal places on write
+# (7 decimals is about 1 cm at the equator).
+SITE_GEOMETRY_PRECISION = int(os.getenv("SITE_GEOMETRY_PRECISION", "7"))
+
+# Grid size used to quantize TopoJSON site lists (?format=topojson).
+SITE_TOPOJSON_QUANTIZATION = int(os.getenv("SITE_TOPOJSON_QUANTIZATION", "1000000"))
+
+# Point-in-polygon site lookup (/api/sites/locate/). Grid cell size in degrees
+# and the largest accepted batch.
+SITE_LOCATE_CELL_DEGREES = float(os.getenv("SITE_LOCATE_CELL_DEGREES", "0.05"))
+SITE_LOCATE_MAX_BATCH = int(os.getenv("SITE_LOCATE_MAX_BATCH", "10000"))
+
+# Site overlaps smaller than this (square meters) are treated as digitizing noise.
+SITE_OVERLAP_MIN_AREA = float(os.getenv("SITE_OVERLAP_MIN_AREA", "1.0"))
+
+# Analytics heatmap tiles (see maps/heatmap.py): cells per tile side and cache lifetime.
+MAP_HEATMAP_GRID = int(os.getenv("MAP_HEATMAP_GRID", "64"))
+MAP_HEATMAP_CACHE_TIMEOUT = int(os.getenv("MAP_HEATMAP_CACHE_TIMEOUT", str(60 * 60)))
+
+# Douglas-Peucker tolerance in degrees for dissolved project footprints.
+PROJECT_FOOTPRINT_TOLERANCE = float(os.getenv("PROJECT_FOOTPRINT_TOLERANCE", "0.0001"))
+# Seconds a full footprint refresh waits after a site is reshaped, moved or deleted.
+PROJECT_FOOTPRINT_REFRESH_DELAY = int(os.getenv("PROJECT_FOOTPRINT_REFRESH_DELAY", "60"))
+
+# Change feed (/api/changes/): rows per stream per page, and how long tombstones
+# of deleted rows are kept. Older cursors get 410 and must resync from scratch.
+CHANGE_FEED_PAGE_SIZE = int(os.getenv("CHANGE_FEED_PAGE_SIZE", "500"))
+CHANGE_FEED_TOMBSTONE_DAYS = int(os.getenv("CHANGE_FEED_TOMBSTONE_DAYS", "90"))
+# updated_at is stamped at save, not commit: the cursor trails the present by this
+# much so rows from transactions that commit late are still returned (maybe twice).
+CHANGE_FEED_LOOKBACK_SECONDS = float(os.getenv("CHANGE_FEED_LOOKBACK_SECONDS", "10"))
+
+# Server-Sent Events push channel (/api/realtime/events/). Workers pick up each
+# other's events by polling the ChangeEvent table every REALTIME_POLL_INTERVAL
+# seconds while they have subscribers.
+REALTIME_POLL_INTERVAL = float(os.getenv("REALTIME_POLL_INTERVAL", "0.5"))
+REALTIME_KEEPALIVE_SECONDS = int(os.getenv("REALTIME_KEEPALIVE_SECONDS", "15"))
+REALTIME_RETRY_MS = int(os.getenv("REALTIME_RETRY_MS", "2000"))
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "256"))
+REALTIME_EVENT_RETENTION_SECONDS = int(os.getenv("REALTIME_EVENT_RETENTION_SECONDS", "3600"))
+# Events committed out of id order are picked up if they land within this window.
+REALTIME_POLL_LOOKBACK_SECONDS = float(os.getenv("REALTIME_POLL_LOOKBACK_SECONDS", "10"))
+
+# Background jobs. With JOBS_EAGER jobs run in-process right after the enqueuing
+# transaction commits; set it to False when `manage.py run_worker` is deployed.
+JOBS_EAGER = os.getenv("JOBS_EAGER", "True") == "True"
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+JOBS_RETRY_BACKOFF = int(os.getenv("JOBS_RETRY_BACKOFF", "30"))  # Seconds, doubled per attempt
+JOBS_LOCK_TIMEOUT = int(os.getenv("JOBS_LOCK_TIMEOUT", "600"))  # Requeue running jobs silent this long
+JOBS_HEARTBEAT_INTERVAL = int(os.getenv("JOBS_HEARTBEAT_INTERVAL", "60"))  # Running jobs refresh their lock this often
+
+# Rows removed per transaction when a project is deleted (projects.deletion).
+PROJECT_DELETE_CHUNK_SIZE = int(os.getenv("PROJECT_DELETE_CHUNK_SIZE", "1000"))
+
+# Admin changelists show the planner's row estimate instead of COUNT(*) for
+# unfiltered tables larger than this (Postgres only).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv("ADMIN_ESTIMATED_COUNT_THRESHOLD", "100000"))
+
+# Project ZIP export: rows fetched per database round trip, and how many
+# compressed bytes to collect before sending a chunk to the client.
+PROJECT_EXPORT_CHUNK_SIZE = int(os.getenv("PROJECT_EXPORT_CHUNK_SIZE", "2000"))
+PROJECT_EXPORT_FLUSH_BYTES = int(os.getenv("PROJECT_EXPORT_FLUSH_BYTES", str(64 * 1024)))
+
+# /api/batch/: sub-requests per batch, and threads for parallel read-only calls.
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "25"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+# Build the in-process site index during server warm-up (see daruka/warmup.py)
+# so preforked workers share it instead of each building it on first use.
+WARMUP_BUILD_INDEXES = os.getenv("WARMUP_BUILD_INDEXES", "False") == "True"
+
+# /api/analytics/trends/: default moving-average window (observations), the
+# |z| above which an observation is flagged, how far from exactly one year a
+# year-over-year match may be, sites computed per batch and cache lifetime.
+TRENDS_DEFAULT_WINDOW = int(os.getenv("TRENDS_DEFAULT_WINDOW", "3"))
+TRENDS_ANOMALY_Z = float(os.getenv("TRENDS_ANOMALY_Z", "2.5"))
+TRENDS_YOY_TOLERANCE_DAYS = int(os.getenv("TRENDS_YOY_TOLERANCE_DAYS", "20"))
+TRENDS_BATCH_SIZE = int(os.getenv("TRENDS_BATCH_SIZE", "2000"))
+TRENDS_CACHE_TIMEOUT = int(os.getenv("TRENDS_CACHE_TIMEOUT", str(60 * 60 * 24)))
+
+# Site carbon forecasts (stats.forecasting): years projected, minimum history,
+# sites loaded per batch, rows above which a batch is fitted in a process pool,
+# pool size, z for the prediction interval, and how long the refresh job waits
+# after an analytics write so bursts of writes are refitted together.
+FORECAST_HORIZON_YEARS = int(os.getenv("FORECAST_HORIZON_YEARS", "5"))
+FORECAST_MIN_OBSERVATIONS = int(os.getenv("FORECAST_MIN_OBSERVATIONS", "3"))
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "20000"))
+FORECAST_PARALLEL_MIN_ROWS = int(os.getenv("FORECAST_PARALLEL_MIN_ROWS", "500000"))
+FORECAST_PROCESSES = int(os.getenv("FORECAST_PROCESSES", str(os.cpu_count() or 1)))
+FORECAST_INTERVAL_Z = float(os.getenv("FORECAST_INTERVAL_Z", "1.96"))
+FORECAST_REFRESH_DELAY = int(os.getenv("FORECAST_REFRESH_DELAY", "60"))
+
+# /api/search/ (projects.search): results returned by default and at most.
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+
+# Request coalescing (daruka/singleflight.py): how long concurrent identical
+# requests wait for the one computing the result, how often waiters in other
+# processes poll the cache, and how long a finished result is kept for them.
+SINGLE_FLIGHT_WAIT = float(os.getenv("SINGLE_FLIGHT_WAIT", "10"))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.05"))
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "2"))
+
+# /api/analytics/benchmarks/: lifetime of cached percentile populations. Any
+# analytics or site write moves them to a new version before this expires.
+BENCHMARKS_CACHE_TIMEOUT = int(os.getenv("BENCHMARKS_CACHE_TIMEOUT", str(60 * 60)))
@@ -0,0 +1,130 @@
+"""
+Request coalescing for expensive reads.
+
+``SingleFlight.do(key, compute)`` runs ``compute`` once for concurrent callers
+asking for the same key and hands every caller the same result:
+
+* threads of one process wait on the in-flight call (an ``Event``);
+* other processes see a lock in the cache, poll for the result the leader
+  stores under the key for ``SINGLE_FLIGHT_RESULT_TTL`` seconds, and compute
+  it themselves if the leader fails or takes longer than
+  ``SINGLE_FLIGHT_WAIT``.
+
+Keys must change whenever the underlying data does (include a cache version),
+otherwise a result could be shared after a write. Counters of computed and
+shared results are kept in the cache so they add up across processes, and are
+served at ``/api/coalescing/``.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+COUNTERS = ('computed', 'shared', 'timed_out')
+
+_flights = {}
+_lock = threading.Lock()
+_calls = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        _flights[name] = self
+
+    def _count(self, counter):
+        key = f'singleflight:{self.name}:{counter}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key)
+
+    def stats(self):
+        keys = {counter: f'singleflight:{self.name}:{counter}' for counter in COUNTERS}
+        values = cache.get_many(keys.values())
+        counts = {counter: values.get(key, 0) for counter, key in keys.items()}
+        requests = sum(counts.values())
+        counts['requests'] = requests
+        # Share of requests answered without computing, and requests per computation.
+        counts['coalescing_ratio'] = counts['shared'] / requests if requests else 0.0
+        counts['requests_per_computation'] = requests / counts['computed'] if counts['computed'] else None
+        return counts
+
+    def do(self, key, compute):
+        full_key = f'{self.name}:{key}'
+        with _lock:
+            call = _calls.get(full_key)
+            leader = call is None
+            if leader:
+                call = _calls[full_key] = _Call()
+
+        if not leader:
+            if call.done.wait(settings.SINGLE_FLIGHT_WAIT):
+                self._count('shared')
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            self._count('timed_out')
+            return compute()
+
+        try:
+            call.result = self._across_processes(full_key, compute)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with _lock:
+                del _calls[full_key]
+            call.done.set()
+
+    def _across_processes(self, full_key, compute):
+        result_key = f'singleflight:result:{full_key}'
+        lock_key = f'singleflight:lock:{full_key}'
+        # Results are wrapped so a computed None is told apart from a miss.
+        shared = cache.get(result_key)
+        if shared is not None:
+            self._count('shared')
+            return shared[0]
+
+        if cache.add(lock_key, 1, settings.SINGLE_FLIGHT_WAIT):
+            try:
+                result = compute()
+                cache.set(result_key, (result,), settings.SINGLE_FLIGHT_RESULT_TTL)
+            finally:
+                cache.delete(lock_key)
+            self._count('computed')
+            return result
+
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+            shared = cache.get(result_key)
+            if shared is not None:
+                self._count('shared')
+                return shared[0]
+            if cache.get(lock_key) is None:
+                # The leader failed without storing a result.
+                break
+        self._count('timed_out')
+        return compute()
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def coalescing_stats(request):
+    """Computed vs shared results for each coalesced endpoint, summed across processes"""
+    return Response({name: flight.stats() for name, flight in sorted(_flights.items())})
@@ -0,0 +1,203 @@
+import json
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from projects.models import Project, Site
+
+from . import singleflight, throttling
+from .singleflight import SingleFlight
+from .throttling import TokenBucketThrottle, parse_rate
+
+User = get_user_model()
+
+
+def square(x, y, size=0.01):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+
+    def post(self, requests, **extra):
+        body = {'requests': requests}
+        return self.client.post('/api/batch/', json.dumps(body), content_type='application/json', **extra)
+
+    def test_runs_sub_requests_in_order(self):
+        response = self.post([
+            {'id': 'project', 'path': f'/api/projects/{self.project.id}/?user_email=a@x.io'},
+            {'id': 'sites', 'path': f'/api/sites/?user_email=a@x.io&project={self.project.id}'},
+            {'id': 'create', 'method': 'POST', 'path': '/api/sites/',
+             'body': {'project': self.project.id, 'name': 't', 'geometry': square(1, 1),
+                      'created_by_email': 'a@x.io'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['responses']
+        self.assertEqual([result['id'] for result in results], ['project', 'sites', 'create'])
+        self.assertEqual(results[0]['body']['name'], 'P')
+        self.assertEqual(results[1]['body']['type'], 'FeatureCollection')
+        self.assertEqual(results[2]['status'], 201)
+        self.assertTrue(Site.objects.filter(name='t').exists())
+
+    def test_compression_and_conditional_headers_are_not_forwarded(self):
+        path = f'/api/sites/?user_email=a@x.io&project={self.project.id}'
+        response = self.post(
+            [{'id': 'sites', 'path': path}],
+            HTTP_ACCEPT_ENCODING='gzip, deflate, br', HTTP_IF_NONE_MATCH='"stale"',
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['responses'][0]
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['body']['features'][0]['id'], self.site.id)
+
+    def test_errors_are_reported_per_item(self):
+        response = self.post([
+            {'id': 'missing', 'path': '/api/projects/nothing-here/x/'},
+            {'id': 'bad', 'path': '/api/sites/999999/?user_email=a@x.io'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['responses']], [404, 404])
+
+    def test_only_data_endpoints_can_be_batched(self):
+        login = {'method': 'POST', 'path': '/api/accounts/login/', 'body': {'email': 'a@x.io', 'password': 'p'}}
+        self.assertEqual(self.post([login]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/api/debug/'}]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/api/projects/../accounts/login/'}]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/api/sites//'}]).status_code, 400)
+        response = self.post([{'path': f'/api/analytics/summary/?site={self.site.id}'}, {'path': '/api/search/?q=s'}])
+        self.assertEqual(response.status_code, 200)
+
+    def test_rejects_invalid_batches(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/api/batch/'}]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/admin/'}]).status_code, 400)
+        self.assertEqual(self.post([{'path': '/api/realtime/stream/'}]).status_code, 400)
+        self.assertEqual(self.post([{'method': 'TRACE', 'path': '/api/sites/'}]).status_code, 400)
+
+
+class _CountedEvent(threading.Event):
+    """Event that counts the threads waiting on it."""
+
+    waiting = 0
+    changed = threading.Condition()
+
+    def wait(self, timeout=None):
+        with self.changed:
+            type(self).waiting += 1
+            self.changed.notify_all()
+        return super().wait(timeout)
+
+
+class _CountedCall(singleflight._Call):
+    def __init__(self):
+        super().__init__()
+        self.done = _CountedEvent()
+
+
+@override_settings(SINGLE_FLIGHT_WAIT=5, SINGLE_FLIGHT_POLL_INTERVAL=0.01, SINGLE_FLIGHT_RESULT_TTL=0)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        _CountedEvent.waiting = 0
+        patcher = mock.patch.object(singleflight, '_Call', _CountedCall)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.flight = SingleFlight('test')
+        self.addCleanup(singleflight._flights.pop, 'test', None)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.computed = 0
+
+    def slow_compute(self):
+        self.computed += 1
+        self.started.set()
+        self.release.wait(5)
+        return {'value': 42}
+
+    def test_concurrent_callers_share_one_computation(self):
+        callers = 8
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.flight.do('k', self.slow_compute)))
+                   for _ in range(callers)]
+        threads[0].start()
+        self.assertTrue(self.started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        with _CountedEvent.changed:
+            self.assertTrue(_CountedEvent.changed.wait_for(lambda: _CountedEvent.waiting == callers - 1, 5))
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(results, [{'value': 42}] * callers)
+        stats = self.flight.stats()
+        self.assertEqual((stats['computed'], stats['shared'], stats['requests']), (1, callers - 1, callers))
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.05)
+    def test_followers_compute_themselves_after_waiting_too_long(self):
+        leader = threading.Thread(target=self.flight.do, args=('k', self.slow_compute))
+        leader.start()
+        self.assertTrue(self.started.wait(5))
+        try:
+            self.assertEqual(self.flight.do('k', lambda: 'own'), 'own')
+            self.assertEqual(self.flight.stats()['timed_out'], 1)
+        finally:
+            self.release.set()
+            leader.join(5)
+
+    def test_results_from_another_process_are_shared(self):
+        # Another process holds the lock and stores its result a moment later.
+        cache.add('singleflight:lock:test:k', 1)
+        threading.Timer(0.05, cache.set, ['singleflight:result:test:k', ('theirs',)]).start()
+        self.assertEqual(self.flight.do('k', lambda: 'ours'), 'theirs')
+        self.assertEqual(self.flight.stats()['shared'], 1)
+
+    def test_failures_are_not_shared(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.flight.do('k', lambda: 1 / 0)
+        self.assertEqual(self.flight.do('k', lambda: 'retried'), 'retried')
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2.0))
+        self.assertEqual(parse_rate('10/s'), (10, 10.0))
+        self.assertIsNone(parse_rate(None))
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'default': '2/min'}})
+    def test_bucket_refills_over_time(self):
+        throttle = TokenBucketThrottle()
+        request = mock.Mock(user=None, META={'REMOTE_ADDR': '10.0.0.1'})
+        view = mock.Mock(throttle_scope='scope')
+        with mock.patch.object(throttling.time, 'time', return_value=1000.0) as clock:
+            self.assertEqual([throttle.allow_request(request, view) for _ in range(3)], [True, True, False])
+            self.assertAlmostEqual(throttle.wait(), 30)
+            clock.return_value = 1029.0
+            self.assertFalse(throttle.allow_request(request, view))
+            clock.return_value = 1030.5
+            self.assertTrue(throttle.allow_request(request, view))
+            self.assertFalse(throttle.allow_request(request, view))
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'default': None, 'analytics.summary': '2/min'},
+    })
+    def test_over_the_limit_is_429_with_retry_after(self):
+        url = '/api/analytics/summary/'
+        self.assertEqual([self.client.get(url, {'site': 'x'}).status_code for _ in range(2)], [400, 400])
+        response = self.client.get(url, {'site': 'x'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Other endpoints and clients have their own buckets.
+        self.assertEqual(self.client.get('/api/analytics/time_series/', {'site': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'site': 'x'}, REMOTE_ADDR='10.0.0.2').status_code, 400)
@@ -0,0 +1,79 @@
+"""
+Token-bucket rate limits per client and endpoint.
+
+Rates come from ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` in DRF's
+``'<requests>/<s|m|h|d>'`` form, looked up by the endpoint's scope: the
+viewset's ``basename.action`` (e.g. ``analytics.summary``, ``site.list``) or
+a function view's name, falling back to ``default``. A rate of ``120/min``
+allows bursts of 120 requests and refills at 2 per second. Clients are
+identified by user id when authenticated and by address otherwise.
+
+No limits are set by default; each is enabled with its environment variable
+(see ``REST_FRAMEWORK`` in settings). Buckets live in the default cache, so a
+limit only holds across processes with a shared cache (``REDIS_URL``). Updates
+are a read followed by a write, so simultaneous requests in different
+processes can occasionally overshoot a limit by a request or two.
+"""
+
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'120/min'`` -> ``(capacity, tokens per second)``; ``None`` for no limit."""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def view_scope(view):
+    scope = getattr(view, 'throttle_scope', None)
+    if scope:
+        return scope
+    basename = getattr(view, 'basename', None)
+    action = getattr(view, 'action', None)
+    if basename and action:
+        return f'{basename}.{action}'
+    return view.__class__.__name__
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def get_rate(self, scope):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        return parse_rate(rates.get(scope) or rates.get('default'))
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = view_scope(view)
+        rate = self.get_rate(scope)
+        if rate is None:
+            return True
+        capacity, refill = rate
+
+        key = f'throttle:{scope}:{self.get_client(request)}'
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+            self.wait_seconds = None
+        else:
+            self.wait_seconds = (1 - tokens) / refill
+        # Once the bucket would be full again the entry carries no information.
+        cache.set(key, (tokens, now), int((capacity - tokens) / refill) + 1)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -18,10 +18,17 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
+from daruka.batch import batch
+from daruka.singleflight import coalescing_stats
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/batch/", batch, name="batch"),
+    path("api/coalescing/", coalescing_stats, name="coalescing_stats"),
     path("api/accounts/", include("accounts.urls")),
     path("api/", include("projects.urls")),
     path("api/", include("stats.urls")),
+    path("api/maps/", include("maps.urls")),
+    path("api/realtime/", include("realtime.urls")),
+    path("api/jobs/", include("jobs.urls")),
 ]
@@ -0,0 +1,103 @@
+"""
+Warm-up run before a server process takes traffic.
+
+Work Django and DRF otherwise do lazily on the first requests is done up front:
+importing every app's modules, compiling the URL resolver, building each
+serializer's fields and rendering a response. Under gunicorn with
+``preload_app`` this runs once in the master and the workers inherit the result
+when they fork.
+"""
+
+import importlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+# App submodules imported lazily by views and signals.
+APP_MODULES = ('models', 'serializers', 'views', 'urls', 'signals', 'tasks', 'admin')
+EXTRA_MODULES = (
+    'projects.caching', 'projects.geometry', 'projects.topology', 'projects.spatial_index',
+    'projects.overlaps', 'projects.footprint', 'projects.export', 'projects.deletion', 'projects.search',
+    'maps.clustering', 'maps.heatmap', 'stats.trends', 'stats.forecasting', 'realtime.broker', 'jobs.queue', 'daruka.batch',
+)
+
+
+def _import_modules():
+    for config in apps.get_app_configs():
+        if not config.name.startswith('django.'):
+            for name in APP_MODULES:
+                try:
+                    importlib.import_module(f'{config.name}.{name}')
+                except ModuleNotFoundError as e:
+                    if e.name != f'{config.name}.{name}':
+                        raise
+    for name in EXTRA_MODULES:
+        importlib.import_module(name)
+
+
+def _compile_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    # Populates the reverse dictionary and compiles every pattern.
+    resolver.reverse_dict
+    resolver.resolve('/api/')
+    return resolver
+
+
+def _iter_viewsets(patterns):
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from _iter_viewsets(pattern.url_patterns)
+            continue
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is not None:
+            yield view_class
+
+
+def _build_serializers(resolver):
+    from rest_framework.renderers import JSONRenderer
+
+    built = set()
+    for view_class in _iter_viewsets(resolver.url_patterns):
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is None or serializer_class in built:
+            continue
+        serializer = serializer_class()
+        serializer.fields  # Model field introspection
+        built.add(serializer_class)
+    JSONRenderer().render({'warm': [1, 2.5, 'up']})
+    return len(built)
+
+
+def _build_indexes():
+    from projects import spatial_index
+
+    # Built before forking, the index pages are shared copy-on-write.
+    spatial_index.get_index()
+
+
+def warm_up(build_indexes=None):
+    """Run every warm-up step; returns ``{step: seconds}``."""
+    if build_indexes is None:
+        build_indexes = settings.WARMUP_BUILD_INDEXES
+    timings = {}
+
+    started = time.perf_counter()
+    _import_modules()
+    timings['imports'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    resolver = _compile_urls()
+    timings['urls'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _build_serializers(resolver)
+    timings['serializers'] = time.perf_counter() - started
+
+    if build_indexes:
+        started = time.perf_counter()
+        _build_indexes()
+        timings['indexes'] = time.perf_counter() - started
+    return timings
@@ -0,0 +1,66 @@
+"""
+Gunicorn production profile (``gunicorn -c gunicorn.conf.py daruka.wsgi:application``).
+
+Workers and threads scale with the CPUs available and can be overridden with
+GUNICORN_WORKERS / GUNICORN_THREADS. Cache versions only invalidate across
+processes through a shared cache, so without REDIS_URL the profile runs a
+single (threaded) worker and refuses to start more. The app is preloaded and warmed up once
+in the master (daruka.warmup), so forked workers start with Django set up, URL
+patterns compiled and serializers built. Database and cache connections
+opened while warming up are closed in each child after the fork.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+default_workers = multiprocessing.cpu_count() * 2 + 1 if os.getenv("REDIS_URL") else 1
+workers = int(os.getenv("GUNICORN_WORKERS", str(default_workers)))
+if workers > 1 and not os.getenv("REDIS_URL"):
+    raise RuntimeError(
+        f"GUNICORN_WORKERS={workers} needs REDIS_URL: with the per-process LocMemCache "
+        "an edit only invalidates cached site lists in the worker that made it."
+    )
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth; jitter avoids all of
+# them restarting at once.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers under I/O load.
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def _warm_up(log):
+    from daruka.warmup import warm_up
+
+    timings = warm_up()
+    log.info("Warm-up done: %s", ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_up(server.log)
+
+
+def post_fork(server, worker):
+    # Sockets inherited from the master must not be shared between processes.
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    caches.close_all()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        _warm_up(worker.log)
@@ -0,0 +1,23 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import run_pool
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes to run (defaults to the number of CPUs)')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Seconds to wait when the queue is empty (defaults to JOBS_POLL_INTERVAL)')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or os.cpu_count() or 1
+        self.stdout.write(f'Starting {processes} worker process(es)')
+        processed = run_pool(processes, options['poll_interval'], options['burst'], self.stdout)
+        if processed is not None:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
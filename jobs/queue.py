@@ -0,0 +1,249 @@
+"""
+Database-backed job queue.
+
+Job functions are registered with ``@job`` in an app's ``tasks`` module and
+queued with ``enqueue``. Workers (``manage.py run_worker``) claim queued rows
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it
+(Postgres) and with a compare-and-swap ``UPDATE`` otherwise (SQLite), so any
+number of worker processes can pull from the same table without running a
+job twice. With ``JOBS_EAGER`` jobs run inline once the enqueuing transaction
+commits, which keeps development setups working without a worker. Delayed
+jobs still wait for their ``run_at`` there: a timer thread runs them, and an
+enqueue that finds a due duplicate runs it in case that timer was lost with a
+previous process.
+"""
+
+import contextvars
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+_registry = {}
+# Columns ``run`` writes back when a job finishes or is rescheduled.
+OUTCOME_FIELDS = (
+    'status', 'attempts', 'run_at', 'locked_by', 'locked_at', 'progress', 'result', 'error', 'finished_at',
+    'updated_at',
+)
+_current = contextvars.ContextVar('current_job', default=None)
+
+
+class JobDefinition:
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        return enqueue(self.name, *args, **kwargs)
+
+
+def job(name=None, max_attempts=3):
+    """Register a function as a job; arguments must be JSON-serializable."""
+    def decorator(func):
+        definition = JobDefinition(func, name or f'{func.__module__}.{func.__name__}', max_attempts)
+        _registry[definition.name] = definition
+        return definition
+    return decorator
+
+
+def get_definition(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'No job registered as {name!r}')
+
+
+def enqueue(name, *args, key='', priority=0, delay=None, created_by=None, **kwargs):
+    """
+    Queue a registered job and return its ``Job`` row.
+
+    When ``key`` is given and a job with the same key is still queued, that
+    job is returned instead of adding a duplicate.
+    """
+    definition = get_definition(name)
+    if key:
+        existing = Job.objects.filter(key=key, status=Job.QUEUED).order_by('pk').first()
+        if existing is not None:
+            if settings.JOBS_EAGER and existing.run_at <= timezone.now():
+                transaction.on_commit(lambda: run_eagerly(existing))
+            return existing
+
+    instance = Job.objects.create(
+        name=name, args=list(args), kwargs=kwargs, key=key, priority=priority,
+        run_at=timezone.now() + (delay or timedelta()), max_attempts=definition.max_attempts,
+        created_by=created_by,
+    )
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: _run_eagerly_at(instance))
+    return instance
+
+
+def _run_eagerly_at(instance):
+    wait = (instance.run_at - timezone.now()).total_seconds()
+    if wait <= 0:
+        run_eagerly(instance)
+        return
+    timer = threading.Timer(wait, _run_delayed, [instance.pk])
+    timer.daemon = True
+    timer.start()
+
+
+def _run_delayed(pk):
+    try:
+        instance = Job.objects.filter(pk=pk).first()
+        if instance is not None:
+            run_eagerly(instance)
+    finally:
+        connections.close_all()
+
+
+def run_eagerly(instance):
+    # Retries happen straight away; there is no worker to pick them up later.
+    while Job.objects.filter(pk=instance.pk, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by='eager', locked_at=timezone.now()
+    ):
+        instance.refresh_from_db()
+        run(instance)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _due():
+    return Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).order_by('priority', 'run_at', 'pk')
+
+
+def claim(worker):
+    """Lock and return the next due job for ``worker``, or ``None``."""
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            instance = _due().select_for_update(skip_locked=True).first()
+            if instance is None:
+                return None
+            instance.status = Job.RUNNING
+            instance.locked_by = worker
+            instance.locked_at = now
+            instance.save(update_fields=['status', 'locked_by', 'locked_at', 'updated_at'])
+            return instance
+
+    # No row locks: race on an UPDATE guarded by the status we read.
+    for pk in _due().values_list('pk', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, updated_at=now
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def release_stale(timeout=None):
+    """
+    Requeue jobs whose worker died while running them; returns the count released.
+
+    Running jobs refresh ``locked_at`` from a heartbeat thread, so a lock this
+    old means the worker is gone. The lost run counts as an attempt: jobs
+    that have used up ``max_attempts`` fail instead of being retried forever.
+    """
+    timeout = timeout or settings.JOBS_LOCK_TIMEOUT
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status=Job.FAILED, attempts=F('attempts') + 1, locked_by='', locked_at=None, finished_at=now,
+        error=f'Worker stopped responding for over {timeout}s', updated_at=now,
+    )
+    requeued = stale.update(
+        status=Job.QUEUED, attempts=F('attempts') + 1, locked_by='', locked_at=None, run_at=now, updated_at=now
+    )
+    return failed + requeued
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps a running job's ``locked_at`` fresh so ``release_stale`` leaves it alone."""
+
+    def __init__(self, instance):
+        super().__init__(name=f'job-heartbeat-{instance.pk}', daemon=True)
+        self.instance = instance
+        self.finished = threading.Event()
+
+    def run(self):
+        try:
+            while not self.finished.wait(settings.JOBS_HEARTBEAT_INTERVAL):
+                Job.objects.filter(
+                    pk=self.instance.pk, status=Job.RUNNING, locked_by=self.instance.locked_by
+                ).update(locked_at=timezone.now())
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.finished.set()
+
+
+def run(instance):
+    """
+    Execute a claimed job, recording its result or scheduling a retry.
+
+    The outcome is written only while the row is still this worker's running
+    job: if ``release_stale`` requeued it meanwhile, that state is kept.
+    """
+    token = _current.set(instance)
+    locked_by = instance.locked_by
+    instance.attempts += 1
+    heartbeat = _Heartbeat(instance)
+    heartbeat.start()
+    try:
+        result = get_definition(instance.name)(*instance.args, **instance.kwargs)
+    except Exception:
+        instance.error = traceback.format_exc()
+        instance.locked_by = ''
+        instance.locked_at = None
+        if instance.attempts < instance.max_attempts:
+            backoff = settings.JOBS_RETRY_BACKOFF * (2 ** (instance.attempts - 1))
+            instance.status = Job.QUEUED
+            instance.run_at = timezone.now() + timedelta(seconds=backoff)
+        else:
+            instance.status = Job.FAILED
+            instance.finished_at = timezone.now()
+    else:
+        instance.status = Job.SUCCEEDED
+        instance.result = result
+        instance.progress = 1.0
+        instance.error = ''
+        instance.locked_by = ''
+        instance.locked_at = None
+        instance.finished_at = timezone.now()
+    finally:
+        heartbeat.stop()
+        _current.reset(token)
+    instance.updated_at = timezone.now()
+    written = Job.objects.filter(pk=instance.pk, status=Job.RUNNING, locked_by=locked_by).update(
+        **{field: getattr(instance, field) for field in OUTCOME_FIELDS}
+    )
+    if not written:
+        instance.refresh_from_db()
+    return instance
+
+
+def report_progress(done, total=None, message=''):
+    """Record progress of the running job; a no-op outside a job."""
+    instance = _current.get()
+    if instance is None:
+        return
+    instance.progress = min(done / total, 1.0) if total else done
+    instance.progress_message = message[:255]
+    Job.objects.filter(pk=instance.pk).update(
+        progress=instance.progress, progress_message=instance.progress_message, locked_at=timezone.now()
+    )
@@ -0,0 +1,133 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import claim, enqueue, job, release_stale, run
+
+calls = []
+
+
+@job('tests.record')
+def record(value):
+    calls.append(value)
+    return {'value': value}
+
+
+@job('tests.released')
+def released():
+    # Simulates release_stale requeueing the job while it still runs.
+    release_stale(timeout=-1)
+
+
+@job('tests.explode', max_attempts=2)
+def explode():
+    raise ValueError('boom')
+
+
+@override_settings(JOBS_EAGER=False, JOBS_RETRY_BACKOFF=30, JOBS_LOCK_TIMEOUT=600)
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_queued_jobs_are_deduplicated_by_key(self):
+        first = enqueue('tests.record', 1, key='same')
+        self.assertEqual(enqueue('tests.record', 2, key='same').pk, first.pk)
+        self.assertNotEqual(enqueue('tests.record', 3).pk, first.pk)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_unknown_jobs_are_rejected(self):
+        with self.assertRaises(LookupError):
+            enqueue('tests.missing')
+
+    def test_claim_takes_due_jobs_by_priority_once(self):
+        low = enqueue('tests.record', 'low', priority=5)
+        high = enqueue('tests.record', 'high', priority=1)
+        enqueue('tests.record', 'later', delay=timedelta(hours=1))
+
+        first = claim('w1')
+        self.assertEqual((first.pk, first.status, first.locked_by), (high.pk, Job.RUNNING, 'w1'))
+        self.assertEqual(claim('w2').pk, low.pk)
+        self.assertIsNone(claim('w3'))
+
+    def test_run_records_the_result(self):
+        enqueue('tests.record', 7)
+        instance = run(claim('w'))
+        instance.refresh_from_db()
+        self.assertEqual((instance.status, instance.result, instance.attempts), (Job.SUCCEEDED, {'value': 7}, 1))
+        self.assertIsNotNone(instance.finished_at)
+        self.assertEqual(calls, [7])
+
+    def test_failures_back_off_then_fail(self):
+        enqueue('tests.explode')
+        before = timezone.now()
+        instance = run(claim('w'))
+        self.assertEqual((instance.status, instance.attempts), (Job.QUEUED, 1))
+        self.assertGreaterEqual(instance.run_at, before + timedelta(seconds=30))
+        self.assertIn('ValueError: boom', instance.error)
+        self.assertIsNone(claim('w'))
+
+        Job.objects.filter(pk=instance.pk).update(run_at=timezone.now())
+        instance = run(claim('w'))
+        self.assertEqual((instance.status, instance.attempts), (Job.FAILED, 2))
+        self.assertEqual(instance.locked_by, '')
+
+    def test_run_keeps_a_requeue_that_happened_meanwhile(self):
+        enqueue('tests.released')
+        instance = run(claim('w'))
+        self.assertEqual((instance.status, instance.attempts, instance.locked_by), (Job.QUEUED, 1, ''))
+        self.assertIsNone(instance.finished_at)
+
+    def test_error_summary(self):
+        self.assertEqual(Job(error='Traceback...\nValueError: boom\n').error_summary, 'ValueError: boom')
+        self.assertEqual(Job(error=' \n ').error_summary, '')
+        self.assertEqual(Job().error_summary, '')
+
+    def test_release_stale_counts_lost_runs_as_attempts(self):
+        instance = enqueue('tests.record', 1)
+        claim('w')
+        self.assertEqual(release_stale(), 0)
+
+        stale = timezone.now() - timedelta(seconds=601)
+        Job.objects.filter(pk=instance.pk).update(locked_at=stale)
+        self.assertEqual(release_stale(), 1)
+        instance.refresh_from_db()
+        self.assertEqual((instance.status, instance.attempts, instance.locked_by), (Job.QUEUED, 1, ''))
+
+        for attempts, status in [(2, Job.QUEUED), (3, Job.FAILED)]:
+            claim('w')
+            Job.objects.filter(pk=instance.pk).update(locked_at=stale)
+            self.assertEqual(release_stale(), 1)
+            instance.refresh_from_db()
+            self.assertEqual((instance.status, instance.attempts), (status, attempts))
+        self.assertIn('stopped responding', instance.error)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs_run_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance = enqueue('tests.record', 1)
+            self.assertEqual(calls, [])
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, Job.SUCCEEDED)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs_wait_for_their_delay(self):
+        with mock.patch('jobs.queue.threading.Timer') as timer:
+            with self.captureOnCommitCallbacks(execute=True):
+                instance = enqueue('tests.record', 1, delay=timedelta(seconds=30))
+        self.assertEqual(calls, [])
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, Job.QUEUED)
+        wait, target, args = timer.call_args.args
+        self.assertAlmostEqual(wait, 30, delta=1)
+        self.assertEqual(args, [instance.pk])
+        timer.return_value.start.assert_called_once()
+
+        # The timer thread closes its connections when done; keep the test's open.
+        with mock.patch('jobs.queue.connections'):
+            target(*args)
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, Job.SUCCEEDED)
+        self.assertEqual(calls, [1])
@@ -0,0 +1,35 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework import status
+from .models import Job
+
+
+def job_payload(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'progress': job.progress,
+        'progress_message': job.progress_message,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.error_summary or None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def job_status(request, pk):
+    """Status, progress and result of a background job"""
+    jobs = Job.objects.all()
+    user_email = request.query_params.get('user_email')
+    if user_email:
+        jobs = jobs.filter(created_by__email=user_email)
+    try:
+        job = jobs.get(pk=pk)
+    except Job.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job_payload(job))
@@ -0,0 +1,84 @@
+"""Worker loop for ``manage.py run_worker``."""
+
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .queue import claim, release_stale, run, worker_id
+
+
+class Worker:
+    def __init__(self, poll_interval=None, burst=False, stdout=None):
+        self.poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+        self.burst = burst
+        self.stdout = stdout
+        self.stopping = False
+        self.processed = 0
+
+    def stop(self, *args):
+        # Finish the current job, then exit.
+        self.stopping = True
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def work(self):
+        name = worker_id()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        next_sweep = 0.0
+        while not self.stopping:
+            close_old_connections()
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + settings.JOBS_LOCK_TIMEOUT / 2
+                released = release_stale()
+                if released:
+                    self.log(f'{name}: released {released} stale jobs')
+
+            instance = claim(name)
+            if instance is None:
+                if self.burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            started = time.monotonic()
+            instance = run(instance)
+            self.processed += 1
+            self.log(f'{name}: {instance} in {time.monotonic() - started:.2f}s')
+        return self.processed
+
+
+def _work_in_child(poll_interval, burst):
+    Worker(poll_interval, burst).work()
+
+
+def run_pool(processes, poll_interval=None, burst=False, stdout=None):
+    """Run ``processes`` workers; a single one runs in this process."""
+    if processes <= 1:
+        return Worker(poll_interval, burst, stdout).work()
+
+    # Forked children must not share the parent's database connections.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    children = [
+        context.Process(target=_work_in_child, args=(poll_interval, burst), daemon=False)
+        for _ in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        child.join()
+    return None
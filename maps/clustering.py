@@ -0,0 +1,190 @@
+"""
+Hierarchical grid clustering of site centroids.
+
+Each project gets a ``ClusterIndex`` holding, for every zoom level, a dict of
+grid cells to running aggregates (count, summed area and summed coordinates).
+A cell at zoom ``z`` is exactly the union of four cells at ``z + 1``, so adding
+or removing one site touches one cell per level. Indexes live in process
+memory and are tagged with the project's cache version; a worker that sees a
+newer version (a write handled elsewhere) rebuilds from ``SiteCentroid`` rows.
+"""
+
+import math
+import threading
+
+from django.conf import settings
+
+from projects.caching import get_project_version
+from projects.geometry import mercator
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class ClusterIndex:
+    def __init__(self, max_zoom=None, cell_bits=None):
+        self.max_zoom = settings.MAP_CLUSTER_MAX_ZOOM if max_zoom is None else max_zoom
+        self.cell_bits = settings.MAP_CLUSTER_CELL_BITS if cell_bits is None else cell_bits
+        self.levels = [dict() for _ in range(self.max_zoom + 1)]
+        self.points = {}
+        self.version = None
+
+    def _cells(self, x, y):
+        for zoom in range(self.max_zoom + 1):
+            scale = 1 << (zoom + self.cell_bits)
+            yield zoom, (int(x * scale), int(y * scale))
+
+    def add(self, site_id, longitude, latitude, area):
+        if site_id in self.points:
+            self.remove(site_id)
+        x, y = mercator(longitude, latitude)
+        area = area or 0.0
+        self.points[site_id] = (x, y, longitude, latitude, area)
+        for zoom, key in self._cells(x, y):
+            cell = self.levels[zoom].get(key)
+            if cell is None:
+                self.levels[zoom][key] = [1, area, longitude, latitude, site_id]
+            else:
+                cell[0] += 1
+                cell[1] += area
+                cell[2] += longitude
+                cell[3] += latitude
+
+    def remove(self, site_id):
+        point = self.points.pop(site_id, None)
+        if point is None:
+            return
+        x, y, longitude, latitude, area = point
+        for zoom, key in self._cells(x, y):
+            level = self.levels[zoom]
+            cell = level[key]
+            cell[0] -= 1
+            if cell[0] <= 0:
+                del level[key]
+                continue
+            cell[1] -= area
+            cell[2] -= longitude
+            cell[3] -= latitude
+            if cell[4] == site_id:
+                cell[4] = None
+
+    def cells(self, zoom, bbox):
+        """
+        List ``(key, cell)`` for the cells at ``zoom`` intersecting ``bbox``.
+
+        Taken under the module lock with copied cells: ``apply_change`` edits
+        the same dicts from other request threads.
+        """
+        zoom = max(0, min(zoom, self.max_zoom))
+        scale = 1 << (zoom + self.cell_bits)
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y1 = mercator(min_lon, min_lat)
+        x1, y0 = mercator(max_lon, max_lat)
+        ix0, ix1 = int(x0 * scale), int(x1 * scale)
+        iy0, iy1 = int(y0 * scale), int(y1 * scale)
+
+        with _lock:
+            level = self.levels[zoom]
+            if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > len(level):
+                return [
+                    (key, list(cell)) for key, cell in level.items()
+                    if ix0 <= key[0] <= ix1 and iy0 <= key[1] <= iy1
+                ]
+            found = []
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    cell = level.get((ix, iy))
+                    if cell is not None:
+                        found.append(((ix, iy), list(cell)))
+            return found
+
+
+def build_index(project_id):
+    from .models import SiteCentroid
+
+    index = ClusterIndex()
+    rows = SiteCentroid.objects.filter(project_id=project_id).values_list(
+        'site_id', 'longitude', 'latitude', 'area'
+    )
+    for site_id, longitude, latitude, area in rows.iterator(chunk_size=5000):
+        index.add(site_id, longitude, latitude, area)
+    return index
+
+
+def get_index(project_id):
+    version = get_project_version(project_id)
+    index = _indexes.get(project_id)
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        index = _indexes.get(project_id)
+        if index is None or index.version != version:
+            index = build_index(project_id)
+            index.version = version
+            _indexes[project_id] = index
+    return index
+
+
+def apply_change(project_id, site_id, centroid=None):
+    """
+    Update an already-loaded index in place after a committed site write.
+
+    Applied only when the shared project version is exactly one past the
+    loaded one (this write's own bump); otherwise another process changed the
+    project too and the index is dropped so it rebuilds.
+    """
+    with _lock:
+        index = _indexes.get(project_id)
+        if index is None:
+            return
+        version = get_project_version(project_id)
+        if version == index.version:
+            # Loaded after this write committed; it already has the change.
+            return
+        if version != index.version + 1:
+            del _indexes[project_id]
+            return
+        if centroid is None:
+            index.remove(site_id)
+        else:
+            index.add(site_id, *centroid)
+        index.version = version
+
+
+def clusters(project_ids, bbox, zoom):
+    """Merge the cells of several project indexes into one cluster list."""
+    merged = {}
+    for project_id in project_ids:
+        for key, cell in get_index(project_id).cells(zoom, bbox):
+            total = merged.get(key)
+            if total is None:
+                merged[key] = list(cell)
+            else:
+                total[0] += cell[0]
+                total[1] += cell[1]
+                total[2] += cell[2]
+                total[3] += cell[3]
+                total[4] = None
+
+    results = []
+    for count, area, sum_lon, sum_lat, site_id in merged.values():
+        cluster = {
+            'longitude': sum_lon / count,
+            'latitude': sum_lat / count,
+            'count': count,
+            'area': area,
+        }
+        if count == 1 and site_id is not None:
+            cluster['site_id'] = site_id
+        results.append(cluster)
+    return results
+
+
+def parse_bbox(value):
+    """Parse ``min_lon,min_lat,max_lon,max_lat``; ``None`` means the whole world."""
+    if not value:
+        return (-180.0, -90.0, 180.0, 90.0)
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    return tuple(parts)
@@ -0,0 +1,129 @@
+"""
+Gridded heatmap tiles of site analytics.
+
+For a Web Mercator tile ``z/x/y`` every site whose centroid falls inside the
+tile contributes its metric for the requested date window to one cell of a
+``MAP_HEATMAP_GRID`` x ``MAP_HEATMAP_GRID`` grid, weighted by the site's area.
+Tiles are returned as little-endian float32 arrays (NaN where there is no
+data) and cached per (metric, window, tile, projects). Only the requested
+projects whose bounding box meets the tile are read, and the cache key carries
+their site and analytics versions, so a write elsewhere leaves the tile cached.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Q, Sum
+
+from projects.caching import get_versions, project_version_key
+from projects.models import Project
+from stats.models import SiteAnalytics
+from stats.signals import project_analytics_version_key
+
+# metric name -> (SiteAnalytics field, aggregation)
+# 'mean' cells are area-weighted means; 'density' cells are totals per hectare.
+METRICS = {
+    'ndvi': ('vegetation_index', 'mean'),
+    'tree_cover': ('tree_cover_percentage', 'mean'),
+    'carbon': ('carbon_sequestered', 'density'),
+    'carbon_offset': ('carbon_offset', 'density'),
+    'soil_quality': ('soil_quality_index', 'mean'),
+}
+
+
+def tile_bounds(z, x, y):
+    """Return ``(min_lon, min_lat, max_lon, max_lat)`` of a Web Mercator tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def mercator_arrays(lon, lat):
+    """Vectorized ``projects.geometry.mercator``."""
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    sin_lat = np.sin(np.radians(lat))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def tile_project_ids(project_ids, bounds):
+    """The ``project_ids`` whose sites may fall inside ``bounds``, sorted."""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    overlapping = Q(min_lon__lte=max_lon, max_lon__gte=min_lon, min_lat__lte=max_lat, max_lat__gte=min_lat)
+    # Projects without a bbox yet are kept rather than guessed away.
+    projects = Project.objects.filter(Q(min_lon__isnull=True) | overlapping, pk__in=project_ids)
+    return sorted(projects.values_list('pk', flat=True))
+
+
+def _cache_key(metric, start, end, z, x, y, project_ids):
+    keys = [key for project_id in project_ids
+            for key in (project_version_key(project_id), project_analytics_version_key(project_id))]
+    versions = get_versions(keys)
+    scope = ','.join(f'{key}={versions[key]}' for key in keys)
+    digest = hashlib.md5(scope.encode()).hexdigest()
+    return f'heatmap:{metric}:{start}:{end}:{z}/{x}/{y}:{digest}'
+
+
+def render_tile(metric, z, x, y, project_ids, start=None, end=None):
+    """Compute one heatmap tile as a float32 array of shape (grid, grid)."""
+    field, aggregation = METRICS[metric]
+    grid = settings.MAP_HEATMAP_GRID
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+
+    analytics = SiteAnalytics.objects.filter(
+        site__project_id__in=project_ids,
+        site__centroid__longitude__gte=min_lon,
+        site__centroid__longitude__lt=max_lon,
+        site__centroid__latitude__gt=min_lat,
+        site__centroid__latitude__lte=max_lat,
+    )
+    if start:
+        analytics = analytics.filter(date__gte=start)
+    if end:
+        analytics = analytics.filter(date__lte=end)
+    rows = list(
+        analytics.values('site_id', 'site__centroid__longitude', 'site__centroid__latitude', 'site__centroid__area')
+        .annotate(value=Avg(field) if aggregation == 'mean' else Sum(field))
+        .values_list('site__centroid__longitude', 'site__centroid__latitude', 'site__centroid__area', 'value')
+    )
+
+    tile = np.full(grid * grid, np.nan, dtype=np.float32)
+    if not rows:
+        return tile.reshape(grid, grid)
+
+    data = np.asarray(rows, dtype=np.float64)
+    mx, my = mercator_arrays(data[:, 0], data[:, 1])
+    scale = 2 ** z
+    columns = np.floor((mx * scale - x) * grid).astype(np.int64)
+    lines = np.floor((my * scale - y) * grid).astype(np.int64)
+    cells = np.clip(lines, 0, grid - 1) * grid + np.clip(columns, 0, grid - 1)
+
+    area = np.maximum(data[:, 2], 0.0)
+    values = np.nan_to_num(data[:, 3])
+    if aggregation == 'mean':
+        weighted = np.bincount(cells, weights=values * area, minlength=grid * grid)
+        weights = np.bincount(cells, weights=area, minlength=grid * grid)
+    else:
+        weighted = np.bincount(cells, weights=values, minlength=grid * grid)
+        weights = np.bincount(cells, weights=area / 10000.0, minlength=grid * grid)
+
+    filled = weights > 0
+    tile[filled] = (weighted[filled] / weights[filled]).astype(np.float32)
+    return tile.reshape(grid, grid)
+
+
+def get_tile_bytes(metric, z, x, y, project_ids, start=None, end=None):
+    project_ids = tile_project_ids(project_ids, tile_bounds(z, x, y))
+    key = _cache_key(metric, start, end, z, x, y, project_ids)
+    blob = cache.get(key)
+    if blob is None:
+        blob = render_tile(metric, z, x, y, project_ids, start, end).astype('<f4').tobytes()
+        cache.set(key, blob, settings.MAP_HEATMAP_CACHE_TIMEOUT)
+    return blob
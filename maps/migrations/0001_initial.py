@@ -0,0 +1,105 @@
+# Generated by Django 4.2 on 2026-10-19 12:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copies of projects.geometry helpers as of this migration.
+def _polygons(geometry):
+    if not isinstance(geometry, dict):
+        return []
+    coordinates = geometry.get("coordinates") or []
+    if geometry.get("type") == "Polygon":
+        return [coordinates]
+    if geometry.get("type") == "MultiPolygon":
+        return list(coordinates)
+    return []
+
+
+def _centroid(geometry):
+    total = cx = cy = 0.0
+    count = sx = sy = 0
+    for polygon in _polygons(geometry):
+        if not polygon:
+            continue
+        ring = polygon[0]
+        for i in range(len(ring) - 1):
+            x0, y0 = ring[i][0], ring[i][1]
+            x1, y1 = ring[i + 1][0], ring[i + 1][1]
+            cross = x0 * y1 - x1 * y0
+            total += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+        for point in ring[:-1] or ring:
+            sx += point[0]
+            sy += point[1]
+            count += 1
+    if abs(total) > 1e-18:
+        return cx / (3.0 * total), cy / (3.0 * total)
+    if count:
+        return sx / count, sy / count
+    return None
+
+
+def backfill_centroids(apps, schema_editor):
+    Site = apps.get_model("projects", "Site")
+    SiteCentroid = apps.get_model("maps", "SiteCentroid")
+    rows = []
+    for site in Site.objects.only("id", "project_id", "geometry", "area").iterator(
+        chunk_size=2000
+    ):
+        point = _centroid(site.geometry)
+        if point is not None:
+            rows.append(
+                SiteCentroid(
+                    site_id=site.id,
+                    project_id=site.project_id,
+                    longitude=point[0],
+                    latitude=point[1],
+                    area=site.area or 0.0,
+                )
+            )
+        if len(rows) >= 2000:
+            SiteCentroid.objects.bulk_create(rows)
+            rows = []
+    SiteCentroid.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("projects", "0003_site"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SiteCentroid",
+            fields=[
+                (
+                    "site",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="centroid",
+                        serialize=False,
+                        to="projects.site",
+                    ),
+                ),
+                ("longitude", models.FloatField()),
+                ("latitude", models.FloatField()),
+                ("area", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="site_centroids",
+                        to="projects.project",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_centroids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("maps", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sitecentroid",
+            index=models.Index(
+                fields=["longitude", "latitude"], name="sitecentroid_lon_lat_idx"
+            ),
+        ),
+    ]
@@ -1,3 +1,20 @@
 from django.db import models
+from projects.models import Project, Site
 
-# Create your models here.
+
+class SiteCentroid(models.Model):
+    """Precomputed point representation of a site for clustering and overlays"""
+    site = models.OneToOneField(Site, on_delete=models.CASCADE, primary_key=True, related_name='centroid')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='site_centroids')
+    longitude = models.FloatField()
+    latitude = models.FloatField()
+    area = models.FloatField(default=0.0)  # Area in square meters, copied from Site.area
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['longitude', 'latitude'], name='sitecentroid_lon_lat_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.site_id} ({self.longitude:.5f}, {self.latitude:.5f})"
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from projects.geometry import centroid
+from projects.models import Site
+
+from . import clustering
+from .models import SiteCentroid
+
+
+def update_site_centroid(site):
+    """Store the site's centroid; returns the stored values or ``None``."""
+    point = centroid(site.geometry)
+    if point is None:
+        SiteCentroid.objects.filter(site_id=site.pk).delete()
+        return None
+    SiteCentroid.objects.update_or_create(
+        site_id=site.pk,
+        defaults={
+            'project_id': site.project_id,
+            'longitude': point[0],
+            'latitude': point[1],
+            'area': site.area or 0.0,
+        },
+    )
+    return point[0], point[1], site.area or 0.0
+
+
+@receiver(post_save, sender=Site)
+def site_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    values = update_site_centroid(instance)
+    previous = getattr(instance, '_previous_project_id', None)
+
+    def apply():
+        if previous and previous != instance.project_id:
+            clustering.apply_change(previous, instance.pk)
+        clustering.apply_change(instance.project_id, instance.pk, values)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=Site)
+def site_deleted(sender, instance, **kwargs):
+    site_id = instance.pk
+    transaction.on_commit(lambda: clustering.apply_change(instance.project_id, site_id))
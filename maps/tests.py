@@ -1,3 +1,114 @@
-from django.test import TestCase
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from projects.models import Project, Site
+from stats.models import SiteAnalytics
+
+from . import heatmap
+from .clustering import ClusterIndex
+
+WORLD = (-180.0, -85.0, 180.0, 85.0)
+
+
+class ClusterIndexTests(TestCase):
+    def setUp(self):
+        self.index = ClusterIndex(max_zoom=4, cell_bits=2)
+        self.index.add(1, 10.0, 10.0, 2.0)
+        self.index.add(2, 10.001, 10.001, 3.0)
+        self.index.add(3, -50.0, -20.0, 1.0)
+
+    def test_nearby_sites_share_cells_until_they_split(self):
+        self.assertEqual(sorted(cell[0] for _, cell in self.index.cells(0, WORLD)), [1, 2])
+        self.assertEqual(len(self.index.cells(4, (9, 9, 11, 11))), 1)
+        self.assertEqual(self.index.cells(4, (9, 9, 11, 11))[0][1][:2], [2, 5.0])
+
+    def test_cells_are_a_snapshot(self):
+        cells = self.index.cells(0, WORLD)
+        self.index.remove(3)
+        self.index.add(4, 10.0, 10.0, 1.0)
+        self.assertEqual(sorted(cell[0] for _, cell in cells), [1, 2])
+        self.assertEqual([cell[0] for _, cell in self.index.cells(0, WORLD)], [3])
+
+
+class MapViewTests(TestCase):
+    def test_non_numeric_project_is_rejected(self):
+        params = {'user_email': 'a@x.io', 'project': 'abc'}
+        response = self.client.get('/api/maps/clusters/', {'bbox': '-10,-10,10,10', 'zoom': 2, **params})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/maps/heatmap/carbon/1/0/0/', params).status_code, 400)
+
+
+def square(x, y, size=0.01):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+@override_settings(MAP_HEATMAP_GRID=4)
+class HeatmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.other = Project.objects.create(name='Q', created_by=self.user)
+
+    def add_site(self, x, y, size=0.01, project=None, **metrics):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Site.objects.create(
+                project=project or self.project, name=f'{x},{y}', geometry=square(x, y, size), created_by=self.user
+            )
+            if metrics:
+                SiteAnalytics.objects.create(site=site, date=date(2024, 1, 1), **metrics)
+        return site
+
+    def cell(self, lon, lat, grid=4):
+        mx, my = heatmap.mercator_arrays(np.array([lon]), np.array([lat]))
+        return int(my[0] * grid), int(mx[0] * grid)
+
+    def test_sites_are_binned_by_centroid_and_weighted_by_area(self):
+        small = self.add_site(10, 10, 0.01, vegetation_index=0.2, carbon_sequestered=4)
+        large = self.add_site(10.1, 10.1, 0.02, vegetation_index=0.6, carbon_sequestered=8)
+        self.add_site(-100, -30, vegetation_index=0.9, carbon_sequestered=1)
+        project_ids = [self.project.pk]
+
+        ndvi = heatmap.render_tile('ndvi', 0, 0, 0, project_ids)
+        row, column = self.cell(10, 10)
+        expected = (0.2 * small.area + 0.6 * large.area) / (small.area + large.area)
+        self.assertAlmostEqual(float(ndvi[row, column]), expected, places=5)
+        self.assertAlmostEqual(float(ndvi[self.cell(-100, -30)]), 0.9, places=5)
+        self.assertEqual(int(np.count_nonzero(~np.isnan(ndvi))), 2)
+
+        carbon = heatmap.render_tile('carbon', 0, 0, 0, project_ids)
+        hectares = (small.area + large.area) / 10000
+        self.assertAlmostEqual(float(carbon[row, column]), 12 / hectares, places=3)
+
+        # A zoomed-in tile only holds the sites whose centroid is inside it.
+        self.assertEqual(int(np.count_nonzero(~np.isnan(heatmap.render_tile('ndvi', 1, 1, 0, project_ids)))), 1)
+
+    def test_tiles_are_cached_until_a_covered_project_changes(self):
+        site = self.add_site(10, 10, vegetation_index=0.2)
+        far = self.add_site(-100, -30, project=self.other, vegetation_index=0.5)
+        project_ids = [self.project.pk, self.other.pk]
+        self.assertEqual(heatmap.tile_project_ids(project_ids, heatmap.tile_bounds(1, 1, 0)), [self.project.pk])
+
+        with mock.patch.object(heatmap, 'render_tile', wraps=heatmap.render_tile) as render:
+            first = heatmap.get_tile_bytes('ndvi', 1, 1, 0, project_ids)
+            # Writes to a project outside the tile leave it cached.
+            with self.captureOnCommitCallbacks(execute=True):
+                SiteAnalytics.objects.create(site=far, date=date(2024, 2, 1), vegetation_index=0.1)
+                far.name = 'renamed'
+                far.save()
+            self.assertEqual(heatmap.get_tile_bytes('ndvi', 1, 1, 0, project_ids), first)
+            self.assertEqual(render.call_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                SiteAnalytics.objects.create(site=site, date=date(2024, 2, 1), vegetation_index=0.4)
+            self.assertNotEqual(heatmap.get_tile_bytes('ndvi', 1, 1, 0, project_ids), first)
+            self.assertEqual(render.call_count, 2)
+
+            self.add_site(10.5, 10.5, vegetation_index=0.3)
+            heatmap.get_tile_bytes('ndvi', 1, 1, 0, project_ids)
+            self.assertEqual(render.call_count, 3)
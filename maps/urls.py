@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('clusters/', views.site_clusters, name='site_clusters'),
+    path('heatmap/<str:metric>/<int:z>/<int:x>/<int:y>/', views.heatmap_tile, name='heatmap_tile'),
+]
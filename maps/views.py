@@ -1,3 +1,82 @@
-from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework import status
+from django.conf import settings
+from projects.models import Project
 
-# Create your views here.
+from django.http import HttpResponse
+from django.utils.dateparse import parse_date
+from .clustering import clusters, parse_bbox
+from .heatmap import METRICS, get_tile_bytes
+
+
+def requested_project_ids(request):
+    """
+    Project ids a map request covers, scoped to ``user_email`` like the site list.
+
+    Raises ``ValueError`` for a non-numeric ``project``.
+    """
+    user_email = request.query_params.get('user_email')
+    if not user_email:
+        return []
+    projects = Project.objects.filter(created_by__email=user_email)
+    project_id = request.query_params.get('project')
+    if project_id:
+        try:
+            projects = projects.filter(pk=int(project_id))
+        except ValueError:
+            raise ValueError('project must be an integer')
+    return list(projects.values_list('id', flat=True))
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def site_clusters(request):
+    """Cluster counts and summed area of site centroids for a bbox and zoom level"""
+    try:
+        bbox = parse_bbox(request.query_params.get('bbox'))
+        zoom = int(request.query_params.get('zoom', 0))
+        project_ids = requested_project_ids(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = clusters(project_ids, bbox, zoom)
+    return Response({
+        'zoom': zoom,
+        'bbox': bbox,
+        'total_count': sum(cluster['count'] for cluster in results),
+        'clusters': results,
+    })
+
+
+def parse_window_date(value):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    return parsed
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def heatmap_tile(request, metric, z, x, y):
+    """Area-weighted metric grid for one map tile, as raw little-endian float32"""
+    if metric not in METRICS:
+        return Response({'error': f'Unknown metric; choose from {sorted(METRICS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    if z > 24 or x >= 2 ** z or y >= 2 ** z:
+        return Response({'error': 'Invalid tile coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        start = parse_window_date(request.query_params.get('start'))
+        end = parse_window_date(request.query_params.get('end'))
+        project_ids = requested_project_ids(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    blob = get_tile_bytes(metric, z, x, y, project_ids, start, end)
+
+    response = HttpResponse(blob, content_type='application/octet-stream')
+    response['X-Heatmap-Grid'] = settings.MAP_HEATMAP_GRID
+    response['X-Heatmap-Dtype'] = 'float32-le'
+    return response
@@ -1,42 +1,161 @@
+import json
+
 from django.contrib import admin
+from django.db.models import Count, Q
+from django.utils.html import format_html
+from django.utils.http import urlencode
+
+from daruka.paginators import EstimatedCountPaginator
+from .geometry import bounding_box, polygons
 from .models import Project, Site
+from .search import matches
+
+# Characters of geometry JSON shown in the admin preview.
+GEOMETRY_PREVIEW_CHARS = 500
+# Query parameter that puts the full geometry into the site change form.
+EDIT_GEOMETRY_PARAM = 'edit_geometry'
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    Sidebar filter with a text box instead of a list of choices.
+
+    Listing every project or user as filter links loads the whole table on
+    each changelist view; typing an id or email does not.
+    """
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        # A single placeholder so the filter is rendered.
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (key, value) for key, value in changelist.get_filters_params().items()
+            if key != self.parameter_name
+        ]
+        yield all_choice
+
+    def clean(self, value):
+        return value.strip()
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            value = self.clean(value)
+            if value is not None:
+                return queryset.filter(**{self.lookup: value})
+        return queryset
+
+
+class IdInputFilter(InputFilter):
+    def clean(self, value):
+        value = value.strip()
+        return int(value) if value.isdigit() else None
+
+
+class ProjectIdFilter(IdInputFilter):
+    title = 'project id'
+    parameter_name = 'project_id'
+    lookup = 'project_id'
+
+
+class OwnerEmailFilter(InputFilter):
+    title = 'owner email'
+    parameter_name = 'owner'
+    lookup = 'created_by__email__iexact'
+
+
+def geometry_summary(geometry):
+    """Type, vertex count and bbox of a GeoJSON geometry, for list and form displays"""
+    parts = polygons(geometry)
+    vertices = sum(len(ring) for polygon in parts for ring in polygon)
+    bbox = bounding_box(geometry)
+    kind = geometry.get('type') if isinstance(geometry, dict) else None
+    summary = f"{kind or 'Empty'}: {len(parts)} polygon(s), {vertices} vertices"
+    if bbox:
+        summary += ' — bbox ({:.5f}, {:.5f}, {:.5f}, {:.5f})'.format(*bbox)
+    return summary
+
+
+def geometry_preview(geometry):
+    text = json.dumps(geometry, separators=(',', ':'))
+    if len(text) > GEOMETRY_PREVIEW_CHARS:
+        text = f'{text[:GEOMETRY_PREVIEW_CHARS]}… ({len(text):,} characters)'
+    return format_html('{}<br><code style="word-break: break-all">{}</code>', geometry_summary(geometry), text)
+
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'created_by', 'site_count', 'created_at')
-    list_filter = ('created_at', 'created_by')
+    list_filter = ('created_at', OwnerEmailFilter)
+    list_select_related = ('created_by',)
     search_fields = ('name', 'description', 'created_by__email')
-    readonly_fields = ('created_at', 'updated_at')
+    autocomplete_fields = ('created_by',)
+    readonly_fields = ('created_at', 'updated_at', 'total_area', 'footprint_preview')
     ordering = ('-created_at',)
+    show_full_result_count = False
     
     fieldsets = (
         ('Project Information', {
             'fields': ('name', 'description', 'created_by')
         }),
+        ('Spatial Summary', {
+            'fields': ('total_area', 'footprint_preview'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
     
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('footprint').annotate(site_count=Count('sites'))
+        return queryset
+    
+    def get_search_results(self, request, queryset, search_term):
+        # The text index instead of icontains scans over name and description.
+        if not search_term.strip():
+            return queryset, False
+        condition = matches('project', search_term, queryset.db) | Q(created_by__email__istartswith=search_term.strip())
+        return queryset.filter(condition), False
+    
     def site_count(self, obj):
-        return obj.sites.count()
+        return obj.site_count
     site_count.short_description = 'Number of Sites'
+    site_count.admin_order_field = 'site_count'
+    
+    def footprint_preview(self, obj):
+        return geometry_preview(obj.footprint) if obj.footprint else '-'
+    footprint_preview.short_description = 'Footprint'
 
 @admin.register(Site)
 class SiteAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'project', 'created_by', 'area_display', 'created_at')
-    list_filter = ('created_at', 'project', 'created_by')
+    list_filter = ('created_at', ProjectIdFilter, OwnerEmailFilter)
+    list_select_related = ('project', 'created_by')
     search_fields = ('name', 'description', 'project__name', 'created_by__email')
-    readonly_fields = ('area', 'created_at', 'updated_at')
+    autocomplete_fields = ('project', 'created_by')
+    readonly_fields = ('area', 'geometry_preview', 'raw_geometry', 'created_at', 'updated_at')
     ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Site Information', {
             'fields': ('project', 'name', 'description', 'created_by')
         }),
         ('Geographic Data', {
-            'fields': ('geometry', 'area'),
+            'fields': ('geometry_preview', 'area'),
+        }),
+        ('Raw Geometry', {
+            'fields': ('raw_geometry',),
+            'classes': ('collapse',)
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -44,6 +163,49 @@ class SiteAdmin(admin.ModelAdmin):
         }),
     )
     
+    def _editing_geometry(self, request, obj):
+        return obj is None or EDIT_GEOMETRY_PARAM in request.GET
+
+    def get_fieldsets(self, request, obj=None):
+        # The raw JSON of a large site is megabytes of textarea; it is only
+        # rendered (and submitted back) when asked for, and for new sites.
+        fieldsets = super().get_fieldsets(request, obj)
+        if not self._editing_geometry(request, obj):
+            return fieldsets
+        return [
+            (name, {**options, 'fields': ('geometry',), 'classes': ()}) if name == 'Raw Geometry' else (name, options)
+            for name, options in fieldsets
+        ]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            # The changelist never shows geometry; don't fetch megabytes of it.
+            queryset = queryset.defer('geometry', 'project__footprint')
+        return queryset
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        projects = Project.objects.using(queryset.db).filter(matches('project', search_term, queryset.db))
+        condition = (
+            matches('site', search_term, queryset.db)
+            | Q(project__in=projects.values('pk'))
+            | Q(created_by__email__istartswith=search_term.strip())
+        )
+        return queryset.filter(condition), False
+    
     def area_display(self, obj):
         return f"{(obj.area / 1000000):.2f} km²"
     area_display.short_description = 'Area'
+    area_display.admin_order_field = 'area'
+    
+    def geometry_preview(self, obj):
+        return geometry_preview(obj.geometry) if obj.geometry else '-'
+    geometry_preview.short_description = 'Geometry'
+
+    def raw_geometry(self, obj):
+        summary = geometry_summary(obj.geometry) if obj.geometry else '-'
+        return format_html('{}<br><a href="?{}">Load the full geometry for editing</a>',
+                           summary, urlencode({EDIT_GEOMETRY_PARAM: 1}))
+    raw_geometry.short_description = 'Geometry JSON'
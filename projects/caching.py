@@ -0,0 +1,172 @@
+"""
+Per-project caches of derived site data.
+
+Every project has a version number in the cache that is bumped (after commit)
+whenever one of its sites or the project itself changes. Cached payloads are
+keyed by that version, so invalidation is a single ``incr`` and a request that
+raced a write can never store stale data under the new version.
+"""
+
+import gzip
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.renderers import JSONRenderer
+
+from daruka.singleflight import SingleFlight
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+ENCODINGS = ('br', 'gzip', 'identity')
+SITES_FLIGHT = SingleFlight('site.list')
+
+
+def project_version_key(project_id):
+    return f'project:{project_id}:version'
+
+
+SITES_VERSION_KEY = 'sites:version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from a fresh value rather than 1 so a version key that was
+        # evicted can never resurrect payloads cached under an older version.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """``get_version`` for many keys with one round trip when they all exist."""
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(key)
+    return versions
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_project_version(project_id):
+    return get_version(project_version_key(project_id))
+
+
+def bump_project_version(project_id):
+    bump_version(project_version_key(project_id))
+
+
+def get_sites_version():
+    """Version covering every site in every project, for process-wide indexes."""
+    return get_version(SITES_VERSION_KEY)
+
+
+def bump_sites_version():
+    bump_version(SITES_VERSION_KEY)
+
+
+def project_cache_key(project_id, name, version=None):
+    if version is None:
+        version = get_project_version(project_id)
+    return f'project:{project_id}:v{version}:{name}'
+
+
+def choose_encoding(accept_encoding):
+    """Pick the best precompressed encoding the client accepts."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    for encoding in ENCODINGS[:-1]:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(raw):
+    """Return ``{encoding: bytes}`` for every encoding we can serve."""
+    blobs = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9)}
+    if brotli is not None:
+        blobs['br'] = brotli.compress(raw, quality=11)
+    return blobs
+
+
+def _project_sites(project_id):
+    from .models import Site
+
+    # Always build from the primary so a lagging replica can never be frozen
+    # into the cache under a fresh version.
+    return (
+        Site.objects.using(DEFAULT_DB_ALIAS)
+        .filter(project_id=project_id)
+        .select_related('project', 'created_by')
+        .order_by('-created_at')
+    )
+
+
+def build_feature_collection(project_id):
+    from .serializers import SiteGeoJSONSerializer
+
+    return {
+        'type': 'FeatureCollection',
+        'features': SiteGeoJSONSerializer(_project_sites(project_id), many=True).data,
+    }
+
+
+def build_topojson(project_id):
+    from .serializers import site_topojson
+
+    return site_topojson(_project_sites(project_id))
+
+
+BUILDERS = {
+    'geojson': build_feature_collection,
+    'topojson': build_topojson,
+}
+
+
+def _build_blobs(project_id, kind, version):
+    raw = JSONRenderer().render(BUILDERS[kind](project_id))
+    blobs = compress(raw)
+    cache.set_many(
+        {project_cache_key(project_id, f'{kind}:{enc}', version): data for enc, data in blobs.items()},
+        settings.SITE_GEOJSON_CACHE_TIMEOUT,
+    )
+    return blobs
+
+
+def get_project_blob(project_id, kind, encoding):
+    """Return ``(version, bytes)`` of a cached per-project payload ('geojson' or 'topojson')."""
+    version = get_project_version(project_id)
+    key = project_cache_key(project_id, f'{kind}:{encoding}', version)
+    blob = cache.get(key)
+    if blob is None:
+        # A burst of misses for a new version builds the payload once.
+        blobs = SITES_FLIGHT.do(f'{project_id}:{kind}:v{version}', lambda: _build_blobs(project_id, kind, version))
+        blob = blobs[encoding]
+    return version, blob
@@ -0,0 +1,96 @@
+"""
+Bulk deletion of a project and everything hanging off it.
+
+``Model.delete()`` runs Django's collector, which loads every cascaded row
+(all sites, all of their analytics) into memory to send signals for them. A
+large project is instead removed bottom-up in primary-key chunks: for each
+chunk of rows, the rows that reference them through a ``CASCADE`` foreign key
+are removed first (recursively), then the chunk itself with a raw
+``DELETE ... WHERE id IN (...)``. Only ids are ever held in memory, so the
+cost is constant per chunk however large the project is.
+
+Row-level signals are skipped for the cascaded rows; the caches and indexes
+they would have updated are invalidated once per project instead, and the
+project row is finally deleted normally so its own signals (tombstone,
+change events) still fire.
+"""
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.deletion import get_candidate_relations_to_delete
+
+from .caching import bump_project_version, bump_sites_version, bump_version
+
+
+def _dependents(model):
+    """Reverse foreign keys pointing at ``model``, including ``related_name='+'`` ones."""
+    return list(get_candidate_relations_to_delete(model._meta))
+
+
+def _delete_chunk(model, pks, chunk_size):
+    for relation in _dependents(model):
+        on_delete = relation.on_delete
+        related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+        if on_delete is models.CASCADE:
+            delete_in_chunks(related, chunk_size)
+        elif on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+        elif on_delete is models.PROTECT:
+            if related.exists():
+                raise models.ProtectedError(
+                    f'{relation.related_model.__name__} rows protect {model.__name__} rows', set()
+                )
+    model._base_manager.filter(pk__in=pks)._raw_delete(model._base_manager.db)
+
+
+def delete_in_chunks(queryset, chunk_size=None, on_chunk=None):
+    """Delete every row of ``queryset`` and its cascades, ``chunk_size`` rows per transaction."""
+    chunk_size = chunk_size or settings.PROJECT_DELETE_CHUNK_SIZE
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            _delete_chunk(model, pks, chunk_size)
+        deleted += len(pks)
+        if on_chunk is not None:
+            on_chunk(deleted)
+
+
+def delete_project(project_id, chunk_size=None, on_progress=None):
+    """
+    Remove a project with its sites, analytics and derived rows.
+
+    Returns the number of sites removed. Safe to re-run after an
+    interruption: whatever is left is picked up again.
+    """
+    from stats.signals import ANALYTICS_VERSION_KEY
+    from .models import Project, Site
+
+    project = Project.objects.filter(pk=project_id).first()
+    if project is None:
+        return 0
+
+    sites = Site.objects.filter(project_id=project_id)
+    total = sites.count()
+
+    def progress(done):
+        if on_progress is not None:
+            on_progress(done, total)
+
+    removed = delete_in_chunks(sites, chunk_size, progress)
+
+    with transaction.atomic():
+        # Whatever else references the project directly (e.g. overlaps).
+        for relation in _dependents(Project):
+            if relation.on_delete is models.CASCADE:
+                delete_in_chunks(
+                    relation.related_model._base_manager.filter(**{relation.field.name: project_id}), chunk_size
+                )
+        project.delete()
+        transaction.on_commit(bump_sites_version)
+        transaction.on_commit(lambda: bump_project_version(project_id))
+        transaction.on_commit(lambda: bump_version(ANALYTICS_VERSION_KEY))
+    return removed
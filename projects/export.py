@@ -0,0 +1,151 @@
+"""
+Streaming ZIP export of a project.
+
+The archive is written by ``zipfile`` into a write-only buffer that is drained
+after every few rows, so bytes go out to the client while later rows are still
+being read. ``zipfile`` notices that the buffer cannot seek and writes sizes
+and CRCs in data descriptors after each member instead of patching headers,
+which is what makes a single forward pass possible. Rows come from
+``iterator()`` (server-side cursors on Postgres), so memory stays constant
+however large the project is.
+"""
+
+import csv
+import io
+import json
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+ANALYTICS_COLUMNS = [
+    'site_id', 'date', 'carbon_sequestered', 'carbon_offset', 'species_count', 'vegetation_index',
+    'tree_cover_percentage', 'soil_quality_index', 'water_retention', 'updated_at',
+]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable sink that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pending = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pending += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._pending = 0
+        return data
+
+
+def _site_features(sites):
+    for site_id, name, description, area, created_at, owner, geometry in sites:
+        yield {
+            'type': 'Feature',
+            'id': site_id,
+            'geometry': geometry,
+            'properties': {
+                'id': site_id,
+                'name': name,
+                'description': description,
+                'area': area,
+                'created_by': owner,
+                'created_at': created_at,
+            },
+        }
+
+
+def project_archive(project, using=None):
+    """Yield the bytes of a ZIP archive with the project's metadata, sites and analytics."""
+    from stats.models import SiteAnalytics
+    from .models import Site
+
+    flush_at = settings.PROJECT_EXPORT_FLUSH_BYTES
+    chunk_size = settings.PROJECT_EXPORT_CHUNK_SIZE
+    buffer = _StreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('project.json', json.dumps({
+            'id': project.id,
+            'name': project.name,
+            'description': project.description,
+            'created_by': project.created_by.email,
+            'created_at': project.created_at,
+            'updated_at': project.updated_at,
+            'total_area': project.total_area,
+            'bbox': [project.min_lon, project.min_lat, project.max_lon, project.max_lat],
+            'footprint': project.footprint,
+        }, cls=DjangoJSONEncoder, indent=2))
+        yield buffer.drain()
+
+        # One GeoJSON Feature per line (GeoJSON text sequence).
+        sites = (
+            Site.objects.using(using).filter(project_id=project.id).order_by('pk')
+            .values_list('id', 'name', 'description', 'area', 'created_at', 'created_by__email', 'geometry')
+        )
+        with archive.open('sites.ndjson', 'w', force_zip64=True) as member:
+            for feature in _site_features(sites.iterator(chunk_size=chunk_size)):
+                member.write(json.dumps(feature, cls=DjangoJSONEncoder, separators=(',', ':')).encode() + b'\n')
+                if buffer.pending >= flush_at:
+                    yield buffer.drain()
+        yield buffer.drain()
+
+        analytics = (
+            SiteAnalytics.objects.using(using).filter(site__project_id=project.id)
+            .order_by('site_id', 'date').values_list(*ANALYTICS_COLUMNS)
+        )
+        with archive.open('analytics.csv', 'w', force_zip64=True) as member:
+            text = io.TextIOWrapper(member, encoding='utf-8', newline='', write_through=True)
+            writer = csv.writer(text)
+            writer.writerow(ANALYTICS_COLUMNS)
+            for row in analytics.iterator(chunk_size=chunk_size):
+                writer.writerow(row)
+                if buffer.pending >= flush_at:
+                    yield buffer.drain()
+            text.detach()
+        yield buffer.drain()
+
+    # Central directory, written when the archive closes.
+    yield buffer.drain()
+
+
+async def _async_chunks(chunks):
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def streaming_content(request, chunks):
+    """
+    ``chunks`` in the form the server streams without buffering.
+
+    Under ASGI Django collects a synchronous iterator into memory before
+    sending it, so there each chunk is pulled in a worker thread instead.
+    """
+    from django.core.handlers.asgi import ASGIRequest
+
+    if isinstance(request, ASGIRequest):
+        return _async_chunks(chunks)
+    return chunks
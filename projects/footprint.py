@@ -0,0 +1,432 @@
+"""
+Project-level spatial summaries: dissolved footprint, bbox, centroid and area.
+
+The footprint is the polygon union of the project's sites. Site edges are
+split wherever they meet another edge, the pieces that have another site on
+their outer side are dropped, and what is left is stitched back into the outer
+rings (and holes) of the project. Overlapping and contained sites merge, as do
+neighbours that only share part of an edge. All of this happens on the
+integer grid of ``SITE_GEOMETRY_PRECISION``, so untouched vertices come out
+exactly as stored. The rings are then simplified with Douglas-Peucker so
+project cards stay light.
+"""
+
+import math
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from daruka.oncommit import CommitBatch
+
+from .caching import bump_project_version
+from .geometry import GeometryError, bounding_box, centroid, normalize_geometry, polygons, ring_signed_area
+from .overlaps import _edges, _inside, _oriented_rings, _split_params
+
+# Distance (in grid units) from an edge at which its outer side is probed.
+RIGHT_OFFSET = 1e-3
+
+
+def _point_segment_distance_sq(p, a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return (p[0] - a[0]) ** 2 + (p[1] - a[1]) ** 2
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_sq))
+    px, py = a[0] + t * dx, a[1] + t * dy
+    return (p[0] - px) ** 2 + (p[1] - py) ** 2
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification of a polyline (iterative, keeps endpoints)."""
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    tolerance_sq = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_index = 0.0, None
+        for i in range(first + 1, last):
+            distance = _point_segment_distance_sq(points[i], points[first], points[last])
+            if distance > worst:
+                worst, worst_index = distance, i
+        if worst_index is not None and worst > tolerance_sq:
+            keep[worst_index] = True
+            stack.append((first, worst_index))
+            stack.append((worst_index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _stitch(segments):
+    """
+    Join directed segments (point pairs) into closed rings.
+
+    Where several segments leave the same point (sites touching at a corner)
+    the walk takes the sharpest left turn, which keeps each ring simple.
+    """
+    by_start = {}
+    for segment in segments:
+        by_start.setdefault(segment[0], []).append(segment)
+
+    def turn(incoming, segment):
+        (ax, ay), (bx, by) = incoming
+        cx, cy = segment[1]
+        ux, uy, vx, vy = bx - ax, by - ay, cx - bx, cy - by
+        return math.atan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    rings = []
+    while by_start:
+        start = next(iter(by_start))
+        segment = by_start[start].pop()
+        if not by_start[start]:
+            del by_start[start]
+        ring = [segment[0], segment[1]]
+        while ring[-1] != start:
+            outgoing = by_start.get(ring[-1])
+            if not outgoing:
+                break
+            segment = max(outgoing, key=lambda candidate: turn((ring[-2], ring[-1]), candidate))
+            outgoing.remove(segment)
+            if not outgoing:
+                del by_start[ring[-1]]
+            ring.append(segment[1])
+        if len(ring) >= 4 and ring[0] == ring[-1]:
+            rings.append(ring)
+    return rings
+
+
+def _contains(ring, point):
+    x, y = point
+    inside = False
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _candidate_pairs(edges):
+    """Index pairs of edges whose bounding boxes intersect (sweep over min x)."""
+    order = sorted(range(len(edges)), key=lambda i: edges[i][4])
+    active = []
+    for i in order:
+        _, _, _, _, bx0, by0, bx1, by1 = edges[i]
+        active = [j for j in active if edges[j][6] >= bx0]
+        for j in active:
+            if edges[j][5] <= by1 and edges[j][7] >= by0:
+                yield i, j
+        active.append(i)
+
+
+class _ShapeGrid:
+    """Uniform grid over shape bounding boxes for point-in-shape lookups."""
+
+    def __init__(self, shapes):
+        self.shapes = shapes
+        sizes = sorted(max(box[2] - box[0], box[3] - box[1]) for box, _ in shapes)
+        self.cell = max(sizes[len(sizes) // 2], 1.0)
+        self.cells = {}
+        for index, (box, _) in enumerate(shapes):
+            for key in self._keys(box):
+                self.cells.setdefault(key, []).append(index)
+
+    def _keys(self, box):
+        x0, y0 = int(box[0] // self.cell), int(box[1] // self.cell)
+        x1, y1 = int(box[2] // self.cell), int(box[3] // self.cell)
+        return ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    def covered(self, x, y):
+        """True if the point is strictly inside any shape."""
+        for index in self.cells.get((int(x // self.cell), int(y // self.cell)), ()):
+            box, edges = self.shapes[index]
+            if box[0] <= x <= box[2] and box[1] <= y <= box[3] and _inside(x, y, edges):
+                return True
+        return False
+
+
+def _union_boundary(geometries, origin):
+    """
+    Directed boundary segments of the union of ``geometries``, interior on the left.
+
+    Every edge is split where it meets another edge (crossings, T-junctions
+    and collinear overlaps), and a piece is kept when the point just to its
+    right lies outside every shape. Boundaries shared by adjacent sites are
+    inside the neighbour on that side and drop out; pieces running the same
+    way along a shared boundary are kept once.
+    """
+    shapes = []
+    edges = []
+    for geometry in geometries:
+        shape_edges = _edges(_oriented_rings(geometry, origin))
+        if not shape_edges:
+            continue
+        box = (
+            min(edge[4] for edge in shape_edges), min(edge[5] for edge in shape_edges),
+            max(edge[6] for edge in shape_edges), max(edge[7] for edge in shape_edges),
+        )
+        shapes.append((box, shape_edges))
+        edges.extend(shape_edges)
+    if not shapes:
+        return []
+
+    neighbours = [[] for _ in edges]
+    for i, j in _candidate_pairs(edges):
+        neighbours[i].append(edges[j])
+        neighbours[j].append(edges[i])
+
+    grid = _ShapeGrid(shapes)
+    segments = set()
+    for edge, others in zip(edges, neighbours):
+        x0, y0, x1, y1 = edge[:4]
+        rx, ry = x1 - x0, y1 - y0
+        length = math.hypot(rx, ry)
+        params = _split_params(edge, others) if others else [0.0, 1.0]
+        for t0, t1 in zip(params, params[1:]):
+            # Snapped back onto the input grid so pieces of different edges meet exactly.
+            a = (round(x0 + t0 * rx), round(y0 + t0 * ry))
+            b = (round(x0 + t1 * rx), round(y0 + t1 * ry))
+            if a == b:
+                continue
+            mx, my = x0 + (t0 + t1) / 2 * rx, y0 + (t0 + t1) / 2 * ry
+            offset = RIGHT_OFFSET / length
+            if not grid.covered(mx + ry * offset, my - rx * offset):
+                segments.add((a, b))
+    return list(segments)
+
+
+def dissolve(geometries, tolerance=None):
+    """Union of the site polygons as a simplified GeoJSON geometry (or ``None``)."""
+    if tolerance is None:
+        tolerance = settings.PROJECT_FOOTPRINT_TOLERANCE
+    precision = settings.SITE_GEOMETRY_PRECISION
+    scale = 10 ** precision
+
+    shapes = []
+    for geometry in geometries:
+        try:
+            geometry = normalize_geometry(geometry, precision)
+        except GeometryError:
+            continue
+        # Work in integer grid units so split points can be snapped exactly.
+        shapes.append({
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [[[round(x * scale), round(y * scale)] for x, y in ring] for ring in polygon]
+                for polygon in polygons(geometry)
+            ],
+        })
+    if not shapes:
+        return None
+    first = shapes[0]['coordinates'][0][0][0]
+    origin = (first[0], first[1])
+
+    exteriors = []
+    holes = []
+    for ring in _stitch(_union_boundary(shapes, origin)):
+        ring = simplify(ring, tolerance * scale)
+        if len(ring) < 4:
+            continue
+        (exteriors if ring_signed_area(ring) > 0 else holes).append(ring)
+
+    exteriors.sort(key=ring_signed_area)
+    polygon_list = [[exterior] for exterior in exteriors]
+    for hole in holes:
+        # A point just inside the union next to the hole picks its polygon.
+        (x0, y0), (x1, y1) = hole[0], hole[1]
+        length = math.hypot(x1 - x0, y1 - y0)
+        point = ((x0 + x1) / 2 - (y1 - y0) * RIGHT_OFFSET / length, (y0 + y1) / 2 + (x1 - x0) * RIGHT_OFFSET / length)
+        for polygon in polygon_list:
+            if _contains(polygon[0], point):
+                polygon.append(hole)
+                break
+
+    def degrees(ring):
+        return [[(x + origin[0]) / scale, (y + origin[1]) / scale] for x, y in ring]
+
+    coordinates = [[degrees(ring) for ring in polygon] for polygon in polygon_list]
+    if not coordinates:
+        return None
+    if len(coordinates) == 1:
+        footprint = {'type': 'Polygon', 'coordinates': coordinates[0]}
+    else:
+        footprint = {'type': 'MultiPolygon', 'coordinates': coordinates}
+    try:
+        # Drops the collinear vertices left where pieces were joined.
+        return normalize_geometry(footprint, precision)
+    except GeometryError:
+        return footprint
+
+
+def _weight(area):
+    return area if area and area > 0 else 1e-12
+
+
+def summarize_sites(rows):
+    """
+    Spatial summary of a project from ``(geometry, area)`` rows.
+
+    Returns the Project field values: dissolved footprint, bbox, area-weighted
+    centroid and total area.
+    """
+    geometries = []
+    total_area = 0.0
+    weighted_lon = weighted_lat = weight = 0.0
+    bbox = None
+    for geometry, area in rows:
+        geometries.append(geometry)
+        total_area += area or 0.0
+        box = bounding_box(geometry)
+        if box is None:
+            continue
+        bbox = box if bbox is None else (
+            min(bbox[0], box[0]), min(bbox[1], box[1]), max(bbox[2], box[2]), max(bbox[3], box[3])
+        )
+        point = centroid(geometry)
+        if point is not None:
+            w = _weight(area)
+            weighted_lon += point[0] * w
+            weighted_lat += point[1] * w
+            weight += w
+
+    min_lon, min_lat, max_lon, max_lat = bbox or (None, None, None, None)
+    return {
+        'footprint': dissolve(geometries) if geometries else None,
+        'min_lon': min_lon,
+        'min_lat': min_lat,
+        'max_lon': max_lon,
+        'max_lat': max_lat,
+        'centroid_lon': weighted_lon / weight if weight else None,
+        'centroid_lat': weighted_lat / weight if weight else None,
+        'total_area': total_area,
+    }
+
+
+def refresh_project_footprint(project_id):
+    """
+    Recompute and store a project's spatial summary from all of its sites.
+
+    ``updated_at`` moves with it so the change feed reports the new footprint
+    and total area.
+    """
+    from .models import Project, Site
+
+    rows = Site.objects.filter(project_id=project_id).values_list('geometry', 'area')
+    summary = summarize_sites(rows.iterator(chunk_size=2000))
+    Project.objects.filter(pk=project_id).update(updated_at=timezone.now(), **summary)
+    transaction.on_commit(partial(bump_project_version, project_id))
+
+
+def _apply_site_changes(changes):
+    """
+    Fold committed site changes into their projects' summaries.
+
+    Total area and bbox come from one aggregate over the site columns. The
+    centroid moves by the weight of the sites that joined or left, and the
+    footprint grows by the union with new geometry. A footprint cannot shrink
+    that way, so reshapes and removals also queue a full refresh, delayed by
+    ``PROJECT_FOOTPRINT_REFRESH_DELAY`` so a burst of writes shares one job.
+    """
+    from jobs.queue import enqueue
+    from .models import Project, Site
+
+    joined, left, rebuild = {}, {}, set()
+    for kind, project_id, *change in changes:
+        if kind == 'add':
+            joined.setdefault(project_id, []).append(change)
+        elif kind == 'remove':
+            left.setdefault(project_id, []).append(change)
+        else:
+            rebuild.add(project_id)
+    site_ids = [site_id for changes in joined.values() for site_id, _ in changes]
+    sites = {
+        site_id: (geometry, area)
+        for site_id, geometry, area in Site.objects.filter(pk__in=site_ids).values_list('id', 'geometry', 'area')
+    }
+
+    for project_id in sorted(joined.keys() | left.keys() | rebuild):
+        with transaction.atomic():
+            project = (
+                Project.objects.select_for_update().filter(pk=project_id)
+                .values('footprint', 'centroid_lon', 'centroid_lat', 'total_area').first()
+            )
+            if project is None:
+                continue
+            summary = Site.objects.filter(project_id=project_id).aggregate(
+                count=Count('id'), total_area=Sum('area'),
+                min_lon=Min('min_lon'), min_lat=Min('min_lat'), max_lon=Max('max_lon'), max_lat=Max('max_lat'),
+            )
+            count = summary.pop('count')
+            summary['total_area'] = summary['total_area'] or 0.0
+
+            # The stored centroid stands for the weight of the previous total area.
+            weight = (project['total_area'] or 0.0) if project['centroid_lon'] is not None else 0.0
+            weighted_lon = (project['centroid_lon'] or 0.0) * weight
+            weighted_lat = (project['centroid_lat'] or 0.0) * weight
+            geometries = []
+            for site_id, new_to_project in joined.get(project_id, []):
+                if site_id not in sites:
+                    continue  # Deleted again before this ran
+                geometry, area = sites[site_id]
+                geometries.append(geometry)
+                point = centroid(geometry) if new_to_project else None
+                if point is not None:
+                    weighted_lon += point[0] * _weight(area)
+                    weighted_lat += point[1] * _weight(area)
+                    weight += _weight(area)
+            for _, area, lon, lat in left.get(project_id, []):
+                weighted_lon -= lon * _weight(area)
+                weighted_lat -= lat * _weight(area)
+                weight -= _weight(area)
+            if count and weight > 0:
+                summary['centroid_lon'] = weighted_lon / weight
+                summary['centroid_lat'] = weighted_lat / weight
+            else:
+                summary['centroid_lon'] = summary['centroid_lat'] = None
+
+            if not count:
+                summary['footprint'] = None
+            elif project['footprint'] is None and count > len(geometries):
+                rebuild.add(project_id)  # Never summarized, so there is nothing to grow
+            elif geometries:
+                footprint = project['footprint']
+                summary['footprint'] = dissolve([footprint, *geometries] if footprint else geometries)
+            Project.objects.filter(pk=project_id).update(updated_at=timezone.now(), **summary)
+            transaction.on_commit(partial(bump_project_version, project_id))
+
+        if count and project_id in rebuild:
+            enqueue(
+                'projects.refresh_footprint', project_id, key=f'footprint:{project_id}',
+                delay=timedelta(seconds=settings.PROJECT_FOOTPRINT_REFRESH_DELAY),
+            )
+
+
+_site_changes = CommitBatch(_apply_site_changes)
+
+
+def site_added(project_id, site_id, new_to_project=True):
+    """
+    Grow the project's summary by a site after the current transaction commits.
+
+    ``new_to_project`` is False for a site reshaped in place: its old shape is
+    gone, so a full refresh follows as well.
+    """
+    _site_changes.add(('add', project_id, site_id, new_to_project))
+    if not new_to_project:
+        schedule_footprint_refresh(project_id)
+
+
+def site_removed(project_id, site_id, geometry, area):
+    """Take a site that left the project out of its summary after the current transaction commits."""
+    point = centroid(geometry)
+    if point is not None:
+        _site_changes.add(('remove', project_id, site_id, area, point[0], point[1]))
+    schedule_footprint_refresh(project_id)
+
+
+def schedule_footprint_refresh(project_id):
+    """Queue one delayed full refresh of the project after the current transaction commits."""
+    _site_changes.add(('rebuild', project_id))
@@ -0,0 +1,227 @@
+"""
+Plain-Python helpers for the GeoJSON polygons stored in ``Site.geometry``.
+
+Coordinates are ``[lon, lat]`` degrees. Areas use the same rough planar
+conversion as ``Site.calculate_area`` so every derived figure agrees with the
+stored ``Site.area``.
+"""
+
+import hashlib
+import json
+import math
+
+from django.conf import settings
+
+# 1 degree ≈ 111,320 meters at the equator
+METERS_PER_DEGREE = 111320
+
+
+def polygons(geometry):
+    """Return the geometry as a list of polygons (each a list of rings)."""
+    if not isinstance(geometry, dict):
+        return []
+    coordinates = geometry.get('coordinates') or []
+    if geometry.get('type') == 'Polygon':
+        return [coordinates]
+    if geometry.get('type') == 'MultiPolygon':
+        return list(coordinates)
+    return []
+
+
+def ring_signed_area(ring):
+    """Shoelace area in square degrees; positive for counter-clockwise rings."""
+    area = 0.0
+    for i in range(len(ring) - 1):
+        area += ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1]
+    return area / 2.0
+
+
+def bounding_box(geometry):
+    """Return ``(min_lon, min_lat, max_lon, max_lat)`` or ``None`` if empty."""
+    xs = []
+    ys = []
+    for polygon in polygons(geometry):
+        for ring in polygon:
+            for point in ring:
+                xs.append(point[0])
+                ys.append(point[1])
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def centroid(geometry):
+    """Area-weighted centroid of the outer rings, falling back to the vertex mean."""
+    total = cx = cy = 0.0
+    count = sx = sy = 0
+    for polygon in polygons(geometry):
+        if not polygon:
+            continue
+        ring = polygon[0]
+        for i in range(len(ring) - 1):
+            x0, y0 = ring[i][0], ring[i][1]
+            x1, y1 = ring[i + 1][0], ring[i + 1][1]
+            cross = x0 * y1 - x1 * y0
+            total += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+        for point in ring[:-1] or ring:
+            sx += point[0]
+            sy += point[1]
+            count += 1
+
+    if abs(total) > 1e-18:
+        return cx / (3.0 * total), cy / (3.0 * total)
+    if count:
+        return sx / count, sy / count
+    return None
+
+
+def mercator(lon, lat):
+    """Project to normalized Web Mercator, with both axes in ``[0, 1)``."""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+class GeometryError(ValueError):
+    """Raised when a site geometry cannot be normalized into a valid polygon."""
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _clean_ring(points):
+    """Drop duplicate and collinear vertices from an open ring of integer points."""
+    changed = True
+    while changed and len(points) >= 3:
+        changed = False
+        cleaned = []
+        n = len(points)
+        for i in range(n):
+            prev = cleaned[-1] if cleaned else points[i - 1]
+            current = points[i]
+            following = points[(i + 1) % n]
+            if current == prev or _cross(prev, current, following) == 0:
+                changed = True
+                continue
+            cleaned.append(current)
+        points = cleaned
+    return points
+
+
+def _dequantize(value, scale):
+    # Whole degrees are emitted as ints so they serialize without a trailing '.0'.
+    return value // scale if value % scale == 0 else value / scale
+
+
+def _normalize_ring(ring, scale, exterior):
+    if not isinstance(ring, (list, tuple)):
+        raise GeometryError('Each ring must be a list of positions.')
+
+    points = []
+    for position in ring:
+        if not isinstance(position, (list, tuple)) or len(position) < 2:
+            raise GeometryError('Each position must be a [longitude, latitude] pair.')
+        try:
+            lon, lat = float(position[0]), float(position[1])
+        except (TypeError, ValueError):
+            raise GeometryError('Coordinates must be numbers.')
+        if not (math.isfinite(lon) and math.isfinite(lat)) or abs(lon) > 180 or abs(lat) > 90:
+            raise GeometryError('Coordinates must be valid longitude/latitude degrees.')
+        points.append((round(lon * scale), round(lat * scale)))
+
+    # Work on the open ring; it is closed again on the way out.
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    points = _clean_ring(points)
+    if len(points) < 3:
+        return None
+
+    closed = points + [points[0]]
+    # RFC 7946: exterior rings counter-clockwise, holes clockwise.
+    if (ring_signed_area(closed) > 0) != exterior:
+        closed.reverse()
+    return [[_dequantize(x, scale), _dequantize(y, scale)] for x, y in closed]
+
+
+def _normalize_polygon(rings, scale):
+    if not isinstance(rings, (list, tuple)) or not rings:
+        raise GeometryError('A polygon needs at least an exterior ring.')
+    exterior = _normalize_ring(rings[0], scale, exterior=True)
+    if exterior is None:
+        raise GeometryError('A polygon ring needs at least 3 distinct, non-collinear vertices.')
+    holes = [_normalize_ring(ring, scale, exterior=False) for ring in rings[1:]]
+    return [exterior] + [hole for hole in holes if hole is not None]
+
+
+def normalize_geometry(geometry, precision=None):
+    """
+    Validate and canonicalize a Polygon/MultiPolygon.
+
+    Coordinates are quantized to ``precision`` decimal places (default
+    ``settings.SITE_GEOMETRY_PRECISION``), duplicate and collinear vertices
+    are removed, open rings are closed and rings are rewound. The result is
+    idempotent: normalizing it again returns an equal geometry.
+    """
+    if precision is None:
+        precision = settings.SITE_GEOMETRY_PRECISION
+    scale = 10 ** precision
+
+    if not isinstance(geometry, dict):
+        raise GeometryError('Geometry must be a GeoJSON object.')
+    geometry_type = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+
+    if geometry_type == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': _normalize_polygon(coordinates, scale)}
+    if geometry_type == 'MultiPolygon':
+        if not isinstance(coordinates, (list, tuple)) or not coordinates:
+            raise GeometryError('A MultiPolygon needs at least one polygon.')
+        return {
+            'type': 'MultiPolygon',
+            'coordinates': [_normalize_polygon(polygon, scale) for polygon in coordinates],
+        }
+    raise GeometryError('Geometry must be a GeoJSON Polygon or MultiPolygon.')
+
+
+def _canonical_ring(ring):
+    # The same ring can start at any vertex; start at the smallest one.
+    points = [tuple(position[:2]) for position in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if not points:
+        return []
+    start = points.index(min(points))
+    points = points[start:] + points[:start]
+    return [list(point) for point in points + [points[0]]]
+
+
+def hash_geometry(geometry):
+    """
+    SHA-256 of a geometry's canonical form, or ``''`` for an empty geometry.
+
+    Rings are rotated to start at their smallest vertex and holes and polygons
+    are sorted, so normalized geometries describing the same shape hash the
+    same whatever vertex or polygon order they were uploaded in.
+    """
+    if not geometry:
+        return ''
+    try:
+        geometry_type = geometry.get('type')
+        if geometry_type in ('Polygon', 'MultiPolygon'):
+            polygon_list = geometry['coordinates'] if geometry_type == 'MultiPolygon' else [geometry['coordinates']]
+            canonical = sorted(
+                [_canonical_ring(rings[0])] + sorted(_canonical_ring(ring) for ring in rings[1:])
+                for rings in polygon_list
+            )
+        else:
+            canonical = geometry
+    except (AttributeError, IndexError, KeyError, TypeError):
+        # Malformed legacy geometry: hash it as stored.
+        canonical = geometry
+    text = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from projects.models import Project
+from projects.overlaps import detect_project_overlaps
+
+
+class Command(BaseCommand):
+    help = 'Detect overlapping sites within each project'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help='Project id to check (repeatable); defaults to all projects')
+
+    def handle(self, *args, **options):
+        project_ids = options['projects'] or Project.objects.values_list('id', flat=True)
+        total = 0
+        for project_id in project_ids:
+            found = detect_project_overlaps(project_id)
+            total += found
+            if found:
+                self.stdout.write(f'Project {project_id}: {found} overlapping site pairs')
+        self.stdout.write(self.style.SUCCESS(f'Found {total} overlapping site pairs'))
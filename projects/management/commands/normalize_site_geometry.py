@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from jobs.queue import enqueue
+from projects.normalization import normalize_sites
+
+
+class Command(BaseCommand):
+    help = 'Normalize and quantize the geometry of existing sites to SITE_GEOMETRY_PRECISION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, default=None, help='Only this project (defaults to all sites)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report savings without writing')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the backfill as a job for run_worker instead of running it here')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            project_id = options['project']
+            job = enqueue('projects.normalize_site_geometry', project_id, options['batch_size'],
+                          key=f'normalize-geometry:{project_id or "all"}')
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        stats = normalize_sites(
+            options['project'], options['batch_size'], options['dry_run'],
+            on_invalid=lambda site_id, error: self.stderr.write(f'Site {site_id}: {error}'),
+        )
+        before, after = stats['bytes_before'], stats['bytes_after']
+        ratio = ((before - after) / before * 100) if before else 0
+        verb = 'Would normalize' if options['dry_run'] else 'Normalized'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {stats['updated']} sites ({stats['invalid']} invalid skipped); "
+            f'geometry bytes {before} -> {after} ({ratio:.1f}% smaller)'
+        ))
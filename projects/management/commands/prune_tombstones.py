@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from projects.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete change-feed tombstones older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Retention in days (defaults to CHANGE_FEED_TOMBSTONE_DAYS)')
+
+    def handle(self, *args, **options):
+        days = options['days'] or settings.CHANGE_FEED_TOMBSTONE_DAYS
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones older than {days} days'))
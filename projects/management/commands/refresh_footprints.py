@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from projects.footprint import refresh_project_footprint
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Recompute project footprints, bounding boxes, centroids and total areas from their sites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help='Project id to refresh (repeatable); defaults to all projects')
+
+    def handle(self, *args, **options):
+        project_ids = options['projects'] or Project.objects.values_list('id', flat=True)
+        total = 0
+        for project_id in project_ids:
+            refresh_project_footprint(project_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {total} projects'))
@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from daruka.benchmarks import BASELINE_PATH, STATISTICS, compare, load_baseline, measure, save_baseline
+
+ROW_COUNTS = [1000, 100000, 1000000]
+QUICK_ROW_COUNTS = [1000, 10000]
+
+
+class Command(BaseCommand):
+    help = 'Run the microbenchmark suite on a throwaway test database and compare it with the stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=None,
+                            help='Analytics table sizes for the summary/time_series cases (default 1k 100k 1M)')
+        parser.add_argument('--objects', type=int, default=10000,
+                            help='Projects and sites to serialize (default 10000)')
+        parser.add_argument('--quick', action='store_true', help='Small data sizes, for a fast smoke run')
+        parser.add_argument('-k', '--filter', default='', help='Only run cases whose name contains this')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--min-time', type=float, default=0.1, help='Seconds per round (default 0.1)')
+        parser.add_argument('--stat', choices=STATISTICS, default='min', help='Statistic compared with the baseline')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Slowdown over the baseline counted as a regression (default 0.25 = 25%%)')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH))
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+        parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        from daruka.benchmarks.cases import build_cases
+
+        rows = options['rows'] or (QUICK_ROW_COUNTS if options['quick'] else ROW_COUNTS)
+        objects = 1000 if options['quick'] else options['objects']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        results = {}
+        try:
+            # Measure the computation itself: no shared results, no rate limits.
+            with override_settings(
+                SINGLE_FLIGHT_RESULT_TTL=0,
+                JOBS_EAGER=False,
+                REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'default': None}},
+            ):
+                cases = [case for case in build_cases(rows, objects, stdout=self.stdout)
+                         if options['filter'] in case.name]
+                self.stdout.write(f'{"case":<48}{"min":>12}{"median":>12}{"mean":>12}{"stddev":>12}')
+                for case in cases:
+                    result = measure(case.func, options['rounds'], options['min_time'])
+                    results[case.name] = result
+                    self.stdout.write(
+                        f'{case.name:<48}' + ''.join(
+                            f'{result[stat] * 1000:10.3f}ms' for stat in ('min', 'median', 'mean', 'stddev')
+                        )
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['save_baseline']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Saved {len(results)} results to {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        regressions = compare(results, baseline, options['threshold'], options['stat'])
+        for name, current, previous, change in regressions:
+            self.stderr.write(
+                f'{name}: {current * 1000:.3f}ms vs {previous * 1000:.3f}ms baseline ({change:+.0%})'
+            )
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmarks regressed more than {options['threshold']:.0%} ({options['stat']})"
+            )
+        compared = sum(1 for name in results if name in baseline)
+        self.stdout.write(self.style.SUCCESS(f'No regressions ({compared} of {len(results)} cases have a baseline)'))
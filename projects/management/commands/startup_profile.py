@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a server process does before its first request.
+STARTUP_SCRIPT = (
+    'import time; started = time.perf_counter(); '
+    'from daruka.wsgi import application; '
+    'loaded = time.perf_counter(); '
+    'from daruka.warmup import warm_up; warm_up(build_indexes=False); '
+    'print(f"startup {loaded - started:.6f} {time.perf_counter() - loaded:.6f}")'
+)
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Measure server start-up time and the import cost of each module (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Modules to list (default 25)')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+        parser.add_argument('--packages', action='store_true',
+                            help='Aggregate self time per top-level package instead of per module')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Fail if loading the WSGI app takes longer than this')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'daruka.settings'))
+        # A fresh interpreter so nothing is already imported.
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        if process.returncode != 0:
+            raise CommandError(f'Start-up failed:\n{process.stderr[-2000:]}')
+
+        modules = []
+        for line in process.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        load_seconds, warmup_seconds = (float(value) for value in process.stdout.split()[-2:])
+
+        if options['packages']:
+            totals = {}
+            for name, self_us, _, _ in modules:
+                package = name.split('.')[0]
+                totals[package] = totals.get(package, 0) + self_us
+            rows = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+            self.stdout.write(f'{"self ms":>10}  package')
+            for package, self_us in rows:
+                self.stdout.write(f'{self_us / 1000:10.1f}  {package}')
+        else:
+            key = 2 if options['sort'] == 'cumulative' else 1
+            rows = sorted(modules, key=lambda row: row[key], reverse=True)[:options['top']]
+            self.stdout.write(f'{"self ms":>10}{"cumul. ms":>11}  module')
+            for name, self_us, cumulative_us, _ in rows:
+                self.stdout.write(f'{self_us / 1000:10.1f}{cumulative_us / 1000:11.1f}  {name}')
+
+        import_ms = sum(self_us for _, self_us, _, _ in modules) / 1000
+        load_ms = load_seconds * 1000
+        self.stdout.write(
+            f'\n{len(modules)} modules imported in {import_ms:.0f}ms; '
+            f'WSGI app loaded in {load_ms:.0f}ms, warm-up took {warmup_seconds * 1000:.0f}ms'
+        )
+        budget = options['budget_ms']
+        if budget is not None and load_ms > budget:
+            raise CommandError(f'WSGI app load took {load_ms:.0f}ms, over the {budget:.0f}ms budget')
+        self.stdout.write(self.style.SUCCESS('Start-up profile complete'))
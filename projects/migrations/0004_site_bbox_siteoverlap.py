@@ -0,0 +1,135 @@
+# Generated by Django 4.2 on 2026-10-19 12:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copies of projects.geometry helpers as of this migration.
+def _polygons(geometry):
+    if not isinstance(geometry, dict):
+        return []
+    coordinates = geometry.get("coordinates") or []
+    if geometry.get("type") == "Polygon":
+        return [coordinates]
+    if geometry.get("type") == "MultiPolygon":
+        return list(coordinates)
+    return []
+
+
+def _bounding_box(geometry):
+    xs = []
+    ys = []
+    for polygon in _polygons(geometry):
+        for ring in polygon:
+            for point in ring:
+                xs.append(point[0])
+                ys.append(point[1])
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def backfill_bounding_boxes(apps, schema_editor):
+    Site = apps.get_model("projects", "Site")
+    batch = []
+    for site in Site.objects.only("id", "geometry").iterator(chunk_size=2000):
+        site.min_lon, site.min_lat, site.max_lon, site.max_lat = _bounding_box(
+            site.geometry
+        ) or (None, None, None, None)
+        batch.append(site)
+        if len(batch) >= 2000:
+            Site.objects.bulk_update(
+                batch, ["min_lon", "min_lat", "max_lon", "max_lat"]
+            )
+            batch = []
+    Site.objects.bulk_update(batch, ["min_lon", "min_lat", "max_lon", "max_lat"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0003_site"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SiteOverlap",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "area",
+                    models.FloatField(help_text="Overlapping area in square meters"),
+                ),
+                ("detected_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-area"],
+            },
+        ),
+        migrations.AddField(
+            model_name="site",
+            name="max_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="site",
+            name="max_lon",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="site",
+            name="min_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="site",
+            name="min_lon",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="site",
+            index=models.Index(
+                fields=["project", "min_lon", "max_lon"], name="site_project_bbox_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="siteoverlap",
+            name="project",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="site_overlaps",
+                to="projects.project",
+            ),
+        ),
+        migrations.AddField(
+            model_name="siteoverlap",
+            name="site_a",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="projects.site",
+            ),
+        ),
+        migrations.AddField(
+            model_name="siteoverlap",
+            name="site_b",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="projects.site",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="siteoverlap",
+            unique_together={("site_a", "site_b")},
+        ),
+        migrations.RunPython(backfill_bounding_boxes, migrations.RunPython.noop),
+    ]
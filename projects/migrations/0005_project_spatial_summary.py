@@ -0,0 +1,125 @@
+# Generated by Django 4.2 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+# Frozen copies of projects.geometry helpers as of this migration.
+def _polygons(geometry):
+    if not isinstance(geometry, dict):
+        return []
+    coordinates = geometry.get("coordinates") or []
+    if geometry.get("type") == "Polygon":
+        return [coordinates]
+    if geometry.get("type") == "MultiPolygon":
+        return list(coordinates)
+    return []
+
+
+def _centroid(geometry):
+    total = cx = cy = 0.0
+    count = sx = sy = 0
+    for polygon in _polygons(geometry):
+        if not polygon:
+            continue
+        ring = polygon[0]
+        for i in range(len(ring) - 1):
+            x0, y0 = ring[i][0], ring[i][1]
+            x1, y1 = ring[i + 1][0], ring[i + 1][1]
+            cross = x0 * y1 - x1 * y0
+            total += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+        for point in ring[:-1] or ring:
+            sx += point[0]
+            sy += point[1]
+            count += 1
+    if abs(total) > 1e-18:
+        return cx / (3.0 * total), cy / (3.0 * total)
+    if count:
+        return sx / count, sy / count
+    return None
+
+
+def backfill_project_summaries(apps, schema_editor):
+    # Bounding box, centroid and total area only. Dissolved footprints are left
+    # empty: run ``manage.py refresh_footprints`` after migrating to fill them.
+    Project = apps.get_model("projects", "Project")
+    Site = apps.get_model("projects", "Site")
+    for project_id in Project.objects.values_list("id", flat=True):
+        rows = Site.objects.filter(project_id=project_id).values_list(
+            "geometry", "area"
+        )
+        xs, ys = [], []
+        total_area = weighted_lon = weighted_lat = weight = 0.0
+        for geometry, area in rows.iterator(chunk_size=2000):
+            total_area += area or 0.0
+            for polygon in _polygons(geometry):
+                for ring in polygon:
+                    xs.extend(point[0] for point in ring)
+                    ys.extend(point[1] for point in ring)
+            point = _centroid(geometry)
+            if point is not None:
+                w = area if area and area > 0 else 1e-12
+                weighted_lon += point[0] * w
+                weighted_lat += point[1] * w
+                weight += w
+        Project.objects.filter(pk=project_id).update(
+            min_lon=min(xs) if xs else None,
+            min_lat=min(ys) if ys else None,
+            max_lon=max(xs) if xs else None,
+            max_lat=max(ys) if ys else None,
+            centroid_lon=weighted_lon / weight if weight else None,
+            centroid_lat=weighted_lat / weight if weight else None,
+            total_area=total_area,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0004_site_bbox_siteoverlap"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="centroid_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="centroid_lon",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="footprint",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="max_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="max_lon",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="min_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="min_lon",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="total_area",
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.RunPython(backfill_project_summaries, migrations.RunPython.noop),
+    ]
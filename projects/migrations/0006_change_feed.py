@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0005_project_spatial_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("project", "Project"),
+                            ("site", "Site"),
+                            ("analytics", "Site analytics"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("project_id", models.BigIntegerField(blank=True, null=True)),
+                ("site_id", models.BigIntegerField(blank=True, null=True)),
+                ("owner_id", models.BigIntegerField(blank=True, null=True)),
+                ("deleted_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "ordering": ["deleted_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["updated_at"], name="project_updated_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="site",
+            index=models.Index(fields=["updated_at"], name="site_updated_at_idx"),
+        ),
+    ]
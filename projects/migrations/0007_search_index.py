@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Frozen copy of the projects.search index as of this migration.
+TABLES = ["projects_project", "projects_site"]
+SQLITE_INDEX = [
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+        "name, description, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {table}_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name, description ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO {table}_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+]
+SQLITE_TRIGGERS = ("insert", "delete", "update")
+POSTGRES_INDEX = (
+    "CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')))"
+)
+
+
+def install(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            if connection.vendor == "sqlite":
+                for statement in SQLITE_INDEX:
+                    cursor.execute(statement.format(table=table))
+                cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+            elif connection.vendor == "postgresql":
+                cursor.execute(POSTGRES_INDEX.format(table=table))
+
+
+def uninstall(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            if connection.vendor == "sqlite":
+                for trigger in SQLITE_TRIGGERS:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+            elif connection.vendor == "postgresql":
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0006_change_feed"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2 on 2026-10-19 12:41
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+# Frozen copies of projects.geometry helpers as of this migration.
+def _canonical_ring(ring):
+    points = [tuple(position[:2]) for position in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if not points:
+        return []
+    start = points.index(min(points))
+    points = points[start:] + points[:start]
+    return [list(point) for point in points + [points[0]]]
+
+
+def _hash_geometry(geometry):
+    if not geometry:
+        return ""
+    try:
+        geometry_type = geometry.get("type")
+        if geometry_type in ("Polygon", "MultiPolygon"):
+            polygon_list = (
+                geometry["coordinates"]
+                if geometry_type == "MultiPolygon"
+                else [geometry["coordinates"]]
+            )
+            canonical = sorted(
+                [_canonical_ring(rings[0])]
+                + sorted(_canonical_ring(ring) for ring in rings[1:])
+                for rings in polygon_list
+            )
+        else:
+            canonical = geometry
+    except (AttributeError, IndexError, KeyError, TypeError):
+        canonical = geometry
+    text = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def backfill_geometry_hashes(apps, schema_editor):
+    Site = apps.get_model("projects", "Site")
+    batch = []
+    for site in Site.objects.only("id", "geometry").iterator(chunk_size=2000):
+        site.geometry_hash = _hash_geometry(site.geometry)
+        batch.append(site)
+        if len(batch) >= 2000:
+            Site.objects.bulk_update(batch, ["geometry_hash"])
+            batch = []
+    Site.objects.bulk_update(batch, ["geometry_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0007_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="site",
+            name="geometry_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="site",
+            index=models.Index(fields=["geometry_hash"], name="site_geometry_hash_idx"),
+        ),
+        migrations.RunPython(backfill_geometry_hashes, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from .geometry import GeometryError, bounding_box, hash_geometry, normalize_geometry, polygons, ring_signed_area
 import json
 
 class Project(models.Model):
@@ -9,8 +11,21 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Spatial summary of the project's sites, maintained by projects.footprint
+    footprint = models.JSONField(null=True, blank=True, editable=False)  # Dissolved, simplified GeoJSON
+    min_lon = models.FloatField(null=True, blank=True, editable=False)
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lon = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+    centroid_lon = models.FloatField(null=True, blank=True, editable=False)
+    centroid_lat = models.FloatField(null=True, blank=True, editable=False)
+    total_area = models.FloatField(default=0.0, editable=False)  # Sum of site areas in square meters
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='project_updated_at_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -21,38 +36,105 @@ class Site(models.Model):
     description = models.TextField(blank=True)
     geometry = models.JSONField()  # Store GeoJSON polygon
     area = models.FloatField(null=True, blank=True)  # Area in square meters
+    # Bounding box in degrees, kept in sync with geometry for neighbour lookups
+    min_lon = models.FloatField(null=True, blank=True, editable=False)
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lon = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+    # SHA-256 of the canonical geometry (projects.geometry.hash_geometry); derived
+    # data is only recomputed when it changes, and equal hashes are duplicates
+    geometry_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sites')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['project', 'min_lon', 'max_lon'], name='site_project_bbox_idx'),
+            models.Index(fields=['updated_at'], name='site_updated_at_idx'),
+            models.Index(fields=['geometry_hash'], name='site_geometry_hash_idx'),
+        ]
     
     def calculate_area(self):
-        """Calculate approximate area from polygon coordinates"""
-        if not self.geometry or self.geometry.get('type') != 'Polygon':
-            return 0
-        
-        coords = self.geometry.get('coordinates', [[]])[0]
-        if len(coords) < 3:
-            return 0
-        
-        # Simple area calculation (not accurate for large areas)
-        # For production, use proper geospatial libraries
+        """Calculate approximate area from polygon coordinates, holes subtracted"""
         area = 0
-        for i in range(len(coords) - 1):
-            area += coords[i][0] * coords[i+1][1]
-            area -= coords[i+1][0] * coords[i][1]
-        area = abs(area) / 2.0
+        for polygon in polygons(self.geometry):
+            rings = [ring for ring in polygon if len(ring) >= 3]
+            if not rings:
+                continue
+            # Simple area calculation (not accurate for large areas)
+            # For production, use proper geospatial libraries
+            area += abs(ring_signed_area(rings[0])) - sum(abs(ring_signed_area(ring)) for ring in rings[1:])
         
         # Convert to approximate square meters (rough estimation)
         # 1 degree ≈ 111,320 meters at equator
-        return area * 111320 * 111320
+        return max(area, 0) * 111320 * 111320
+    
+    def clean(self):
+        super().clean()
+        try:
+            self.geometry = normalize_geometry(self.geometry)
+        except GeometryError as e:
+            raise ValidationError({'geometry': str(e)})
     
     def save(self, *args, **kwargs):
-        if self.geometry:
-            self.area = self.calculate_area()
+        # Hashing is cheap next to normalizing; a geometry that still hashes to
+        # the stored value (e.g. only the name changed) keeps its derived data.
+        stored_hash = self.geometry_hash
+        self._geometry_changed = self._state.adding or not stored_hash or hash_geometry(self.geometry) != stored_hash
+        if self._geometry_changed:
+            if self.geometry:
+                try:
+                    self.geometry = normalize_geometry(self.geometry)
+                except GeometryError:
+                    # Legacy rows are saved as-is; new input is validated by
+                    # SiteSerializer and clean() before it gets here.
+                    pass
+            self.geometry_hash = hash_geometry(self.geometry)
+            # The same shape uploaded again in a different form.
+            self._geometry_changed = self._state.adding or self.geometry_hash != stored_hash
+        if self._geometry_changed:
+            if self.geometry:
+                self.area = self.calculate_area()
+            self.min_lon, self.min_lat, self.max_lon, self.max_lat = bounding_box(self.geometry) or (None, None, None, None)
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - {self.project.name}"
+
+class SiteOverlap(models.Model):
+    """A pair of sites in the same project whose polygons overlap"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='site_overlaps')
+    site_a = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='+')
+    site_b = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='+')
+    area = models.FloatField(help_text='Overlapping area in square meters')
+    detected_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-area']
+        unique_together = ['site_a', 'site_b']
+    
+    def __str__(self):
+        return f"{self.site_a_id} / {self.site_b_id}: {self.area:.1f} m²"
+
+class Tombstone(models.Model):
+    """Record of a hard-deleted row, so the change feed can report deletions"""
+    MODEL_CHOICES = [
+        ('project', 'Project'),
+        ('site', 'Site'),
+        ('analytics', 'Site analytics'),
+    ]
+    
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    project_id = models.BigIntegerField(null=True, blank=True)
+    site_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.BigIntegerField(null=True, blank=True)  # Project owner, for project tombstones
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['deleted_at']
+    
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
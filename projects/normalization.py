@@ -0,0 +1,79 @@
+"""
+Backfill of the write-path geometry normalization for stored sites.
+
+Rows whose geometry or derived fields (hash, area, bounding box) are out of
+date are rewritten through ``Site.save``, one primary-key batch per
+transaction. That bumps ``updated_at`` for the change feed and fires the same
+signals as any other site write, so realtime events, map centroids, overlap
+rows, the spatial index and project footprints all follow the normalized
+shape.
+"""
+
+import json
+
+from django.db import transaction
+
+from .geometry import GeometryError, bounding_box, hash_geometry, normalize_geometry
+from .models import Site
+
+FIELDS = ['id', 'project_id', 'geometry', 'geometry_hash', 'area', 'min_lon', 'min_lat', 'max_lon', 'max_lat',
+          'updated_at']
+
+
+def _size(geometry):
+    return len(json.dumps(geometry, separators=(',', ':')))
+
+
+def _derived(site):
+    return (site.geometry_hash, site.area, site.min_lon, site.min_lat, site.max_lon, site.max_lat)
+
+
+def normalize_sites(project_id=None, batch_size=500, dry_run=False, on_progress=None, on_invalid=None):
+    """
+    Normalize every site (or a project's sites) whose stored data is stale.
+
+    Returns ``{'sites', 'updated', 'invalid', 'bytes_before', 'bytes_after'}``.
+    ``on_invalid(site_id, error)`` is called for geometry that cannot be
+    normalized; those rows are left untouched.
+    """
+    sites = Site.objects.all()
+    if project_id is not None:
+        sites = sites.filter(project_id=project_id)
+    total = sites.count() if on_progress is not None else None
+    stats = {'sites': 0, 'updated': 0, 'invalid': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = 0
+
+    while True:
+        batch = list(sites.filter(pk__gt=last_id).order_by('pk').only(*FIELDS)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].pk
+
+        stale = []
+        for site in batch:
+            try:
+                geometry = normalize_geometry(site.geometry)
+            except GeometryError as e:
+                stats['invalid'] += 1
+                if on_invalid is not None:
+                    on_invalid(site.pk, e)
+                continue
+            stats['bytes_before'] += _size(site.geometry)
+            stats['bytes_after'] += _size(geometry)
+            before = (site.geometry, *_derived(site))
+            site.geometry = geometry
+            bbox = bounding_box(geometry) or (None, None, None, None)
+            if before != (geometry, hash_geometry(geometry), site.calculate_area(), *bbox):
+                stale.append(site)
+        stats['sites'] += len(batch)
+
+        if stale and not dry_run:
+            with transaction.atomic():
+                for site in stale:
+                    # An empty hash makes save() recompute every derived field.
+                    site.geometry_hash = ''
+                    site.save()
+        stats['updated'] += len(stale)
+        if on_progress is not None:
+            on_progress(stats['sites'], total)
+    return stats
@@ -0,0 +1,214 @@
+"""
+Overlap detection between sites of the same project.
+
+Candidate pairs come from a sweep over site bounding boxes sorted by their
+western edge, so only sites whose boxes actually intersect are compared. Each
+candidate pair's shared area is then computed exactly with Green's theorem:
+the boundary of A ∩ B is made of the parts of A's edges inside B and of B's
+edges inside A, so summing the shoelace terms of those pieces gives the
+intersection area without building the intersection polygon. Edges the two
+polygons share (adjacent parcels) cancel out and report no overlap.
+"""
+
+from django.conf import settings
+from django.db import transaction
+
+from .geometry import METERS_PER_DEGREE, bounding_box, polygons, ring_signed_area
+
+EPS = 1e-12
+BOUNDARY_EPS = 1e-9
+
+
+def _oriented_rings(geometry, origin):
+    """Rings translated to ``origin``, exteriors counter-clockwise and holes clockwise."""
+    ox, oy = origin
+    rings = []
+    for polygon in polygons(geometry):
+        for position, ring in enumerate(polygon):
+            points = [(p[0] - ox, p[1] - oy) for p in ring]
+            if len(points) < 3:
+                continue
+            if points[0] != points[-1]:
+                points.append(points[0])
+            if (ring_signed_area(points) > 0) != (position == 0):
+                points.reverse()
+            rings.append(points)
+    return rings
+
+
+def _edges(rings):
+    edges = []
+    for ring in rings:
+        for i in range(len(ring) - 1):
+            (x0, y0), (x1, y1) = ring[i], ring[i + 1]
+            if (x0, y0) != (x1, y1):
+                edges.append((x0, y0, x1, y1, min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+    return edges
+
+
+def _inside(x, y, edges):
+    inside = False
+    for x0, y0, x1, y1, *_ in edges:
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _on_boundary(x, y, edges):
+    """Return the direction of a boundary edge through the point, or ``None``."""
+    for x0, y0, x1, y1, bx0, by0, bx1, by1 in edges:
+        if x < bx0 - BOUNDARY_EPS or x > bx1 + BOUNDARY_EPS or y < by0 - BOUNDARY_EPS or y > by1 + BOUNDARY_EPS:
+            continue
+        dx, dy = x1 - x0, y1 - y0
+        length_sq = dx * dx + dy * dy
+        t = ((x - x0) * dx + (y - y0) * dy) / length_sq
+        px, py = x0 + t * dx, y0 + t * dy
+        if (x - px) ** 2 + (y - py) ** 2 <= BOUNDARY_EPS * BOUNDARY_EPS:
+            return dx, dy
+    return None
+
+
+def _split_params(edge, others):
+    """Parameters along ``edge`` where it meets any edge in ``others``."""
+    x0, y0, x1, y1, ex0, ey0, ex1, ey1 = edge
+    rx, ry = x1 - x0, y1 - y0
+    rr = rx * rx + ry * ry
+    params = [0.0, 1.0]
+    for sx0, sy0, sx1, sy1, bx0, by0, bx1, by1 in others:
+        if bx1 < ex0 or bx0 > ex1 or by1 < ey0 or by0 > ey1:
+            continue
+        dx, dy = sx1 - sx0, sy1 - sy0
+        qx, qy = sx0 - x0, sy0 - y0
+        denom = rx * dy - ry * dx
+        if abs(denom) > EPS * rr:
+            t = (qx * dy - qy * dx) / denom
+            u = (qx * ry - qy * rx) / denom
+            if -EPS <= t <= 1 + EPS and -EPS <= u <= 1 + EPS:
+                params.append(min(max(t, 0.0), 1.0))
+        elif abs(qx * ry - qy * rx) <= EPS * rr:
+            # Collinear: split at the other segment's endpoints.
+            for px, py in ((sx0, sy0), (sx1, sy1)):
+                t = ((px - x0) * rx + (py - y0) * ry) / rr
+                if 0.0 < t < 1.0:
+                    params.append(t)
+    return sorted(set(params))
+
+
+def _boundary_integral(edges, others, keep_shared):
+    """Twice the signed area contributed by the parts of ``edges`` inside ``others``."""
+    total = 0.0
+    for edge in edges:
+        x0, y0, x1, y1 = edge[:4]
+        rx, ry = x1 - x0, y1 - y0
+        params = _split_params(edge, others)
+        for t0, t1 in zip(params, params[1:]):
+            if t1 - t0 <= EPS:
+                continue
+            ax, ay = x0 + t0 * rx, y0 + t0 * ry
+            bx, by = x0 + t1 * rx, y0 + t1 * ry
+            mx, my = (ax + bx) / 2, (ay + by) / 2
+            direction = _on_boundary(mx, my, others)
+            if direction is not None:
+                # A shared boundary bounds the intersection only where both
+                # polygons run the same way; count it from one side only.
+                if not keep_shared or direction[0] * rx + direction[1] * ry <= 0:
+                    continue
+            elif not _inside(mx, my, others):
+                continue
+            total += ax * by - bx * ay
+    return total
+
+
+def intersection_area(geometry_a, geometry_b):
+    """Overlap of two (Multi)Polygons in square meters (same units as ``Site.area``)."""
+    first = next((ring[0] for polygon in polygons(geometry_a) for ring in polygon if ring), None)
+    if first is None:
+        return 0.0
+    origin = (first[0], first[1])
+    edges_a = _edges(_oriented_rings(geometry_a, origin))
+    edges_b = _edges(_oriented_rings(geometry_b, origin))
+    if not edges_a or not edges_b:
+        return 0.0
+    twice_area = _boundary_integral(edges_a, edges_b, True) + _boundary_integral(edges_b, edges_a, False)
+    return max(twice_area / 2.0, 0.0) * METERS_PER_DEGREE * METERS_PER_DEGREE
+
+
+def _boxes_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def find_overlaps(sites, min_area=None):
+    """
+    Sweep-line overlap search.
+
+    ``sites`` is an iterable of ``(site_id, geometry)``. Returns a list of
+    ``(site_a_id, site_b_id, area)`` with ``site_a_id < site_b_id``.
+    """
+    if min_area is None:
+        min_area = settings.SITE_OVERLAP_MIN_AREA
+    entries = []
+    for site_id, geometry in sites:
+        bbox = bounding_box(geometry)
+        if bbox is not None:
+            entries.append((bbox, site_id, geometry))
+    entries.sort(key=lambda entry: entry[0][0])
+
+    overlaps = []
+    active = []
+    for bbox, site_id, geometry in entries:
+        active = [entry for entry in active if entry[0][2] > bbox[0]]
+        for other_bbox, other_id, other_geometry in active:
+            if not _boxes_intersect(bbox, other_bbox):
+                continue
+            area = intersection_area(geometry, other_geometry)
+            if area >= min_area:
+                pair = (site_id, other_id) if site_id < other_id else (other_id, site_id)
+                overlaps.append((pair[0], pair[1], area))
+        active.append((bbox, site_id, geometry))
+    return overlaps
+
+
+def detect_project_overlaps(project_id):
+    """Recompute and store every overlap in a project; returns the number found."""
+    from .models import Site, SiteOverlap
+
+    sites = Site.objects.filter(project_id=project_id).values_list('id', 'geometry')
+    overlaps = find_overlaps(sites.iterator(chunk_size=2000))
+    with transaction.atomic():
+        SiteOverlap.objects.filter(project_id=project_id).delete()
+        SiteOverlap.objects.bulk_create(
+            [SiteOverlap(project_id=project_id, site_a_id=a, site_b_id=b, area=area) for a, b, area in overlaps],
+            batch_size=1000,
+        )
+    return len(overlaps)
+
+
+def check_site_overlaps(site_id):
+    """Re-check one site against its indexed neighbours after it was saved."""
+    from django.db.models import Q
+    from .models import Site, SiteOverlap
+
+    site = Site.objects.filter(pk=site_id).only(
+        'id', 'project_id', 'geometry', 'min_lon', 'min_lat', 'max_lon', 'max_lat'
+    ).first()
+    if site is None:
+        return 0
+
+    overlaps = []
+    if site.min_lon is not None:
+        neighbours = Site.objects.filter(
+            project_id=site.project_id,
+            min_lon__lt=site.max_lon, max_lon__gt=site.min_lon,
+            min_lat__lt=site.max_lat, max_lat__gt=site.min_lat,
+        ).exclude(pk=site.pk).values_list('id', 'geometry')
+        min_area = settings.SITE_OVERLAP_MIN_AREA
+        for other_id, geometry in neighbours.iterator(chunk_size=500):
+            area = intersection_area(site.geometry, geometry)
+            if area >= min_area:
+                a, b = sorted((site.pk, other_id))
+                overlaps.append(SiteOverlap(project_id=site.project_id, site_a_id=a, site_b_id=b, area=area))
+
+    with transaction.atomic():
+        SiteOverlap.objects.filter(Q(site_a_id=site.pk) | Q(site_b_id=site.pk)).delete()
+        SiteOverlap.objects.bulk_create(overlaps)
+    return len(overlaps)
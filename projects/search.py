@@ -0,0 +1,205 @@
+"""
+Full-text search over project and site names and descriptions.
+
+SQLite keeps an FTS5 table per model (``projects_project_fts``,
+``projects_site_fts``) with the model table as external content, maintained by
+triggers on insert, update and delete. Postgres has a GIN index on the same
+weighted ``to_tsvector`` expression the queries below use, so the index is
+updated together with the row. Other backends fall back to ``icontains``.
+
+Every query word is matched as a prefix and all words must match. Names weigh
+more than descriptions in the ranking.
+"""
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Project, Site
+
+MAX_TERMS = 8
+KINDS = {'project': Project, 'site': Site}
+
+# Recreated after migrations (see ensure_search_index): rebuilding a table on
+# SQLite drops its triggers.
+SQLITE_INDEX = [
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+        "name, description, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {table}_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name, description ON {table} BEGIN "
+        "INSERT INTO {table}_fts({table}_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO {table}_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+]
+SQLITE_TRIGGERS = ('insert', 'delete', 'update')
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({alias}name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({alias}description, '')), 'B')"
+)
+POSTGRES_INDEX = 'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (({vector}))'
+
+
+def _tables():
+    return [model._meta.db_table for model in KINDS.values()]
+
+
+def install_search_index(connection):
+    """Create the text index for ``connection``'s backend; safe to run repeatedly."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for table in _tables():
+                for statement in SQLITE_INDEX:
+                    cursor.execute(statement.format(table=table))
+                cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            for table in _tables():
+                cursor.execute(POSTGRES_INDEX.format(table=table, vector=POSTGRES_VECTOR.format(alias='')))
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        for table in _tables():
+            if connection.vendor == 'sqlite':
+                for trigger in SQLITE_TRIGGERS:
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+                cursor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_search_idx')
+
+
+def ensure_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """``post_migrate`` handler: reinstall SQLite triggers lost to a table rebuild."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = set(connection.introspection.table_names())
+    if not all(table in tables for table in _tables()):
+        return
+    expected = {f'{table}_fts_{trigger}' for table in _tables() for trigger in SQLITE_TRIGGERS}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        present = {row[0] for row in cursor.fetchall()}
+    if not expected <= present:
+        install_search_index(connection)
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _match_expression(vendor, words):
+    if vendor == 'sqlite':
+        return ' '.join(f'"{word}"*' for word in words)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def _matching_ids_sql(kind, vendor, words):
+    table = KINDS[kind]._meta.db_table
+    if vendor == 'sqlite':
+        return f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s', [_match_expression(vendor, words)]
+    vector = POSTGRES_VECTOR.format(alias='')
+    return f"SELECT id FROM {table} WHERE {vector} @@ to_tsquery('simple', %s)", [_match_expression(vendor, words)]
+
+
+def matches(kind, query, using=DEFAULT_DB_ALIAS):
+    """A ``Q`` selecting rows of ``kind`` whose name or description match ``query``."""
+    words = terms(query)
+    if not words:
+        return Q(pk__in=[])
+    vendor = connections[using].vendor
+    if vendor not in ('sqlite', 'postgresql'):
+        condition = Q()
+        for word in words:
+            condition &= Q(name__icontains=word) | Q(description__icontains=word)
+        return condition
+    sql, params = _matching_ids_sql(kind, vendor, words)
+    return Q(pk__in=RawSQL(sql, params))
+
+
+def _ranked_sql(kind, vendor):
+    owner_table = get_user_model()._meta.db_table
+    project_table, site_table = _tables()
+    if kind == 'project':
+        select = 'p.id, p.name, NULL, NULL'
+        rows = f'{project_table} p'
+        row = 'p'
+        project_join = ''
+    else:
+        select = 's.id, s.name, p.id, p.name'
+        rows = f'{site_table} s'
+        row = 's'
+        project_join = f'JOIN {project_table} p ON p.id = s.project_id '
+    owner_join = f'JOIN {owner_table} u ON u.id = p.created_by_id '
+    table = KINDS[kind]._meta.db_table
+
+    if vendor == 'sqlite':
+        # bm25() is lower for better matches.
+        return (
+            f'SELECT {select}, -bm25({table}_fts, 10.0, 1.0) AS score '
+            f'FROM {table}_fts JOIN {rows} ON {row}.id = {table}_fts.rowid {project_join}{owner_join}'
+            f'WHERE {table}_fts MATCH %s AND u.email = %s '
+            f'ORDER BY score DESC, {row}.id LIMIT %s'
+        )
+    vector = POSTGRES_VECTOR.format(alias=f'{row}.')
+    return (
+        f"SELECT {select}, ts_rank({vector}, query) AS score "
+        f"FROM to_tsquery('simple', %s) query, {rows} {project_join}{owner_join}"
+        f"WHERE {vector} @@ query AND u.email = %s "
+        f"ORDER BY score DESC, {row}.id LIMIT %s"
+    )
+
+
+def search(query, owner_email, kinds=('project', 'site'), limit=20, using=None):
+    """
+    Best ``limit`` projects and sites owned by ``owner_email`` matching ``query``,
+    highest score first, as dicts with ``type``, ``id``, ``name``, ``score`` and,
+    for sites, ``project``.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    using = using or router.db_for_read(Project) or DEFAULT_DB_ALIAS
+    vendor = connections[using].vendor
+
+    results = []
+    for kind in kinds:
+        if vendor in ('sqlite', 'postgresql'):
+            with connections[using].cursor() as cursor:
+                cursor.execute(_ranked_sql(kind, vendor), [_match_expression(vendor, words), owner_email, limit])
+                rows = cursor.fetchall()
+        else:
+            queryset = KINDS[kind].objects.using(using).filter(matches(kind, query, using))
+            if kind == 'project':
+                rows = queryset.filter(created_by__email=owner_email).values_list('id', 'name')[:limit]
+                rows = [(pk, name, None, None, 0.0) for pk, name in rows]
+            else:
+                rows = list(
+                    queryset.filter(project__created_by__email=owner_email)
+                    .values_list('id', 'name', 'project_id', 'project__name')[:limit]
+                )
+                rows = [row + (0.0,) for row in rows]
+
+        for pk, name, project_id, project_name, score in rows:
+            result = {'type': kind, 'id': pk, 'name': name, 'score': float(score)}
+            if kind == 'site':
+                result['project'] = {'id': project_id, 'name': project_name}
+            results.append(result)
+
+    results.sort(key=lambda result: -result['score'])
+    return results[:limit]
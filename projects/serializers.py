@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import Project, Site
+from .geometry import GeometryError, normalize_geometry
+from .topology import Topology
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -9,14 +11,27 @@ class ProjectSerializer(serializers.ModelSerializer):
     created_by_email = serializers.EmailField(write_only=True, required=False)
     created_by = serializers.CharField(source='created_by.email', read_only=True)
     site_count = serializers.SerializerMethodField()
+    bbox = serializers.SerializerMethodField()
+    centroid = serializers.SerializerMethodField()
     
     class Meta:
         model = Project
-        fields = ['id', 'name', 'description', 'created_by', 'created_by_email', 'created_by_username', 'created_at', 'updated_at', 'site_count']
-        read_only_fields = ['created_at', 'updated_at', 'created_by']
+        fields = ['id', 'name', 'description', 'created_by', 'created_by_email', 'created_by_username', 'created_at', 'updated_at', 'site_count',
+                  'footprint', 'bbox', 'centroid', 'total_area']
+        read_only_fields = ['created_at', 'updated_at', 'created_by', 'footprint', 'total_area']
     
     def get_site_count(self, obj):
         return obj.sites.count()
+    
+    def get_bbox(self, obj):
+        if obj.min_lon is None:
+            return None
+        return [obj.min_lon, obj.min_lat, obj.max_lon, obj.max_lat]
+    
+    def get_centroid(self, obj):
+        if obj.centroid_lon is None:
+            return None
+        return [obj.centroid_lon, obj.centroid_lat]
 
 class SiteSerializer(serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
@@ -25,8 +40,14 @@ class SiteSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Site
-        fields = ['id', 'project', 'name', 'description', 'geometry', 'area', 'created_by_email', 'created_by_username', 'project_name', 'created_at', 'updated_at']
-        read_only_fields = ['area', 'created_at', 'updated_at']
+        fields = ['id', 'project', 'name', 'description', 'geometry', 'geometry_hash', 'area', 'created_by_email', 'created_by_username', 'project_name', 'created_at', 'updated_at']
+        read_only_fields = ['geometry_hash', 'area', 'created_at', 'updated_at']
+    
+    def validate_geometry(self, value):
+        try:
+            return normalize_geometry(value)
+        except GeometryError as e:
+            raise serializers.ValidationError(str(e))
     
     def create(self, validated_data):
         # Remove created_by_email from validated_data as it's not a model field
@@ -62,3 +83,9 @@ class SiteGeoJSONSerializer(serializers.ModelSerializer):
             'geometry': instance.geometry,
             'properties': self.get_properties(instance)
         }
+
+def site_topojson(sites):
+    """TopoJSON Topology of sites, with boundaries shared by adjacent sites stored once"""
+    properties = SiteGeoJSONSerializer().get_properties
+    topology = Topology((site.id, site.geometry, properties(site)) for site in sites)
+    return topology.to_topojson('sites')
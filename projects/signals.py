@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_project_version, bump_sites_version
+from .models import Project, Site, Tombstone
+from . import spatial_index
+from .overlaps import check_site_overlaps
+from . import footprint
+
+
+def _bump_after_commit(project_id):
+    transaction.on_commit(lambda: bump_project_version(project_id))
+
+
+def _spatially_unchanged(instance, created=False):
+    """True when a site save kept both its geometry hash and its project."""
+    if created or getattr(instance, '_geometry_changed', True):
+        return False
+    previous = getattr(instance, '_previous_project_id', None)
+    return previous is None or previous == instance.project_id
+
+
+@receiver(pre_save, sender=Site)
+def remember_previous_project(sender, instance, **kwargs):
+    instance._previous_project_id = None
+    if instance.pk:
+        instance._previous_project_id = (
+            Site.objects.filter(pk=instance.pk).values_list('project_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_site_caches(sender, instance, created=False, **kwargs):
+    # Site lists carry names and descriptions, so the project version always moves.
+    if kwargs['signal'] is post_delete or not _spatially_unchanged(instance, created):
+        transaction.on_commit(bump_sites_version)
+    _bump_after_commit(instance.project_id)
+    previous = getattr(instance, '_previous_project_id', None)
+    if previous and previous != instance.project_id:
+        _bump_after_commit(previous)
+
+
+@receiver(post_save, sender=Site)
+def update_site_index(sender, instance, created, raw=False, **kwargs):
+    if raw or _spatially_unchanged(instance, created):
+        return
+    site_id, project_id, geometry = instance.pk, instance.project_id, instance.geometry
+    transaction.on_commit(lambda: spatial_index.apply_change(site_id, project_id, geometry))
+
+
+@receiver(post_save, sender=Site)
+def recheck_site_overlaps(sender, instance, created, raw=False, **kwargs):
+    if raw or _spatially_unchanged(instance, created):
+        return
+    site_id = instance.pk
+    transaction.on_commit(lambda: check_site_overlaps(site_id))
+
+
+@receiver(post_delete, sender=Site)
+def remove_site_from_index(sender, instance, **kwargs):
+    site_id = instance.pk
+    transaction.on_commit(lambda: spatial_index.apply_change(site_id))
+
+
+@receiver(post_save, sender=Site)
+def grow_project_footprints(sender, instance, created, raw=False, **kwargs):
+    if raw or _spatially_unchanged(instance, created):
+        return
+    previous = getattr(instance, '_previous_project_id', None)
+    moved = bool(previous) and previous != instance.project_id
+    footprint.site_added(instance.project_id, instance.pk, new_to_project=created or moved)
+    if moved:
+        footprint.site_removed(previous, instance.pk, instance.geometry, instance.area)
+
+
+@receiver(post_delete, sender=Site)
+def shrink_project_footprint(sender, instance, origin=None, **kwargs):
+    # Sites removed with their project leave no footprint to update.
+    if cascaded_from(origin, Site):
+        return
+    footprint.site_removed(instance.project_id, instance.pk, instance.geometry, instance.area)
+
+
+@receiver(post_save, sender=Project)
+def invalidate_project_caches(sender, instance, created, **kwargs):
+    if not created:
+        _bump_after_commit(instance.pk)
+
+
+def cascaded_from(origin, model):
+    """True when a delete was started on a parent of ``model`` rather than on it."""
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not model
+
+
+@receiver(post_delete, sender=Project)
+def record_project_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model='project', object_id=instance.pk, project_id=instance.pk, owner_id=instance.created_by_id,
+    )
+
+
+@receiver(post_delete, sender=Site)
+def record_site_tombstone(sender, instance, origin=None, **kwargs):
+    # The project's own tombstone already covers sites removed with it.
+    if cascaded_from(origin, Site):
+        return
+    Tombstone.objects.create(model='site', object_id=instance.pk, project_id=instance.project_id, site_id=instance.pk)
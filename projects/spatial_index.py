@@ -0,0 +1,199 @@
+"""
+In-memory point-in-polygon index over every site.
+
+Site bounding boxes are bucketed into a uniform grid of
+``SITE_LOCATE_CELL_DEGREES`` cells. A lookup only ray-casts the polygons
+registered in the cell that holds the point, and the ray-casting runs through
+NumPy over all of a polygon's edges, and for batches over every point in the
+cell, at once. The index is built once per process, updated in place by Site
+signals and rebuilt when the shared sites version shows a write from another
+worker.
+"""
+
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .caching import get_sites_version
+from .geometry import bounding_box, polygons
+
+# Sites spanning more cells than this are checked for every lookup instead of
+# being copied into each cell.
+MAX_CELLS_PER_SITE = 256
+
+_index = None
+_lock = threading.Lock()
+
+
+def _edges(geometry):
+    """All ring edges of a geometry as four float arrays (x0, y0, x1, y1)."""
+    starts = []
+    ends = []
+    for polygon in polygons(geometry):
+        for ring in polygon:
+            if len(ring) < 2:
+                continue
+            points = [(p[0], p[1]) for p in ring]
+            if points[0] != points[-1]:
+                points.append(points[0])
+            starts.extend(points[:-1])
+            ends.extend(points[1:])
+    if not starts:
+        return None
+    a = np.asarray(starts, dtype=np.float64)
+    b = np.asarray(ends, dtype=np.float64)
+    return a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+
+
+def contains(edges, xs, ys):
+    """
+    Even-odd ray casting of many points against one polygon's edges.
+
+    ``xs``/``ys`` are 1-d arrays; returns a boolean array. Holes and the parts
+    of a MultiPolygon are handled by the even-odd rule over all edges.
+    """
+    x0, y0, x1, y1 = edges
+    px = xs[:, None]
+    py = ys[:, None]
+    straddles = (y0 > py) != (y1 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+    crossings = straddles & (px < crossing_x)
+    return (np.count_nonzero(crossings, axis=1) % 2) == 1
+
+
+class SiteIndex:
+    def __init__(self, cell=None):
+        self.cell = cell or settings.SITE_LOCATE_CELL_DEGREES
+        self.grid = {}
+        self.large = set()
+        self.sites = {}
+        self.version = None
+
+    def _cell_range(self, bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return (
+            math.floor(min_lon / self.cell), math.floor(min_lat / self.cell),
+            math.floor(max_lon / self.cell), math.floor(max_lat / self.cell),
+        )
+
+    def add(self, site_id, project_id, geometry):
+        self.remove(site_id)
+        bbox = bounding_box(geometry)
+        edges = _edges(geometry)
+        if bbox is None or edges is None:
+            return
+        cells = self._cell_range(bbox)
+        self.sites[site_id] = (project_id, bbox, edges, cells)
+        cx0, cy0, cx1, cy1 = cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_SITE:
+            self.large.add(site_id)
+            return
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.grid.setdefault((cx, cy), set()).add(site_id)
+
+    def remove(self, site_id):
+        entry = self.sites.pop(site_id, None)
+        if entry is None:
+            return
+        if site_id in self.large:
+            self.large.discard(site_id)
+            return
+        cx0, cy0, cx1, cy1 = entry[3]
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                members = self.grid.get((cx, cy))
+                if members is not None:
+                    members.discard(site_id)
+                    if not members:
+                        del self.grid[(cx, cy)]
+
+    def _candidates(self, key, project_ids):
+        members = self.grid.get(key, ())
+        for site_id in list(members) + list(self.large):
+            entry = self.sites.get(site_id)
+            if entry is not None and (project_ids is None or entry[0] in project_ids):
+                yield site_id, entry
+
+    def locate(self, lon, lat, project_ids=None):
+        """Return ``[(site_id, project_id)]`` of sites containing the point."""
+        return self.locate_many([(lon, lat)], project_ids)[0]
+
+    def locate_many(self, points, project_ids=None):
+        """Locate many ``(lon, lat)`` points; returns one match list per point."""
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        results = [[] for _ in range(len(coords))]
+        keys = np.floor(coords / self.cell).astype(np.int64)
+
+        groups = {}
+        for i, key in enumerate(map(tuple, keys.tolist())):
+            groups.setdefault(key, []).append(i)
+
+        for key, members in groups.items():
+            members = np.asarray(members)
+            xs = coords[members, 0]
+            ys = coords[members, 1]
+            for site_id, entry in self._candidates(key, project_ids):
+                project_id, (min_lon, min_lat, max_lon, max_lat), edges, _ = entry
+                in_box = (xs >= min_lon) & (xs <= max_lon) & (ys >= min_lat) & (ys <= max_lat)
+                if not in_box.any():
+                    continue
+                hits = np.zeros(len(members), dtype=bool)
+                hits[in_box] = contains(edges, xs[in_box], ys[in_box])
+                for i in members[hits]:
+                    results[i].append((site_id, project_id))
+        return results
+
+
+def build_index():
+    from .models import Site
+
+    index = SiteIndex()
+    rows = Site.objects.values_list('id', 'project_id', 'geometry')
+    for site_id, project_id, geometry in rows.iterator(chunk_size=2000):
+        index.add(site_id, project_id, geometry)
+    return index
+
+
+def get_index():
+    global _index
+    version = get_sites_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            index = build_index()
+            index.version = version
+            _index = index
+    return _index
+
+
+def apply_change(site_id, project_id=None, geometry=None):
+    """
+    Update the loaded index in place after a committed site write or delete.
+
+    The write's own version bump runs first, so the shared version is then
+    exactly one past the loaded one. Anything else means another process
+    wrote as well, and its change is not in this index: drop it and rebuild
+    on the next lookup.
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            return
+        version = get_sites_version()
+        if version == _index.version:
+            # Loaded after this write committed; it already has the change.
+            return
+        if version != _index.version + 1:
+            _index = None
+            return
+        if geometry is None:
+            _index.remove(site_id)
+        else:
+            _index.add(site_id, project_id, geometry)
+        _index.version = version
@@ -0,0 +1,33 @@
+from jobs.queue import job, report_progress
+
+from .deletion import delete_project
+from .footprint import refresh_project_footprint
+from .normalization import normalize_sites
+from .overlaps import detect_project_overlaps
+
+
+@job('projects.refresh_footprint')
+def refresh_footprint(project_id):
+    refresh_project_footprint(project_id)
+
+
+@job('projects.detect_overlaps')
+def detect_overlaps(project_id):
+    return {'overlaps': detect_project_overlaps(project_id)}
+
+
+@job('projects.normalize_site_geometry')
+def normalize_site_geometry(project_id=None, batch_size=500):
+    """Backfill geometry normalization for a project's sites, or all of them."""
+    def progress(done, total):
+        report_progress(done, total, f'{done}/{total} sites')
+
+    return normalize_sites(project_id, batch_size, on_progress=progress)
+
+
+@job('projects.delete_project')
+def delete_project_job(project_id):
+    def progress(done, total):
+        report_progress(done, total, f'{done}/{total} sites deleted')
+
+    return {'sites': delete_project(project_id, on_progress=progress)}
@@ -1,3 +1,826 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from stats.models import SiteAnalytics
+
+from . import caching, spatial_index
+from .caching import bump_sites_version, choose_encoding, get_project_version
+from .deletion import delete_project
+from .export import project_archive, streaming_content
+from .footprint import dissolve, refresh_project_footprint
+from .geometry import hash_geometry, polygons, ring_signed_area
+from .models import Project, Site, SiteOverlap, Tombstone
+from .normalization import normalize_sites
+from .overlaps import detect_project_overlaps, intersection_area
+from .search import ensure_search_index, matches, search
+from .topology import Topology
+
+User = get_user_model()
+
+
+def square(x, y, size=0.01):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+def rectangle(x0, y0, x1, y1):
+    return {'type': 'Polygon', 'coordinates': [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]}
+
+
+def area(geometry):
+    """Planar area in square degrees, holes subtracted."""
+    return sum(sum(ring_signed_area(ring) for ring in polygon) for polygon in polygons(geometry))
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        other = User.objects.create_user(email='b@x.io', username='b', password='p')
+        Project.objects.create(name='Other', created_by=other)
+
+    def changes(self, since=None, **params):
+        params = {'user_email': 'a@x.io', **params}
+        if since:
+            params['since'] = since
+        return self.client.get('/api/changes/', params)
+
+    def add_site(self, name, x=0):
+        return Site.objects.create(project=self.project, name=name, geometry=square(x, 0), created_by=self.user)
+
+    @override_settings(CHANGE_FEED_LOOKBACK_SECONDS=0)
+    def test_resuming_from_the_cursor_returns_only_later_changes(self):
+        site = self.add_site('a')
+        first = self.changes().json()
+        self.assertEqual([project['name'] for project in first['projects']], ['P'])
+        self.assertEqual([feature['id'] for feature in first['sites']], [site.id])
+        self.assertFalse(first['has_more'])
+
+        empty = self.changes(first['cursor']).json()
+        self.assertEqual((empty['projects'], empty['sites'], empty['deleted']), ([], [], []))
+
+        site.name = 'renamed'
+        site.save()
+        later = self.changes(first['cursor']).json()
+        self.assertEqual([feature['id'] for feature in later['sites']], [site.id])
+        self.assertEqual(later['projects'], [])
+
+    @override_settings(CHANGE_FEED_LOOKBACK_SECONDS=60)
+    def test_rows_committed_late_behind_the_cursor_are_returned(self):
+        early = self.add_site('early')
+        Site.objects.filter(pk=early.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        first = self.changes().json()
+        self.assertLessEqual(first['cursor'], (timezone.now() - timedelta(seconds=60)).isoformat())
+
+        # Saved before the first read but committed after it.
+        late = self.add_site('late')
+        Site.objects.filter(pk=late.pk).update(updated_at=timezone.now() - timedelta(seconds=30))
+        later = self.changes(first['cursor']).json()
+        self.assertEqual([feature['id'] for feature in later['sites']], [late.id])
+
+    def test_pages_never_split_rows_sharing_a_timestamp(self):
+        sites = [self.add_site(f's{i}', i) for i in range(5)]
+        stamp = timezone.now() - timedelta(minutes=1)
+        Site.objects.filter(pk__in=[site.pk for site in sites[:3]]).update(updated_at=stamp)
+        Site.objects.filter(pk__in=[site.pk for site in sites[3:]]).update(updated_at=stamp + timedelta(seconds=1))
+
+        page = self.changes(limit=2).json()
+        self.assertTrue(page['has_more'])
+        self.assertEqual([feature['id'] for feature in page['sites']], [site.id for site in sites[:3]])
+
+        seen = {feature['id'] for feature in page['sites']}
+        while page['has_more']:
+            page = self.changes(page['cursor'], limit=2).json()
+            seen |= {feature['id'] for feature in page['sites']}
+        self.assertEqual(seen, {site.id for site in sites})
+
+    def test_deletions_are_reported_as_tombstones(self):
+        site = self.add_site('gone')
+        cursor = self.changes().json()['cursor']
+        site_id = site.id
+        site.delete()
+        deleted = self.changes(cursor).json()['deleted']
+        self.assertEqual([(row['model'], row['id']) for row in deleted], [('site', site_id)])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        self.assertEqual(self.changes('yesterday').status_code, 400)
+        expired = (timezone.now() - timedelta(days=365)).isoformat()
+        response = self.changes(expired)
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['full_resync_required'])
+        self.assertEqual(self.client.get('/api/changes/').status_code, 400)
+
+
+class DissolveTests(TestCase):
+    def dissolve(self, *geometries):
+        return dissolve(list(geometries), tolerance=0)
+
+    def test_adjacent_sites_merge(self):
+        footprint = self.dissolve(rectangle(0, 0, 1, 1), rectangle(1, 0, 2, 1))
+        self.assertEqual(footprint, {'type': 'Polygon', 'coordinates': [[[2, 0], [2, 1], [0, 1], [0, 0], [2, 0]]]})
+
+    def test_overlapping_and_contained_sites_merge(self):
+        overlapping = self.dissolve(rectangle(0, 0, 2, 2), rectangle(1, 1, 3, 3))
+        self.assertEqual(overlapping['type'], 'Polygon')
+        self.assertAlmostEqual(area(overlapping), 7)
+
+        contained = self.dissolve(rectangle(0, 0, 4, 4), rectangle(1, 1, 2, 2))
+        self.assertEqual(contained, self.dissolve(rectangle(0, 0, 4, 4)))
+
+    def test_t_junction_neighbours_merge(self):
+        footprint = self.dissolve(rectangle(0, 0, 1, 2), rectangle(1, 0, 2, 1))
+        self.assertEqual(footprint['type'], 'Polygon')
+        self.assertEqual(len(footprint['coordinates'][0]), 7)
+        self.assertAlmostEqual(area(footprint), 3)
+
+    def test_enclosed_gap_becomes_a_hole(self):
+        footprint = self.dissolve(
+            rectangle(0, 0, 3, 1), rectangle(0, 2, 3, 3), rectangle(0, 1, 1, 2), rectangle(2, 1, 3, 2)
+        )
+        self.assertEqual(footprint['type'], 'Polygon')
+        self.assertEqual(len(footprint['coordinates']), 2)
+        self.assertAlmostEqual(area(footprint), 8)
+
+    def test_separate_and_corner_touching_sites_stay_apart(self):
+        self.assertEqual(len(self.dissolve(rectangle(0, 0, 1, 1), rectangle(3, 3, 4, 4))['coordinates']), 2)
+        corner = self.dissolve(rectangle(0, 0, 1, 1), rectangle(1, 1, 2, 2))
+        self.assertEqual(corner['type'], 'MultiPolygon')
+        self.assertEqual(len(corner['coordinates']), 2)
+
+    def test_vertices_keep_their_stored_coordinates(self):
+        footprint = self.dissolve(rectangle(0.1234567, 0, 1.0000001, 1))
+        self.assertEqual(
+            sorted(tuple(point) for point in footprint['coordinates'][0][:-1]),
+            [(0.1234567, 0), (0.1234567, 1), (1.0000001, 0), (1.0000001, 1)],
+        )
+
+    def test_nothing_to_dissolve(self):
+        self.assertIsNone(dissolve([]))
+        self.assertIsNone(dissolve([{'type': 'Point', 'coordinates': [0, 0]}]))
+
+    def test_refresh_moves_project_updated_at(self):
+        user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        project = Project.objects.create(name='P', created_by=user)
+        Site.objects.create(project=project, name='s', geometry=square(0, 0), created_by=user)
+        Project.objects.filter(pk=project.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        before = Project.objects.get(pk=project.pk).updated_at
+
+        refresh_project_footprint(project.pk)
+        project.refresh_from_db()
+        self.assertGreater(project.updated_at, before)
+        self.assertEqual(project.footprint['type'], 'Polygon')
+        self.assertGreater(project.total_area, 0)
+
+
+class FootprintMaintenanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+
+    def add_site(self, name, geometry, project=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Site.objects.create(
+                project=project or self.project, name=name, geometry=geometry, created_by=self.user
+            )
+
+    def test_added_sites_grow_the_footprint_without_a_job(self):
+        self.add_site('a', rectangle(0, 0, 1, 1))
+        self.add_site('b', rectangle(1, 0, 2, 1))
+        self.project.refresh_from_db()
+        self.assertAlmostEqual(area(self.project.footprint), 2)
+        self.assertEqual(len(self.project.footprint['coordinates']), 1)
+        self.assertEqual((self.project.min_lon, self.project.max_lon), (0, 2))
+        self.assertAlmostEqual(self.project.centroid_lon, 1)
+        self.assertAlmostEqual(self.project.centroid_lat, 0.5)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=False, PROJECT_FOOTPRINT_REFRESH_DELAY=60)
+    def test_removals_and_reshapes_queue_one_delayed_refresh(self):
+        a = self.add_site('a', rectangle(0, 0, 1, 1))
+        b = self.add_site('b', rectangle(2, 0, 3, 1))
+        c = self.add_site('c', rectangle(4, 0, 5, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+            b.geometry = rectangle(2, 0, 3, 2)
+            b.save()
+        self.project.refresh_from_db()
+        self.assertAlmostEqual(self.project.total_area, b.area + c.area)
+        self.assertEqual(self.project.min_lon, 2)
+        self.assertAlmostEqual(self.project.centroid_lon, 3.5)
+
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args, job.key), ('projects.refresh_footprint', [self.project.pk],
+                                                        f'footprint:{self.project.pk}'))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=30))
+
+        refresh_project_footprint(self.project.pk)
+        self.project.refresh_from_db()
+        self.assertAlmostEqual(area(self.project.footprint), 3)
+        self.assertAlmostEqual(self.project.centroid_lat, (2 * 1 + 1 * 0.5) / 3)
+
+    @override_settings(JOBS_EAGER=False)
+    def test_moving_a_site_updates_both_projects(self):
+        other = Project.objects.create(name='Q', created_by=self.user)
+        self.add_site('a', rectangle(0, 0, 1, 1))
+        site = self.add_site('b', rectangle(1, 0, 2, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            site.project = other
+            site.save()
+
+        other.refresh_from_db()
+        self.assertEqual(other.footprint['type'], 'Polygon')
+        self.assertAlmostEqual(area(other.footprint), 1)
+        self.project.refresh_from_db()
+        self.assertAlmostEqual(self.project.total_area, Site.objects.get(name='a').area)
+        self.assertEqual(self.project.max_lon, 1)
+        self.assertAlmostEqual(self.project.centroid_lon, 0.5)
+        self.assertEqual(list(Job.objects.values_list('key', flat=True)), [f'footprint:{self.project.pk}'])
+
+    def test_refresh_command_fills_missing_footprints(self):
+        self.add_site('a', rectangle(0, 0, 1, 1))
+        Project.objects.filter(pk=self.project.pk).update(footprint=None)
+        version = get_project_version(self.project.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('refresh_footprints', '--project', str(self.project.pk), stdout=StringIO())
+        self.project.refresh_from_db()
+        self.assertAlmostEqual(area(self.project.footprint), 1)
+        # Cached project payloads carry the footprint.
+        self.assertNotEqual(get_project_version(self.project.pk), version)
+
+
+def decode_topojson(topology):
+    """Features of an encoded topology as ``{id: GeoJSON geometry}``."""
+    (sx, sy), (tx, ty) = topology['transform']['scale'], topology['transform']['translate']
+    arcs = []
+    for encoded in topology['arcs']:
+        x = y = 0
+        points = []
+        for dx, dy in encoded:
+            x, y = x + dx, y + dy
+            points.append([x * sx + tx, y * sy + ty])
+        arcs.append(points)
+
+    def ring(refs):
+        points = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            points.extend(arc if not points else arc[1:])
+        return points
+
+    features = {}
+    for geometry in topology['objects']['sites']['geometries']:
+        parts = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        coordinates = [[ring(refs) for refs in polygon] for polygon in parts]
+        if geometry['type'] == 'Polygon':
+            coordinates = coordinates[0]
+        features[geometry['id']] = {'type': geometry['type'], 'coordinates': coordinates}
+    return features
+
+
+class TopologyTests(TestCase):
+    def encode(self, *geometries):
+        return Topology(((i, geometry, {'n': i}) for i, geometry in enumerate(geometries)), quantization=201)
+
+    def assertSameRing(self, ring, expected):
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual(len(ring), len(expected))
+        # Rings may start at any vertex but keep their orientation.
+        start = [tuple(point) for point in expected[:-1]].index(tuple(ring[0]))
+        rotated = expected[start:-1] + expected[:start + 1]
+        for point, want in zip(ring, rotated):
+            self.assertAlmostEqual(point[0], want[0])
+            self.assertAlmostEqual(point[1], want[1])
+
+    def test_round_trip_restores_every_ring(self):
+        holed = rectangle(0, 0, 2, 2)
+        holed['coordinates'].append([[0.5, 0.5], [0.5, 1.5], [1.5, 1.5], [1.5, 0.5], [0.5, 0.5]])
+        multi = {'type': 'MultiPolygon', 'coordinates': [rectangle(3, 0, 4, 1)['coordinates'],
+                                                         rectangle(3, 1.5, 4, 2)['coordinates']]}
+        encoded = self.encode(holed, multi).to_topojson()
+        self.assertEqual([g['properties'] for g in encoded['objects']['sites']['geometries']], [{'n': 0}, {'n': 1}])
+
+        decoded = decode_topojson(encoded)
+        self.assertEqual(decoded[0]['type'], 'Polygon')
+        for ring, expected in zip(decoded[0]['coordinates'], holed['coordinates']):
+            self.assertSameRing(ring, expected)
+        self.assertEqual(decoded[1]['type'], 'MultiPolygon')
+        for polygon, expected in zip(decoded[1]['coordinates'], multi['coordinates']):
+            self.assertSameRing(polygon[0], expected[0])
+
+    def test_shared_edges_are_stored_once(self):
+        left, right = rectangle(0, 0, 1, 1), rectangle(1, 0, 2, 1)
+        topology = self.encode(left, right)
+        # Two outer arcs and the shared edge, which both features reference.
+        self.assertEqual(len(topology.arcs), 3)
+        self.assertEqual(sorted(topology.arc_uses), [1, 1, 2])
+        shared = topology.arc_uses.index(2)
+        refs = [ref for _, polys, _ in topology.features for ref in polys[0][0]]
+        self.assertIn(shared, refs)
+        self.assertIn(~shared, refs)
+
+        decoded = decode_topojson(topology.to_topojson())
+        self.assertSameRing(decoded[0]['coordinates'][0], left['coordinates'][0])
+        self.assertSameRing(decoded[1]['coordinates'][0], right['coordinates'][0])
+
+    def test_identical_rings_share_one_arc(self):
+        topology = self.encode(square(0, 0, 1), square(0, 0, 1))
+        self.assertEqual((len(topology.arcs), topology.arc_uses), (1, [2]))
+        self.assertEqual(topology.features[0][1], topology.features[1][1])
+
+
+class OverlapTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+
+    def add_site(self, name, geometry):
+        return Site.objects.create(project=self.project, name=name, geometry=geometry, created_by=self.user)
+
+    def test_intersection_area(self):
+        full = intersection_area(square(0, 0), square(0, 0))
+        quarter = intersection_area(square(0, 0), square(0.005, 0.005))
+        self.assertGreater(full, 0)
+        self.assertAlmostEqual(quarter / full, 0.25, places=3)
+        self.assertAlmostEqual(intersection_area(square(0, 0), square(0.01, 0)), 0)
+        self.assertEqual(intersection_area(square(0, 0), square(1, 1)), 0)
+
+    def test_detection_stores_overlapping_pairs_only(self):
+        a = self.add_site('a', square(0, 0))
+        b = self.add_site('b', square(0.005, 0.005))
+        self.add_site('neighbour', square(0.02, 0))
+
+        self.assertEqual(detect_project_overlaps(self.project.id), 1)
+        overlap = SiteOverlap.objects.get()
+        self.assertEqual((overlap.site_a_id, overlap.site_b_id), (a.id, b.id))
+        self.assertAlmostEqual(overlap.area, intersection_area(a.geometry, b.geometry))
+
+    def test_reading_overlaps_does_not_queue_work(self):
+        self.add_site('a', square(0, 0))
+        self.add_site('b', square(0.005, 0.005))
+        url = f'/api/projects/{self.project.id}/overlaps/'
+
+        response = self.client.get(url, {'user_email': 'a@x.io', 'refresh': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Job.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{url}refresh/?user_email=a@x.io')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Job.objects.get().pk, response.json()['job'])
+        self.assertEqual(self.client.get(url, {'user_email': 'a@x.io'}).json()['count'], 1)
+        self.assertEqual(self.client.get(f'{url}refresh/?user_email=a@x.io').status_code, 405)
+
+
+class GeometryHashTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+
+    def add_site(self, name, geometry, project=None):
+        return Site.objects.create(
+            project=project or self.project, name=name, geometry=geometry, created_by=self.user
+        )
+
+    def test_hash_ignores_vertex_order_and_orientation(self):
+        ring = square(0, 0)['coordinates'][0]
+        rotated = ring[2:-1] + ring[:3]
+        reversed_ring = ring[::-1]
+        sites = [
+            self.add_site('a', square(0, 0)),
+            self.add_site('rotated', {'type': 'Polygon', 'coordinates': [rotated]}),
+            self.add_site('reversed', {'type': 'Polygon', 'coordinates': [reversed_ring]}),
+        ]
+        self.assertEqual(len({site.geometry_hash for site in sites}), 1)
+        self.assertNotEqual(self.add_site('moved', square(1, 0)).geometry_hash, sites[0].geometry_hash)
+
+    def test_hash_ignores_polygon_order(self):
+        a, b = square(0, 0)['coordinates'], square(1, 1)['coordinates']
+        self.assertEqual(
+            hash_geometry({'type': 'MultiPolygon', 'coordinates': [a, b]}),
+            hash_geometry({'type': 'MultiPolygon', 'coordinates': [b, a]}),
+        )
+        self.assertEqual(hash_geometry(None), '')
+
+    def test_renaming_keeps_derived_geometry_fields(self):
+        site = self.add_site('a', square(0, 0))
+        derived = (site.geometry_hash, site.area, site.min_lon, site.min_lat, site.max_lon, site.max_lat)
+
+        site = Site.objects.get(pk=site.pk)
+        site.name = 'renamed'
+        site.save()
+        self.assertFalse(site._geometry_changed)
+        site.refresh_from_db()
+        self.assertEqual(
+            (site.geometry_hash, site.area, site.min_lon, site.min_lat, site.max_lon, site.max_lat), derived
+        )
+
+        site.geometry = square(1, 0)
+        site.save()
+        self.assertTrue(site._geometry_changed)
+        self.assertNotEqual(site.geometry_hash, derived[0])
+        self.assertEqual(site.min_lon, 1)
+
+    def test_area_covers_every_polygon_minus_holes(self):
+        holed = rectangle(0, 0, 3, 3)
+        holed['coordinates'].append([[1, 1], [1, 2], [2, 2], [2, 1], [1, 1]])
+        geometry = {'type': 'MultiPolygon', 'coordinates': [holed['coordinates'], rectangle(5, 0, 6, 1)['coordinates']]}
+        site = self.add_site('multi', geometry)
+        self.assertAlmostEqual(site.area, 9 * 111320 * 111320)
+
+    def test_duplicate_endpoints_group_identical_sites(self):
+        other_project = Project.objects.create(name='Q', created_by=self.user)
+        a = self.add_site('a', square(0, 0))
+        reversed_square = {'type': 'Polygon', 'coordinates': [square(0, 0)['coordinates'][0][::-1]]}
+        b = self.add_site('b', reversed_square, other_project)
+        self.add_site('unique', square(1, 0))
+        stranger = User.objects.create_user(email='b@x.io', username='b', password='p')
+        Site.objects.create(
+            project=Project.objects.create(name='Theirs', created_by=stranger),
+            name='theirs', geometry=square(0, 0), created_by=stranger,
+        )
+
+        body = self.client.get('/api/sites/duplicates/', {'user_email': 'a@x.io'}).json()
+        self.assertEqual(body['count'], 1)
+        group = body['groups'][0]
+        self.assertEqual((group['geometry_hash'], group['count']), (a.geometry_hash, 2))
+        self.assertEqual(
+            group['sites'],
+            [
+                {'site': a.id, 'project': self.project.id, 'name': 'a'},
+                {'site': b.id, 'project': other_project.id, 'name': 'b'},
+            ],
+        )
+        within = self.client.get('/api/sites/duplicates/', {'user_email': 'a@x.io', 'project': self.project.id})
+        self.assertEqual(within.json()['count'], 0)
+        self.assertEqual(self.client.get('/api/sites/duplicates/').json()['count'], 0)
+
+        detail = self.client.get(f'/api/sites/{a.id}/duplicates/', {'user_email': 'a@x.io'}).json()
+        self.assertEqual(detail['sites'], [{'site': b.id, 'project': other_project.id, 'name': 'b'}])
+
+
+class NormalizeSitesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+        # A legacy row: raw coordinates, a duplicate vertex and no derived fields.
+        legacy = [[0.123456789, 0], [0.2, 0], [0.2, 0], [0.2, 0.1], [0.123456789, 0.1], [0.123456789, 0]]
+        stamp = timezone.now() - timedelta(days=1)
+        Site.objects.filter(pk=self.site.pk).update(
+            geometry={'type': 'Polygon', 'coordinates': [legacy]}, geometry_hash='', area=None,
+            min_lon=None, min_lat=None, max_lon=None, max_lat=None, updated_at=stamp,
+        )
+        self.stamp = stamp
+
+    @override_settings(JOBS_EAGER=False)
+    def test_stale_rows_are_rewritten_through_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = normalize_sites()
+        self.assertEqual((stats['sites'], stats['updated'], stats['invalid']), (1, 1, 0))
+        self.assertLess(stats['bytes_after'], stats['bytes_before'])
+
+        site = Site.objects.get(pk=self.site.pk)
+        self.assertEqual(len(site.geometry['coordinates'][0]), 5)
+        self.assertEqual(site.min_lon, 0.1234568)
+        self.assertEqual(site.geometry_hash, hash_geometry(site.geometry))
+        self.assertAlmostEqual(site.area, site.calculate_area())
+        self.assertGreater(site.updated_at, self.stamp)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).min_lon, 0.1234568)
+
+        self.assertEqual(normalize_sites()['updated'], 0)
+
+    @override_settings(JOBS_EAGER=False)
+    def test_command_can_queue_the_backfill(self):
+        call_command('normalize_site_geometry', '--background', '--project', str(self.project.pk), stdout=StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args), ('projects.normalize_site_geometry', [self.project.pk, 500]))
+
+    def test_dry_run_writes_nothing(self):
+        self.assertEqual(normalize_sites(dry_run=True)['updated'], 1)
+        self.assertEqual(Site.objects.get(pk=self.site.pk).geometry_hash, '')
+
+
+class SiteAdminTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(email='admin@x.io', username='admin', password='p')
+        self.client.force_login(self.user)
+        project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=project, name='s', geometry=square(0, 0), created_by=self.user)
+        self.url = f'/admin/projects/site/{self.site.pk}/change/'
+
+    def test_full_geometry_is_loaded_on_demand(self):
+        page = self.client.get(self.url).content.decode()
+        self.assertIn('Polygon: 1 polygon(s), 5 vertices', page)
+        self.assertIn('?edit_geometry=1', page)
+        self.assertNotIn('name="geometry"', page)
+
+        page = self.client.get(self.url, {'edit_geometry': 1}).content.decode()
+        self.assertIn('name="geometry"', page)
+
+    def test_saving_without_the_geometry_keeps_it(self):
+        data = {'project': self.site.project_id, 'name': 'renamed', 'description': '', 'created_by': self.user.pk}
+        self.assertEqual(self.client.post(self.url, data).status_code, 302)
+        self.site.refresh_from_db()
+        self.assertEqual((self.site.name, self.site.geometry), ('renamed', square(0, 0)))
+
+
+class SiteIndexTests(TestCase):
+    def test_grid_lookup(self):
+        index = spatial_index.SiteIndex(cell=1.0)
+        holed = rectangle(0, 0, 3, 3)
+        holed['coordinates'].append([[1, 1], [1, 2], [2, 2], [2, 1], [1, 1]])
+        index.add(1, 10, holed)
+        index.add(2, 20, rectangle(2.5, 2.5, 4, 4))
+        self.assertEqual(len(index.grid[(0, 0)]), 1)
+        self.assertEqual(index.grid[(3, 3)], {1, 2})
+
+        self.assertEqual(index.locate(0.5, 0.5), [(1, 10)])
+        self.assertEqual(index.locate(1.5, 1.5), [])  # In the hole
+        self.assertEqual(sorted(index.locate(2.7, 2.7)), [(1, 10), (2, 20)])
+        self.assertEqual(index.locate(2.7, 2.7, project_ids={20}), [(2, 20)])
+        self.assertEqual(index.locate_many([(0.5, 0.5), (3.5, 3.5), (9, 9)]), [[(1, 10)], [(2, 20)], []])
+
+        index.remove(1)
+        self.assertEqual(index.locate(0.5, 0.5), [])
+        self.assertNotIn((0, 0), index.grid)
+
+    def test_sites_spanning_many_cells_are_checked_everywhere(self):
+        index = spatial_index.SiteIndex(cell=0.01)
+        index.add(1, 10, rectangle(0, 0, 1, 1))
+        self.assertEqual((index.large, index.grid), ({1}, {}))
+        self.assertEqual(index.locate(0.5, 0.5), [(1, 10)])
+        index.remove(1)
+        self.assertEqual((index.large, index.locate(0.5, 0.5)), (set(), []))
+
+
+class SiteIndexMaintenanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        spatial_index._index = None
+        self.addCleanup(setattr, spatial_index, '_index', None)
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.first = self.add_site('a', square(0, 0))
+
+    def add_site(self, name, geometry):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Site.objects.create(project=self.project, name=name, geometry=geometry, created_by=self.user)
+
+    def test_own_writes_update_the_loaded_index_in_place(self):
+        index = spatial_index.get_index()
+        self.assertEqual(index.locate(0.005, 0.005), [(self.first.pk, self.project.pk)])
+
+        second = self.add_site('b', square(1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete()
+        self.assertIs(spatial_index.get_index(), index)
+        self.assertEqual(index.locate(1.005, 1.005), [(second.pk, self.project.pk)])
+        self.assertEqual(index.locate(0.005, 0.005), [])
+
+    def test_writes_from_other_processes_force_a_rebuild(self):
+        index = spatial_index.get_index()
+        # Another worker wrote a site this process never saw.
+        other = Site.objects.create(project=self.project, name='b', geometry=square(1, 1), created_by=self.user)
+        bump_sites_version()
+
+        second = self.add_site('c', square(2, 2))
+        self.assertIsNone(spatial_index._index)
+        rebuilt = spatial_index.get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.locate(1.005, 1.005), [(other.pk, self.project.pk)])
+        self.assertEqual(rebuilt.locate(2.005, 2.005), [(second.pk, self.project.pk)])
+
+
+class LocateTests(TestCase):
+    def test_non_numeric_project_is_rejected(self):
+        params = {'lon': 0, 'lat': 0, 'user_email': 'a@x.io', 'project': 'abc'}
+        self.assertEqual(self.client.get('/api/sites/locate/', params).status_code, 400)
+
+
+class ProjectDeletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='Doomed', created_by=self.user)
+        self.kept = Project.objects.create(name='Kept', created_by=self.user)
+        for i in range(5):
+            site = Site.objects.create(
+                project=self.project, name=f'alpha {i}', geometry=square(i, 0), created_by=self.user
+            )
+            SiteAnalytics.objects.create(site=site, date=timezone.now().date())
+        Site.objects.create(project=self.kept, name='alpha kept', geometry=square(0, 5), created_by=self.user)
+
+    def test_deletes_in_chunks_without_per_row_signals(self):
+        progress = []
+        removed = delete_project(self.project.pk, chunk_size=2, on_progress=lambda done, total: progress.append(done))
+        self.assertEqual((removed, progress), (5, [2, 4, 5]))
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertEqual(Site.objects.filter(project=self.project.pk).count(), 0)
+        self.assertEqual(SiteAnalytics.objects.count(), 0)
+        self.assertEqual(Site.objects.filter(project=self.kept).count(), 1)
+        # The project tombstone covers its sites.
+        self.assertEqual(list(Tombstone.objects.values_list('model', 'object_id')), [('project', self.project.pk)])
+        self.assertEqual(delete_project(self.project.pk), 0)
+
+    def test_search_index_forgets_deleted_rows(self):
+        self.assertEqual(len(search('alpha', 'a@x.io', kinds=('site',))), 6)
+        delete_project(self.project.pk, chunk_size=2)
+        self.assertEqual([result['name'] for result in search('alpha', 'a@x.io', kinds=('site',))], ['alpha kept'])
+        self.assertEqual(search('doomed', 'a@x.io'), [])
+
+
+class ProjectDestroyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+
+    def destroy(self):
+        return self.client.delete(f'/api/projects/{self.project.pk}/?user_email=a@x.io')
+
+    def test_eager_deletion_finishes_in_the_request(self):
+        self.assertEqual(self.destroy().status_code, 204)
+        self.assertFalse(Project.objects.exists())
+
+    @override_settings(JOBS_EAGER=False)
+    def test_queued_deletion_returns_the_job(self):
+        response = self.destroy()
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.json()['job'])
+        self.assertEqual((job.name, job.key), ('projects.delete_project', f'delete-project:{self.project.pk}'))
+        self.assertTrue(Project.objects.exists())
+        # Asking again while it is queued returns the same job.
+        self.assertEqual(self.destroy().json()['job'], job.pk)
+
+
+@override_settings(PROJECT_EXPORT_FLUSH_BYTES=256, PROJECT_EXPORT_CHUNK_SIZE=2)
+class ProjectExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='Export me', created_by=self.user)
+        for i in range(3):
+            site = Site.objects.create(
+                project=self.project, name=f's{i}', geometry=square(i, 0), created_by=self.user
+            )
+            SiteAnalytics.objects.bulk_create([
+                SiteAnalytics(site=site, date=date(2024, 1, 1) + timedelta(days=day), carbon_sequestered=day)
+                for day in range(4)
+            ])
+
+    def open_archive(self, content):
+        archive = zipfile.ZipFile(BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def test_archive_holds_metadata_sites_and_analytics(self):
+        response = self.client.get(f'/api/projects/{self.project.pk}/export.zip', {'user_email': 'a@x.io'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('project-', response['Content-Disposition'])
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+
+        archive = self.open_archive(b''.join(chunks))
+        self.assertEqual(archive.namelist(), ['project.json', 'sites.ndjson', 'analytics.csv'])
+        metadata = json.loads(archive.read('project.json'))
+        self.assertEqual((metadata['id'], metadata['created_by']), (self.project.pk, 'a@x.io'))
+
+        features = [json.loads(line) for line in archive.read('sites.ndjson').decode().splitlines()]
+        self.assertEqual([feature['properties']['name'] for feature in features], ['s0', 's1', 's2'])
+        self.assertEqual(features[0]['geometry'], square(0, 0))
+
+        rows = list(csv.reader(StringIO(archive.read('analytics.csv').decode())))
+        self.assertEqual(rows[0][:2], ['site_id', 'date'])
+        self.assertEqual(len(rows), 1 + 12)
+
+    def test_other_users_cannot_export(self):
+        url = f'/api/projects/{self.project.pk}/export.zip'
+        self.assertEqual(self.client.get(url, {'user_email': 'b@x.io'}).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_asgi_requests_stream_from_a_worker_thread(self):
+        wsgi_chunks = iter([b'x'])
+        self.assertIs(streaming_content(RequestFactory().get('/'), wsgi_chunks), wsgi_chunks)
+
+        chunks = streaming_content(AsyncRequestFactory().get('/'), project_archive(self.project))
+        self.assertTrue(hasattr(chunks, '__aiter__'))
+
+        async def collect():
+            return [chunk async for chunk in chunks]
+
+        archive = self.open_archive(b''.join(async_to_sync(collect)()))
+        self.assertEqual(len(archive.read('sites.ndjson').splitlines()), 3)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='Coastal', description='Mangrove belt', created_by=self.user)
+
+    def add_site(self, name, description=''):
+        return Site.objects.create(
+            project=self.project, name=name, description=description, geometry=square(0, 0), created_by=self.user
+        )
+
+    def names(self, query, **kwargs):
+        return [result['name'] for result in search(query, 'a@x.io', **kwargs)]
+
+    def test_index_follows_creates_updates_and_deletes(self):
+        site = self.add_site('Mangrove nursery')
+        self.assertEqual(self.names('mangro nurs', kinds=('site',)), ['Mangrove nursery'])
+        self.assertEqual(list(Site.objects.filter(matches('site', 'nurs'))), [site])
+
+        site.name = 'Peatland'
+        site.save()
+        self.assertEqual(self.names('nursery', kinds=('site',)), [])
+        self.assertEqual(self.names('peat', kinds=('site',)), ['Peatland'])
+
+        site.delete()
+        self.assertEqual(self.names('peat'), [])
+
+    def test_names_rank_above_descriptions(self):
+        self.add_site('Riverbank', 'next to the mangrove')
+        self.add_site('Mangrove east')
+        self.assertEqual(self.names('mangrove'), ['Mangrove east', 'Coastal', 'Riverbank'])
+        self.assertEqual(search('mangrove', 'b@x.io'), [])
+        self.assertEqual(self.names('mangrove', kinds=('project',)), ['Coastal'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+    def test_triggers_lost_to_a_table_rebuild_are_reinstalled(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER projects_site_fts_insert')
+        self.add_site('Unindexed')
+        self.assertEqual(self.names('unindexed'), [])
+
+        ensure_search_index(using=connection.alias)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'projects_site_fts_insert'")
+            self.assertEqual(len(cursor.fetchall()), 1)
+        # The reinstall rebuilds the index, so rows written meanwhile are found too.
+        self.assertEqual(self.names('unindexed'), ['Unindexed'])
+        self.add_site('Indexed again')
+        self.assertEqual(self.names('indexed'), ['Indexed again'])
+
+
+class CachedSitesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+
+    def get(self, **headers):
+        return self.client.get('/api/sites/', {'project': self.project.pk, 'user_email': 'a@x.io'}, **headers)
+
+    def test_encoding_negotiation(self):
+        best = 'br' if caching.brotli is not None else 'gzip'
+        self.assertEqual(choose_encoding('gzip, deflate, br'), best)
+        self.assertEqual(choose_encoding('*'), best)
+        self.assertEqual(choose_encoding('br;q=0, gzip;q=0.5'), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0, deflate'), 'identity')
+        self.assertEqual(choose_encoding(None), 'identity')
+        with mock.patch.object(caching, 'brotli', None):
+            self.assertEqual(choose_encoding('br'), 'identity')
+
+    def test_precompressed_payloads(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['features']), 1)
+
+        response = self.get()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(response.content)['type'], 'FeatureCollection')
+
+    @skipUnless(caching.brotli is not None, 'brotli is not installed')
+    def test_brotli_payload(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(caching.brotli.decompress(response.content))['features']), 1)
+
+    def test_etag_revalidation(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertNotEqual(self.get()['ETag'], etag)  # One tag per encoding
+
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.name = 'renamed'
+            self.site.save()
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(gzip.decompress(response.content))['features'][0]['properties']['name'], 'renamed')
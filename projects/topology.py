@@ -0,0 +1,170 @@
+"""
+TopoJSON encoding of site polygons.
+
+Coordinates are quantized onto an integer grid, rings are cut into arcs at
+junctions (vertices where neighbouring rings diverge) and identical arcs are
+stored once, so a boundary shared by two adjacent parcels is written a single
+time and referenced from both (reversed as ``~index`` for the second one).
+Arcs are delta-encoded as in the TopoJSON specification.
+"""
+
+from django.conf import settings
+
+from .geometry import polygons
+
+
+class Quantizer:
+    def __init__(self, bbox, quantization, precision=None):
+        if precision is None:
+            precision = settings.SITE_GEOMETRY_PRECISION
+        # Never use a grid finer than the precision geometries are stored at;
+        # the extra digits would cost bytes without carrying information.
+        step = 10.0 ** -precision
+        x0, y0, x1, y1 = bbox
+        self.x0, self.y0 = x0, y0
+        self.kx = max((x1 - x0) / (quantization - 1), step)
+        self.ky = max((y1 - y0) / (quantization - 1), step)
+
+    def quantize(self, point):
+        return round((point[0] - self.x0) / self.kx), round((point[1] - self.y0) / self.ky)
+
+    def dequantize(self, point):
+        return point[0] * self.kx + self.x0, point[1] * self.ky + self.y0
+
+    @property
+    def transform(self):
+        return {'scale': [self.kx, self.ky], 'translate': [self.x0, self.y0]}
+
+
+def _quantized_rings(geometry, quantizer):
+    """Yield polygons as lists of open rings of quantized points."""
+    for polygon in polygons(geometry):
+        rings = []
+        for ring in polygon:
+            points = []
+            for position in ring:
+                point = quantizer.quantize(position)
+                if not points or points[-1] != point:
+                    points.append(point)
+            if len(points) > 1 and points[0] == points[-1]:
+                points.pop()
+            if len(points) >= 3:
+                rings.append(points)
+        if rings:
+            yield rings
+
+
+def _find_junctions(rings):
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            a, b = ring[i - 1], ring[(i + 1) % n]
+            pair = (a, b) if a <= b else (b, a)
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _cut_ring(ring, junctions):
+    """Split an open ring into arcs (lists of points) at its junction vertices."""
+    cuts = [i for i, point in enumerate(ring) if point in junctions]
+    if not cuts:
+        # A ring that shares no junction is one closed arc. Start it at its
+        # smallest vertex so an identical ring elsewhere produces the same arc.
+        start = ring.index(min(ring))
+        rotated = ring[start:] + ring[:start]
+        return [rotated + [rotated[0]]]
+
+    rotated = ring[cuts[0]:] + ring[:cuts[0]]
+    offsets = [i - cuts[0] for i in cuts] + [len(ring)]
+    closed = rotated + [rotated[0]]
+    return [closed[offsets[k]:offsets[k + 1] + 1] for k in range(len(offsets) - 1)]
+
+
+class Topology:
+    """Shared-arc representation of a set of polygon features."""
+
+    def __init__(self, features, quantization=None):
+        """``features`` is an iterable of ``(id, geometry, properties)`` tuples."""
+        features = list(features)
+        quantization = quantization or settings.SITE_TOPOJSON_QUANTIZATION
+
+        xs, ys = [], []
+        for _, geometry, _ in features:
+            for polygon in polygons(geometry):
+                for ring in polygon:
+                    for point in ring:
+                        xs.append(point[0])
+                        ys.append(point[1])
+        self.bbox = (min(xs), min(ys), max(xs), max(ys)) if xs else (0.0, 0.0, 0.0, 0.0)
+        self.quantizer = Quantizer(self.bbox, quantization)
+
+        quantized = [
+            (feature_id, list(_quantized_rings(geometry, self.quantizer)), properties)
+            for feature_id, geometry, properties in features
+        ]
+        junctions = _find_junctions(ring for _, polys, _ in quantized for rings in polys for ring in rings)
+
+        self.arcs = []
+        self.arc_uses = []
+        self._index = {}
+        self.features = []
+        for feature_id, polys, properties in quantized:
+            arc_polygons = [
+                [[self._arc_ref(arc) for arc in _cut_ring(ring, junctions)] for ring in rings]
+                for rings in polys
+            ]
+            self.features.append((feature_id, arc_polygons, properties))
+
+    def _arc_ref(self, points):
+        key = tuple(points)
+        index = self._index.get(key)
+        if index is not None:
+            self.arc_uses[index] += 1
+            return index
+        index = self._index.get(key[::-1])
+        if index is not None:
+            self.arc_uses[index] += 1
+            return ~index
+        index = len(self.arcs)
+        self.arcs.append(points)
+        self.arc_uses.append(1)
+        self._index[key] = index
+        return index
+
+    def arc_points(self, ref):
+        """Absolute quantized points of an arc reference, honouring ``~`` reversal."""
+        return self.arcs[ref] if ref >= 0 else self.arcs[~ref][::-1]
+
+    def to_topojson(self, object_name='sites'):
+        geometries = []
+        for feature_id, arc_polygons, properties in self.features:
+            if len(arc_polygons) == 1:
+                geometry = {'type': 'Polygon', 'arcs': arc_polygons[0]}
+            elif arc_polygons:
+                geometry = {'type': 'MultiPolygon', 'arcs': arc_polygons}
+            else:
+                geometry = {'type': None}
+            geometry['id'] = feature_id
+            geometry['properties'] = properties
+            geometries.append(geometry)
+
+        encoded = []
+        for arc in self.arcs:
+            x0, y0 = arc[0]
+            deltas = [[x0, y0]]
+            for x, y in arc[1:]:
+                deltas.append([x - x0, y - y0])
+                x0, y0 = x, y
+            encoded.append(deltas)
+
+        return {
+            'type': 'Topology',
+            'bbox': list(self.bbox),
+            'transform': self.quantizer.transform,
+            'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+            'arcs': encoded,
+        }
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProjectViewSet, SiteViewSet, debug_request
+from .views import ProjectViewSet, SiteViewSet, change_feed, debug_request, export_project, search
 
 router = DefaultRouter()
 router.register(r'projects', ProjectViewSet, basename='project')
@@ -8,6 +8,9 @@ router.register(r'sites', SiteViewSet, basename='site')
 
 urlpatterns = [
     path('debug/', debug_request, name='debug'),  # Add this temporarily
+    path('changes/', change_feed, name='change_feed'),
+    path('search/', search, name='search'),
+    path('projects/<int:pk>/export.zip', export_project, name='project_export'),
     path('', include(router.urls)),
 ]
 
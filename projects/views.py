@@ -5,15 +5,36 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status, viewsets, permissions
-from .models import Project, Site
-from .serializers import ProjectSerializer, SiteSerializer, SiteGeoJSONSerializer
+from .models import Project, Site, SiteOverlap, Tombstone
+from .serializers import ProjectSerializer, SiteSerializer, SiteGeoJSONSerializer, site_topojson
+from .caching import choose_encoding, get_project_blob
+from . import spatial_index
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
 from rest_framework.exceptions import ValidationError
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
+from daruka.routers import replica_reads, use_replica
+from django.db import DEFAULT_DB_ALIAS, router
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+from .export import project_archive, streaming_content
+from jobs.models import Job
+from jobs.queue import enqueue
 
 User = get_user_model()
 
+class TopoJSONRenderer(JSONRenderer):
+    """Lets ``?format=topojson`` select the TopoJSON site list"""
+    format = 'topojson'
+
 @login_required
 def dashboard(request):
     """Dashboard view showing user's projects"""
@@ -91,6 +112,151 @@ def project_detail_api(request, pk):
         project.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+def _changes_page(queryset, field, since, limit):
+    """
+    Up to ``limit`` rows changed after ``since``, oldest first.
+    
+    When the page is cut short every row sharing the last timestamp is
+    included too, so resuming with ``field > boundary`` never skips a row.
+    Returns ``(rows, boundary)``; ``boundary`` is None when nothing was cut.
+    """
+    if since:
+        queryset = queryset.filter(**{f'{field}__gt': since})
+    rows = list(queryset.order_by(field, 'pk')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    boundary = getattr(rows[-1], field)
+    seen = [row.pk for row in rows if getattr(row, field) == boundary]
+    rows += list(queryset.filter(**{field: boundary}).exclude(pk__in=seen).order_by('pk'))
+    return rows, boundary
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def change_feed(request):
+    """
+    Projects, sites and analytics changed after ?since=<cursor>, plus deletions.
+    
+    The cursor never passes ``now - CHANGE_FEED_LOOKBACK_SECONDS``: a row saved
+    inside a longer transaction carries an earlier ``updated_at`` than rows
+    that committed before it, and would otherwise fall behind the cursor.
+    Recent rows may therefore be returned again; clients upsert by id.
+    """
+    from stats.models import SiteAnalytics
+    from stats.serializers import SiteAnalyticsSerializer
+    
+    user_email = request.query_params.get('user_email')
+    if not user_email:
+        return Response({'error': 'user_email is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        user = User.objects.get(email=user_email)
+    except User.DoesNotExist:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    since = None
+    if request.query_params.get('since'):
+        since = parse_datetime(request.query_params['since'])
+        if since is None:
+            return Response({'error': 'since must be a cursor returned by this endpoint'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, timezone.utc)
+        horizon = timezone.now() - timedelta(days=settings.CHANGE_FEED_TOMBSTONE_DAYS)
+        if since < horizon:
+            # Tombstones older than the retention window are pruned.
+            return Response({'full_resync_required': True}, status=status.HTTP_410_GONE)
+    
+    try:
+        limit = min(int(request.query_params.get('limit', settings.CHANGE_FEED_PAGE_SIZE)), settings.CHANGE_FEED_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(limit, 1)
+    
+    project_ids = Project.objects.filter(created_by=user).values('id')
+    site_ids = Site.objects.filter(project__created_by=user).values('id')
+    projects, project_boundary = _changes_page(Project.objects.filter(created_by=user).select_related('created_by'), 'updated_at', since, limit)
+    sites, site_boundary = _changes_page(
+        Site.objects.filter(project__created_by=user).select_related('project', 'created_by'), 'updated_at', since, limit
+    )
+    analytics, analytics_boundary = _changes_page(
+        SiteAnalytics.objects.filter(site__project__created_by=user).select_related('site'), 'updated_at', since, limit
+    )
+    tombstones, tombstone_boundary = _changes_page(
+        Tombstone.objects.filter(
+            Q(owner_id=user.id) | Q(project_id__in=project_ids) | Q(model='analytics', site_id__in=site_ids)
+        ),
+        'deleted_at', since, limit,
+    )
+    
+    boundaries = [b for b in (project_boundary, site_boundary, analytics_boundary, tombstone_boundary) if b]
+    if boundaries:
+        cursor = min(boundaries)
+    else:
+        stamps = [row.updated_at for row in projects + sites + analytics] + [row.deleted_at for row in tombstones]
+        cursor = max(stamps) if stamps else since
+        if cursor is not None:
+            cursor = min(cursor, timezone.now() - timedelta(seconds=settings.CHANGE_FEED_LOOKBACK_SECONDS))
+    
+    return Response({
+        'cursor': cursor.isoformat() if cursor else None,
+        'has_more': bool(boundaries),
+        'projects': ProjectSerializer(projects, many=True).data,
+        'sites': SiteGeoJSONSerializer(sites, many=True).data,
+        'analytics': SiteAnalyticsSerializer(analytics, many=True).data,
+        'deleted': [
+            {'model': tombstone.model, 'id': tombstone.object_id, 'deleted_at': tombstone.deleted_at}
+            for tombstone in tombstones
+        ],
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@use_replica
+def search(request):
+    """Ranked prefix search over the user's project and site names and descriptions"""
+    from .search import search as search_index
+    
+    user_email = request.query_params.get('user_email')
+    if not user_email:
+        return Response({'error': 'user_email is required'}, status=status.HTTP_400_BAD_REQUEST)
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    kinds = request.query_params.getlist('type') or ['project', 'site']
+    if not set(kinds) <= {'project', 'site'}:
+        return Response({'error': 'type must be project or site'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', settings.SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(max(limit, 1), settings.SEARCH_MAX_RESULTS)
+    
+    results = search_index(query, user_email, kinds=kinds, limit=limit)
+    return Response({'query': query, 'count': len(results), 'results': results})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def export_project(request, pk):
+    """Stream the project's sites (GeoJSON lines) and analytics (CSV) as a ZIP archive"""
+    user_email = request.query_params.get('user_email')
+    if not user_email:
+        return Response({'error': 'user_email is required'}, status=status.HTTP_400_BAD_REQUEST)
+    project = Project.objects.select_related('created_by').filter(pk=pk, created_by__email=user_email).first()
+    if project is None:
+        return Response({'error': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Resolved now, while the request's primary pinning is still in effect.
+    with replica_reads():
+        using = router.db_for_read(Project) or DEFAULT_DB_ALIAS
+    
+    response = StreamingHttpResponse(
+        streaming_content(request._request, project_archive(project, using)),
+        content_type='application/zip',
+    )
+    filename = f"project-{project.id}-{slugify(project.name) or 'export'}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
 class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
@@ -138,25 +304,59 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return all_projects
     
     def destroy(self, request, *args, **kwargs):
-        """Handle project deletion"""
-        try:
-            instance = self.get_object()
-            print(f"DEBUG: Attempting to delete project {instance.id} - {instance.name}")
-            print(f"DEBUG: Created by: {instance.created_by.email}")
-            
-            self.perform_destroy(instance)
+        """
+        Delete the project with its sites and analytics.
+        
+        Runs as a chunked background job: 204 when it already finished (eager
+        mode), otherwise 202 with the job to poll at /api/jobs/<id>/.
+        """
+        instance = self.get_object()
+        job = enqueue('projects.delete_project', instance.id, key=f'delete-project:{instance.id}',
+                      created_by=instance.created_by)
+        job.refresh_from_db()
+        if job.status == Job.SUCCEEDED:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        except Exception as e:
-            print(f"DEBUG: Delete error: {str(e)}")
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        if job.status == Job.FAILED:
+            return Response({'error': job.error_summary or 'Deletion failed', 'job': job.id},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'job': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def overlaps(self, request, pk=None):
+        """Overlapping site pairs in this project (POST overlaps/refresh/ re-detects them)"""
+        project = self.get_object()
+        overlaps = (
+            SiteOverlap.objects.filter(project=project)
+            .values('site_a', 'site_a__name', 'site_b', 'site_b__name', 'area', 'detected_at')
+        )
+        return Response({
+            'project': project.id,
+            'count': len(overlaps),
+            'total_overlap_area': sum(overlap['area'] for overlap in overlaps),
+            'overlaps': [
+                {
+                    'site_a': {'id': overlap['site_a'], 'name': overlap['site_a__name']},
+                    'site_b': {'id': overlap['site_b'], 'name': overlap['site_b__name']},
+                    'area': overlap['area'],
+                    'detected_at': overlap['detected_at'],
+                }
+                for overlap in overlaps
+            ],
+        })
+
+    @action(detail=True, methods=['post'], url_path='overlaps/refresh', url_name='overlaps-refresh')
+    def refresh_overlaps(self, request, pk=None):
+        """Queue a full overlap re-detection; 202 with the job to poll at /api/jobs/<id>/"""
+        project = self.get_object()
+        job = enqueue('projects.detect_overlaps', project.id, key=f'overlaps:{project.id}')
+        job.refresh_from_db()
+        return Response({'job': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
 
 class SiteViewSet(viewsets.ModelViewSet):
     queryset = Site.objects.all()
     serializer_class = SiteSerializer
     permission_classes = [permissions.AllowAny]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [TopoJSONRenderer]
     
     def get_queryset(self):
         queryset = Site.objects.all()
@@ -184,16 +384,42 @@ class SiteViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-created_at')
     
+    @use_replica
     def list(self, request, *args, **kwargs):
-        """Return GeoJSON FeatureCollection format"""
+        """Return GeoJSON FeatureCollection format (or TopoJSON with ?format=topojson)"""
+        kind = 'topojson' if request.accepted_renderer.format == 'topojson' else 'geojson'
+        project_id = request.query_params.get('project')
+        user_email = request.query_params.get('user_email')
+        if project_id and user_email and project_id.isdigit():
+            if Project.objects.filter(pk=project_id, created_by__email=user_email).exists():
+                return self.cached_project_sites(request, int(project_id), kind)
+
         queryset = self.get_queryset()
+        if kind == 'topojson':
+            return Response(site_topojson(queryset.select_related('project', 'created_by')))
         serializer = SiteGeoJSONSerializer(queryset, many=True)
         
         return Response({
             'type': 'FeatureCollection',
             'features': serializer.data
         })
-    
+
+    def cached_project_sites(self, request, project_id, kind):
+        """Serve a project's sites from its precompressed GeoJSON/TopoJSON cache blobs"""
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        version, blob = get_project_blob(project_id, kind, encoding)
+
+        etag = f'"{kind}-{project_id}-{version}-{encoding}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(blob, content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
     def perform_create(self, serializer):
         created_by_email = self.request.data.get('created_by_email')
         project_id = self.request.data.get('project')
@@ -218,3 +444,96 @@ class SiteViewSet(viewsets.ModelViewSet):
                 serializer.save(created_by=self.request.user)
             else:
                 raise ValidationError({'created_by': 'User email is required'})
+    
+    def locate_scope(self, request):
+        """Project ids a locate request may match: the caller's projects, optionally one of them"""
+        user_email = request.query_params.get('user_email') or request.data.get('user_email')
+        if not user_email:
+            raise ValidationError({'user_email': 'User email is required'})
+        projects = Project.objects.filter(created_by__email=user_email)
+        project_id = request.query_params.get('project') or request.data.get('project')
+        if project_id:
+            try:
+                projects = projects.filter(pk=int(project_id))
+            except (TypeError, ValueError):
+                raise ValidationError({'project': 'Project id must be an integer'})
+        return set(projects.values_list('id', flat=True))
+    
+    @action(detail=False, methods=['get'])
+    def locate(self, request):
+        """Find the sites (and projects) containing a lon/lat point"""
+        try:
+            lon = float(request.query_params['lon'])
+            lat = float(request.query_params['lat'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Numeric lon and lat are required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        matches = spatial_index.get_index().locate(lon, lat, self.locate_scope(request))
+        return Response({
+            'lon': lon,
+            'lat': lat,
+            'sites': [{'site': site_id, 'project': project_id} for site_id, project_id in matches],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):
+        """Groups of the caller's sites with identical geometry (optionally within ?project=)"""
+        queryset = self.get_queryset().exclude(geometry_hash='').order_by()
+        groups = (
+            queryset.values('geometry_hash')
+            .annotate(count=Count('id'))
+            .filter(count__gt=1)
+            .order_by('-count', 'geometry_hash')
+        )
+        members = {}
+        for site_id, project_id, name, digest in (
+            queryset.filter(geometry_hash__in=groups.values('geometry_hash'))
+            .order_by('pk')
+            .values_list('id', 'project_id', 'name', 'geometry_hash')
+        ):
+            members.setdefault(digest, []).append({'site': site_id, 'project': project_id, 'name': name})
+        return Response({
+            'count': len(members),
+            'groups': [
+                {'geometry_hash': group['geometry_hash'], 'count': group['count'], 'sites': members[group['geometry_hash']]}
+                for group in groups
+            ],
+        })
+
+    @action(detail=True, methods=['get'], url_path='duplicates', url_name='geometry-duplicates')
+    def geometry_duplicates(self, request, pk=None):
+        """The caller's other sites whose geometry is identical to this one"""
+        site = self.get_object()
+        if not site.geometry_hash:
+            return Response({'site': site.pk, 'geometry_hash': '', 'sites': []})
+        others = (
+            self.get_queryset().filter(geometry_hash=site.geometry_hash)
+            .exclude(pk=site.pk)
+            .order_by('pk')
+            .values_list('id', 'project_id', 'name')
+        )
+        return Response({
+            'site': site.pk,
+            'geometry_hash': site.geometry_hash,
+            'sites': [{'site': site_id, 'project': project_id, 'name': name} for site_id, project_id, name in others],
+        })
+
+    @action(detail=False, methods=['post'], url_path='locate/batch')
+    def locate_batch(self, request):
+        """Locate many points at once: {"points": [[lon, lat], ...]}"""
+        points = request.data.get('points')
+        max_points = settings.SITE_LOCATE_MAX_BATCH
+        try:
+            points = [(float(point[0]), float(point[1])) for point in points]
+        except (TypeError, ValueError, IndexError, KeyError):
+            return Response({'error': 'points must be a list of [lon, lat] pairs'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > max_points:
+            return Response({'error': f'At most {max_points} points per request'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = spatial_index.get_index().locate_many(points, self.locate_scope(request)) if points else []
+        return Response({
+            'results': [
+                [{'site': site_id, 'project': project_id} for site_id, project_id in matches]
+                for matches in results
+            ],
+        })
@@ -0,0 +1,176 @@
+"""
+In-process fan-out of change events to streaming subscribers.
+
+Under ASGI each subscriber owns an ``asyncio.Queue`` on the event loop that
+serves its request, and delivery goes through ``loop.call_soon_threadsafe``.
+Under WSGI the stream is a plain iterator running in a worker thread, so its
+subscriber owns a thread-safe ``queue.Queue`` instead. Either way signals
+publish from request threads after commit and never block the writer.
+
+Events written by other worker processes reach this one through the
+``ChangeEvent`` table: while anyone is subscribed a single daemon thread tails
+the table every ``REALTIME_POLL_INTERVAL`` seconds and delivers rows whose
+``origin`` is another process. Locally published events skip the table read
+and are delivered immediately.
+
+Ids are allocated at insert but rows become visible at commit, so a row can
+appear behind the poller's cursor. Each poll therefore also re-reads the ids
+created in the last ``REALTIME_POLL_LOOKBACK_SECONDS`` and delivers any it
+has not seen yet.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_origin = None
+_origin_pid = None
+
+
+def get_origin():
+    """
+    Identify this process in ``ChangeEvent.origin``.
+
+    Computed on first use in each process: preloading servers import this
+    module in the master, and forked workers must not share its origin or
+    they would drop each other's events as their own.
+    """
+    global _origin, _origin_pid
+    pid = os.getpid()
+    if _origin_pid != pid:
+        _origin, _origin_pid = f'{pid}-{uuid.uuid4().hex[:8]}', pid
+    return _origin
+
+
+class Subscription:
+    def __init__(self, owner_id, project_ids, loop=None):
+        self.owner_id = owner_id
+        self.project_ids = set(project_ids) if project_ids is not None else None
+        self.loop = loop
+        if loop is None:
+            self.queue = queue.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        else:
+            self.queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, message, owner_id):
+        if owner_id != self.owner_id:
+            return False
+        return self.project_ids is None or message['project'] in self.project_ids
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except (asyncio.QueueFull, queue.Full):
+            # A client this far behind should refetch rather than replay.
+            self.overflowed = True
+
+    def deliver(self, message):
+        """Thread-safe: queue ``message`` on the subscriber's own loop (or queue)."""
+        if self.loop is None:
+            self._put(message)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # Loop already closed; the subscription is on its way out.
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def get_blocking(self, timeout):
+        """``get`` for WSGI subscriptions; raises ``queue.Empty`` on timeout."""
+        return self.queue.get(timeout=timeout)
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._poller = None
+        self._cursor = None
+        # Ids delivered within the lookback window -> when they were first seen.
+        self._seen = {}
+
+    def subscribe(self, owner_id, project_ids=None, blocking=False):
+        loop = None if blocking else asyncio.get_running_loop()
+        subscription = Subscription(owner_id, project_ids, loop)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll, name='realtime-poller', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events):
+        """Deliver committed ``ChangeEvent`` rows to matching local subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        for event in events:
+            message = event.as_message()
+            for subscription in subscriptions:
+                if subscription.matches(message, event.owner_id):
+                    subscription.deliver(message)
+
+    def _poll(self):
+        from .models import ChangeEvent
+
+        interval = settings.REALTIME_POLL_INTERVAL
+        next_prune = 0.0
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if not self._subscriptions:
+                    continue
+            close_old_connections()
+            try:
+                if self._cursor is None:
+                    self._cursor = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                    self._seen = dict.fromkeys(self._recent_ids(ChangeEvent), time.monotonic())
+                    continue
+                self._poll_once(ChangeEvent)
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + 60
+                    cutoff = timezone.now() - timedelta(seconds=settings.REALTIME_EVENT_RETENTION_SECONDS)
+                    ChangeEvent.objects.filter(created_at__lt=cutoff).delete()
+            except Exception:
+                logger.exception('realtime poller failed')
+
+    def _recent_ids(self, model):
+        since = timezone.now() - timedelta(seconds=settings.REALTIME_POLL_LOOKBACK_SECONDS)
+        return model.objects.filter(created_at__gte=since, id__lte=self._cursor).values_list('id', flat=True)
+
+    def _poll_once(self, model):
+        """Deliver rows past the cursor plus late commits behind it, each id once."""
+        late = set(self._recent_ids(model)) - self._seen.keys()
+        events = list(model.objects.filter(Q(id__gt=self._cursor) | Q(id__in=late)).order_by('id')[:1000])
+        now = time.monotonic()
+        horizon = now - 2 * settings.REALTIME_POLL_LOOKBACK_SECONDS
+        self._seen = {pk: seen_at for pk, seen_at in self._seen.items() if seen_at >= horizon}
+        events = [event for event in events if event.pk not in self._seen]
+        if events:
+            self._cursor = max(self._cursor, events[-1].pk)
+            self._seen.update(dict.fromkeys((event.pk for event in events), now))
+            origin = get_origin()
+            self.publish([event for event in events if event.origin != origin])
+
+
+broker = Broker()
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-19 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("owner_id", models.BigIntegerField()),
+                ("project_id", models.BigIntegerField(blank=True, null=True)),
+                ("kind", models.CharField(max_length=32)),
+                ("object_id", models.BigIntegerField(blank=True, null=True)),
+                ("origin", models.CharField(max_length=32)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="changeevent",
+            index=models.Index(
+                fields=["owner_id", "id"], name="changeevent_owner_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class ChangeEvent(models.Model):
+    """
+    A committed change pushed to subscribers of the event stream.
+
+    The table is how workers hear about each other's writes: every process
+    tails it for rows written by other processes. Rows are short-lived and
+    also let a reconnecting client replay what it missed (``Last-Event-ID``).
+    """
+    owner_id = models.BigIntegerField()
+    project_id = models.BigIntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=32)  # e.g. 'site.updated', 'analytics.deleted'
+    object_id = models.BigIntegerField(null=True, blank=True)
+    origin = models.CharField(max_length=32)  # Process that wrote the event
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['owner_id', 'id'], name='changeevent_owner_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} (project {self.project_id})"
+
+    def as_message(self):
+        return {
+            'id': self.pk,
+            'type': self.kind,
+            'project': self.project_id,
+            'object': self.object_id,
+            'at': self.created_at.isoformat(),
+        }
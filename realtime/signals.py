@@ -0,0 +1,121 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from daruka.oncommit import CommitBatch
+from projects.models import Project, Site
+from projects.signals import cascaded_from
+from stats.models import SiteAnalytics
+
+from .broker import broker, get_origin
+from .models import ChangeEvent
+
+
+def _send(events):
+    """
+    Write and publish a committed transaction's events with one bulk insert.
+
+    Events queued without their owner or project (the instance did not have
+    the relation loaded) are resolved here, with one query per table for the
+    whole batch instead of one per row.
+    """
+    site_ids = {object_id for owner_id, project_id, _, object_id in events if project_id is None}
+    sites = {
+        site_id: (owner_id, project_id)
+        for site_id, owner_id, project_id in Site.objects.filter(pk__in=site_ids)
+        .values_list('id', 'project__created_by_id', 'project_id')
+    } if site_ids else {}
+    project_ids = {project_id for owner_id, project_id, _, _ in events if owner_id is None and project_id is not None}
+    owners = dict(
+        Project.objects.filter(pk__in=project_ids).values_list('id', 'created_by_id')
+    ) if project_ids else {}
+
+    resolved = {}
+    for owner_id, project_id, kind, object_id in events:
+        if project_id is None:
+            owner_id, project_id = sites.get(object_id, (None, None))
+        elif owner_id is None:
+            owner_id = owners.get(project_id)
+        if owner_id is not None:
+            resolved.setdefault((owner_id, project_id, kind, object_id), None)
+
+    origin = get_origin()
+    events = ChangeEvent.objects.bulk_create([
+        ChangeEvent(owner_id=owner_id, project_id=project_id, kind=kind, object_id=object_id, origin=origin)
+        for owner_id, project_id, kind, object_id in resolved
+    ])
+    broker.publish(events)
+
+
+_events = CommitBatch(_send)
+
+
+def queue_event(owner_id, project_id, kind, object_id):
+    """
+    Record a change to push once the current transaction commits.
+
+    Events are collected per transaction and written with one bulk insert;
+    repeats (e.g. a site saved twice) are sent once. ``owner_id`` may be
+    ``None`` to look it up from ``project_id``, and both may be ``None`` for
+    site events to look them up from the site (``object_id``).
+    """
+    _events.add((owner_id, project_id, kind, object_id))
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    kind = 'project.created' if created else 'project.updated'
+    queue_event(instance.created_by_id, instance.pk, kind, instance.pk)
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    queue_event(instance.created_by_id, instance.pk, 'project.deleted', instance.pk)
+
+
+def _owner_id(site):
+    """The site's project owner if the project is loaded, else ``None`` (looked up later)."""
+    return site.project.created_by_id if Site.project.is_cached(site) else None
+
+
+def _site_scope(analytics):
+    """``(owner_id, project_id)`` from loaded relations, ``None`` for what is not loaded."""
+    if not SiteAnalytics.site.is_cached(analytics):
+        return None, None
+    return _owner_id(analytics.site), analytics.site.project_id
+
+
+@receiver(post_save, sender=Site)
+def site_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    kind = 'site.created' if created else 'site.updated'
+    previous = getattr(instance, '_previous_project_id', None)
+    if previous and previous != instance.project_id:
+        queue_event(None, previous, 'site.deleted', instance.pk)
+    queue_event(_owner_id(instance), instance.project_id, kind, instance.pk)
+
+
+@receiver(post_delete, sender=Site)
+def site_deleted(sender, instance, origin=None, **kwargs):
+    if cascaded_from(origin, Site):
+        return  # Covered by the project.deleted event
+    queue_event(_owner_id(instance), instance.project_id, 'site.deleted', instance.pk)
+
+
+@receiver(post_save, sender=SiteAnalytics)
+def analytics_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    owner_id, project_id = _site_scope(instance)
+    # One event per site: dashboards refetch the site's series, not single rows.
+    queue_event(owner_id, project_id, 'analytics.updated', instance.site_id)
+
+
+@receiver(post_delete, sender=SiteAnalytics)
+def analytics_deleted(sender, instance, origin=None, **kwargs):
+    if cascaded_from(origin, SiteAnalytics):
+        return
+    owner_id, project_id = _site_scope(instance)
+    queue_event(owner_id, project_id, 'analytics.updated', instance.site_id)
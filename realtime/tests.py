@@ -0,0 +1,102 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from projects.models import Project, Site
+from stats.models import SiteAnalytics
+
+from . import broker as broker_module
+from . import signals
+from .broker import Broker, Subscription, get_origin
+from .models import ChangeEvent
+
+User = get_user_model()
+
+
+def square(x, y, size=0.01):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+class BrokerTests(TestCase):
+    def setUp(self):
+        self.broker = Broker()
+        self.broker._cursor = 0
+        self.subscription = Subscription(owner_id=1, project_ids=None)
+        self.broker._subscriptions.add(self.subscription)
+
+    def add_event(self, origin, object_id):
+        return ChangeEvent.objects.create(
+            owner_id=1, project_id=2, kind='site.updated', object_id=object_id, origin=origin
+        )
+
+    def delivered(self):
+        messages = []
+        while not self.subscription.queue.empty():
+            messages.append(self.subscription.queue.get_nowait()['object'])
+        return messages
+
+    def test_only_other_processes_events_are_delivered_from_the_table(self):
+        self.add_event(get_origin(), 1)
+        self.add_event('other-process', 2)
+        self.broker._poll_once(ChangeEvent)
+        self.assertEqual(self.delivered(), [2])
+
+    def test_forked_workers_get_their_own_origin(self):
+        parent = get_origin()
+        self.add_event(parent, 1)
+        with mock.patch.object(broker_module.os, 'getpid', return_value=-1):
+            child = get_origin()
+            self.assertNotEqual(child, parent)
+            self.assertEqual(get_origin(), child)
+            self.broker._poll_once(ChangeEvent)
+        self.assertEqual(self.delivered(), [1])
+        self.assertNotEqual(get_origin(), child)
+
+
+class ChangeEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+
+    def events(self):
+        return list(ChangeEvent.objects.order_by('pk').values_list('owner_id', 'project_id', 'kind', 'object_id'))
+
+    def test_receivers_do_not_query_per_row(self):
+        site = Site.objects.get(pk=self.site.pk)  # Project not loaded
+        rows = [SiteAnalytics(site_id=site.pk, date=date(2024, 1, day)) for day in (1, 2, 3)]
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(0):
+            signals.site_saved(Site, instance=site, created=False)
+            for row in rows:
+                signals.analytics_saved(SiteAnalytics, instance=row)
+
+        # One lookup per table for the whole transaction, then one insert.
+        with self.assertNumQueries(3):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.events(), [
+            (self.user.pk, self.project.pk, 'site.updated', self.site.pk),
+            (self.user.pk, self.project.pk, 'analytics.updated', self.site.pk),
+        ])
+
+    def test_loaded_relations_need_no_lookup(self):
+        site = Site.objects.select_related('project').get(pk=self.site.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            signals.site_saved(Site, instance=site, created=False)
+            signals.analytics_saved(SiteAnalytics, instance=SiteAnalytics(site=site, date=date(2024, 1, 1)))
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(self.events()), 2)
+
+    def test_moved_sites_leave_the_old_project(self):
+        other = Project.objects.create(name='Q', created_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.project = other
+            self.site.save()
+        self.assertEqual(self.events()[-2:], [
+            (self.user.pk, self.project.pk, 'site.deleted', self.site.pk),
+            (self.user.pk, other.pk, 'site.updated', self.site.pk),
+        ])
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import queue
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from projects.models import Project
+from .broker import broker
+from .models import ChangeEvent
+
+User = get_user_model()
+
+
+def _format(message):
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+@sync_to_async
+def _resolve_scope(user_email, project_id):
+    user = User.objects.filter(email=user_email).first()
+    if user is None:
+        return None, None
+    projects = Project.objects.filter(created_by=user)
+    if project_id:
+        return user.id, list(projects.filter(pk=project_id).values_list('id', flat=True))
+    return user.id, None
+
+
+def _missed_events(owner_id, project_ids, last_event_id):
+    events = ChangeEvent.objects.filter(owner_id=owner_id, id__gt=last_event_id)
+    if project_ids is not None:
+        events = events.filter(project_id__in=project_ids)
+    return [event.as_message() for event in events[:settings.REALTIME_QUEUE_SIZE]]
+
+
+def _replay(subscription, missed):
+    for message in missed:
+        yield _format(message)
+    if len(missed) >= settings.REALTIME_QUEUE_SIZE:
+        subscription.overflowed = True
+
+
+def _resync(subscription):
+    if subscription.overflowed:
+        subscription.overflowed = False
+        return "event: resync\ndata: {}\n\n"
+    return None
+
+
+async def _async_stream(owner_id, project_ids, last_event_id):
+    subscription = broker.subscribe(owner_id, project_ids)
+    try:
+        yield f"retry: {settings.REALTIME_RETRY_MS}\n\n"
+        if last_event_id.isdigit():
+            missed = await sync_to_async(_missed_events)(owner_id, project_ids, int(last_event_id))
+            for chunk in _replay(subscription, missed):
+                yield chunk
+        while True:
+            resync = _resync(subscription)
+            if resync:
+                yield resync
+            try:
+                message = await subscription.get(settings.REALTIME_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            yield _format(message)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def _sync_stream(owner_id, project_ids, last_event_id):
+    """
+    The stream as a plain iterator for WSGI servers, which would otherwise
+    collect an async iterator into a list before sending a byte. It occupies
+    one worker thread per subscriber until the client goes away (the next
+    write after a disconnect fails and closes the generator).
+    """
+    subscription = broker.subscribe(owner_id, project_ids, blocking=True)
+    try:
+        yield f"retry: {settings.REALTIME_RETRY_MS}\n\n"
+        if last_event_id.isdigit():
+            yield from _replay(subscription, _missed_events(owner_id, project_ids, int(last_event_id)))
+        while True:
+            resync = _resync(subscription)
+            if resync:
+                yield resync
+            try:
+                message = subscription.get_blocking(settings.REALTIME_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield _format(message)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of changes to the user's projects, sites and analytics.
+
+    Scoped like the REST endpoints with ``?user_email=`` and an optional
+    ``?project=``. Each event carries only ids, e.g.
+    ``{"type": "site.updated", "project": 3, "object": 41}``; clients refetch
+    what changed instead of polling. A ``resync`` event means events were
+    dropped and the client should reload everything. Under WSGI each open
+    stream holds a worker thread, so size ``GUNICORN_THREADS`` for the
+    expected number of subscribers.
+    """
+    user_email = request.GET.get('user_email')
+    if not user_email:
+        return JsonResponse({'error': 'user_email is required'}, status=400)
+    project_id = request.GET.get('project')
+    if project_id and not project_id.isdigit():
+        return JsonResponse({'error': 'project must be an id'}, status=400)
+    owner_id, project_ids = await _resolve_scope(user_email, project_id)
+    if owner_id is None:
+        return JsonResponse({'error': 'User not found'}, status=404)
+    if project_ids == []:
+        return JsonResponse({'error': 'Project not found'}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if isinstance(request, ASGIRequest):
+        stream = _async_stream(owner_id, project_ids, last_event_id)
+    else:
+        stream = _sync_stream(owner_id, project_ids, last_event_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,13 +1,32 @@
 from django.contrib import admin
-from .models import SiteAnalytics
+from daruka.paginators import EstimatedCountPaginator
+from projects.admin import IdInputFilter
+from .models import SiteAnalytics, SiteForecast
+
+
+class SiteIdFilter(IdInputFilter):
+    title = 'site id'
+    parameter_name = 'site_id'
+    lookup = 'site_id'
+
+
+class AnalyticsProjectIdFilter(IdInputFilter):
+    title = 'project id'
+    parameter_name = 'project_id'
+    lookup = 'site__project_id'
+
 
 @admin.register(SiteAnalytics)
 class SiteAnalyticsAdmin(admin.ModelAdmin):
     list_display = ('id', 'site', 'date', 'carbon_sequestered', 'species_count', 'vegetation_index', 'created_at')
-    list_filter = ('date', 'site', 'created_at')
+    list_filter = ('date', SiteIdFilter, AnalyticsProjectIdFilter, 'created_at')
+    list_select_related = ('site__project',)
     search_fields = ('site__name', 'site__project__name')
+    autocomplete_fields = ('site',)
     readonly_fields = ('created_at', 'updated_at')
-    ordering = ('-date',)
+    ordering = ('-date', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Site Information', {
@@ -27,3 +46,20 @@ class SiteAnalyticsAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def get_queryset(self, request):
+        # Only the names are shown for the site column.
+        return super().get_queryset(request).defer(
+            'site__geometry', 'site__description', 'site__project__footprint', 'site__project__description'
+        )
+
+
+@admin.register(SiteForecast)
+class SiteForecastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'site', 'metric', 'observations', 'slope_per_year', 'last_observation', 'fitted_at')
+    list_filter = ('metric', SiteIdFilter, AnalyticsProjectIdFilter)
+    list_select_related = ('site__project',)
+    readonly_fields = [field.name for field in SiteForecast._meta.fields]
+    ordering = ('site_id', 'metric')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
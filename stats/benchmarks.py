@@ -0,0 +1,124 @@
+"""
+Percentile ranks of sites on area-normalized metrics.
+
+One ``GROUP BY site`` query aggregates each site's analytics (total carbon
+sequestered, mean NDVI, peak species count) together with its area. NumPy
+turns that into carbon per hectare and ranks every site against the
+population with two ``searchsorted`` calls on the sorted values. Ties share the
+midpoint rank, so a site's percentile is the share of sites below it plus half
+of those equal to it.
+
+Populations (every site, one owner's portfolio or one project) are cached as
+arrays under the global analytics and sites versions, so any analytics or site
+write refreshes them on the next request.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Max, Sum
+
+from daruka.singleflight import SingleFlight
+from projects.caching import SITES_VERSION_KEY, get_versions
+
+from .models import SiteAnalytics
+from .signals import ANALYTICS_VERSION_KEY
+
+BENCHMARK_METRICS = ('carbon_per_hectare', 'vegetation_index', 'species_richness')
+SQUARE_METERS_PER_HECTARE = 10000
+
+BENCHMARKS_FLIGHT = SingleFlight('analytics.benchmarks')
+
+
+def load_population(sites=None):
+    """Per-site aggregates as arrays, for ``sites`` (a Site queryset) or every site."""
+    analytics = SiteAnalytics.objects.all()
+    if sites is not None:
+        analytics = analytics.filter(site__in=sites)
+    rows = list(
+        analytics.values_list('site_id')
+        .annotate(
+            project=Max('site__project_id'),
+            area=Max('site__area'),
+            carbon=Sum('carbon_sequestered'),
+            ndvi=Avg('vegetation_index'),
+            species=Max('species_count'),
+        )
+        .order_by('site_id')
+    )
+    columns = list(zip(*rows)) if rows else [()] * 6
+    site_ids, project_ids, area, carbon, ndvi, species = columns
+    area = np.array([value if value else np.nan for value in area], dtype=np.float64)
+    hectares = area / SQUARE_METERS_PER_HECTARE
+    return {
+        'site': np.asarray(site_ids, dtype=np.int64),
+        'project': np.asarray(project_ids, dtype=np.int64),
+        'hectares': hectares,
+        'carbon_per_hectare': np.asarray(carbon, dtype=np.float64) / hectares,
+        'vegetation_index': np.asarray(ndvi, dtype=np.float64),
+        'species_richness': np.asarray(species, dtype=np.float64),
+    }
+
+
+def percentile_ranks(values):
+    """Mid-rank percentile (0-100) of each value among the non-NaN values; NaN stays NaN."""
+    valid = np.sort(values[~np.isnan(values)])
+    if not len(valid):
+        return np.full(len(values), np.nan)
+    below = np.searchsorted(valid, values, side='left')
+    equal = np.searchsorted(valid, values, side='right') - below
+    return np.where(np.isnan(values), np.nan, (below + 0.5 * equal) / len(valid) * 100)
+
+
+def distribution(values):
+    valid = values[~np.isnan(values)]
+    if not len(valid):
+        return {'count': 0, 'p25': None, 'median': None, 'p75': None, 'p90': None}
+    p25, median, p75, p90 = np.percentile(valid, [25, 50, 75, 90])
+    return {'count': int(len(valid)), 'p25': float(p25), 'median': float(median), 'p75': float(p75), 'p90': float(p90)}
+
+
+def compute_benchmarks(sites=None):
+    population = load_population(sites)
+    for metric in BENCHMARK_METRICS:
+        population[f'{metric}_percentile'] = percentile_ranks(population[metric])
+    return population
+
+
+def get_benchmarks(population_key, sites=None):
+    """``compute_benchmarks`` cached under the current analytics and sites versions."""
+    versions = get_versions([ANALYTICS_VERSION_KEY, SITES_VERSION_KEY])
+    key = (
+        f'benchmarks:{population_key}:'
+        f'v{versions[ANALYTICS_VERSION_KEY]}:v{versions[SITES_VERSION_KEY]}'
+    )
+    population = cache.get(key)
+    if population is None:
+        def compute():
+            result = compute_benchmarks(sites)
+            cache.set(key, result, settings.BENCHMARKS_CACHE_TIMEOUT)
+            return result
+
+        population = BENCHMARKS_FLIGHT.do(key, compute)
+    return population
+
+
+def _number(value):
+    return None if np.isnan(value) else float(value)
+
+
+def site_results(population, site_ids):
+    """Metrics and percentiles of the population's sites that are in ``site_ids``."""
+    rows = np.flatnonzero(np.isin(population['site'], np.asarray(list(site_ids), dtype=np.int64)))
+    return [
+        {
+            'site': int(population['site'][i]),
+            'project': int(population['project'][i]),
+            'hectares': _number(population['hectares'][i]),
+            'metrics': {metric: _number(population[metric][i]) for metric in BENCHMARK_METRICS},
+            'percentiles': {
+                metric: _number(population[f'{metric}_percentile'][i]) for metric in BENCHMARK_METRICS
+            },
+        }
+        for i in rows
+    ]
@@ -0,0 +1,313 @@
+"""
+Carbon forecasts for every site, fitted in vectorized batches.
+
+Each site's history of a metric is modelled as a linear trend plus an annual
+cycle::
+
+    y = level + slope * t + a * sin(2 pi d / 365.25) + b * cos(2 pi d / 365.25)
+
+with ``t`` in years since the site's last observation and ``d`` the day
+number. A batch of sites is loaded with one query into flat arrays sorted by
+(site, date); the normal equations of every site and metric are summed with
+``np.add.reduceat`` and solved with one stacked ``np.linalg.solve``. Sites
+whose history is too short for the seasonal terms get those columns pinned to
+zero, so every site goes through the same solve. Batches with many rows are
+split across a process pool.
+
+Fits are stored in ``SiteForecast``. Analytics writes mark the site's rows
+invalidated and queue ``stats.refresh_forecasts``, which refits only the sites
+whose forecasts are missing or were invalidated after they were fitted.
+"""
+
+import multiprocessing
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from daruka.oncommit import CommitBatch
+
+from .models import SiteAnalytics, SiteForecast
+
+FORECAST_METRICS = ('carbon_sequestered', 'carbon_offset')
+DAYS_PER_YEAR = 365.25
+COLUMNS = 4  # level, slope, sin, cos
+SEASONAL_MIN_OBSERVATIONS = 6
+SEASONAL_MIN_SPAN_DAYS = 330
+
+
+def load_histories(site_ids):
+    """Return ``(sites, days, values)`` sorted by site then date; ``values`` has a column per metric."""
+    rows = (
+        SiteAnalytics.objects.filter(site_id__in=site_ids)
+        .order_by('site_id', 'date')
+        .values_list('site_id', 'date', *FORECAST_METRICS)
+    )
+    sites, days, values = [], [], []
+    for site_id, day, *metrics in rows.iterator(chunk_size=5000):
+        sites.append(site_id)
+        days.append(day.toordinal())
+        values.append(metrics)
+    return (
+        np.asarray(sites, dtype=np.int64),
+        np.asarray(days, dtype=np.int64),
+        np.asarray(values, dtype=np.float64).reshape(-1, len(FORECAST_METRICS)),
+    )
+
+
+def _design(days, last_day):
+    t = (days - last_day) / DAYS_PER_YEAR
+    phase = 2 * np.pi * days / DAYS_PER_YEAR
+    return np.stack([np.ones_like(t), t, np.sin(phase), np.cos(phase)], axis=-1)
+
+
+def fit(sites, days, values, horizons, z=1.96):
+    """
+    Fit every site in the sorted arrays and project it ``horizons`` years ahead.
+
+    Returns a dict of arrays indexed by site first; per-metric values have the
+    metric last, projections are ``(site, horizon, metric)``.
+    """
+    horizons = np.asarray(horizons, dtype=np.float64)
+    boundary = np.r_[True, sites[1:] != sites[:-1]] if len(sites) else np.empty(0, dtype=bool)
+    starts = np.flatnonzero(boundary)
+    count = len(starts)
+    metrics = values.shape[1]
+    if not count:
+        empty = np.empty((0, metrics))
+        projected = np.empty((0, len(horizons), metrics))
+        return {
+            'site': np.empty(0, dtype=np.int64), 'observations': np.empty(0, dtype=np.int64),
+            'last_day': np.empty(0, dtype=np.int64), 'cadence': np.empty(0),
+            'level': empty, 'slope': empty, 'amplitude': empty, 'sigma': empty,
+            'value': projected, 'lower': projected, 'upper': projected, 'cumulative': projected,
+        }
+
+    groups = np.cumsum(boundary) - 1
+    ends = np.r_[starts[1:], len(sites)]
+    n = ends - starts
+    last_day = days[ends - 1]
+    span = last_day - days[starts]
+    X = _design(days, last_day[groups])
+
+    active = np.ones((count, COLUMNS), dtype=bool)
+    active[:, 1] = span > 0
+    active[:, 2:] = ((n >= SEASONAL_MIN_OBSERVATIONS) & (span >= SEASONAL_MIN_SPAN_DAYS))[:, None]
+
+    gram = np.empty((count, COLUMNS, COLUMNS))
+    for i in range(COLUMNS):
+        for j in range(i, COLUMNS):
+            gram[:, i, j] = gram[:, j, i] = np.add.reduceat(X[:, i] * X[:, j], starts)
+    moments = np.add.reduceat(X[:, :, None] * values[:, None, :], starts, axis=0)
+
+    # Unidentifiable columns solve to exactly zero.
+    inactive = ~active
+    gram[inactive[:, :, None] | inactive[:, None, :]] = 0.0
+    diagonal = np.arange(COLUMNS)
+    gram[:, diagonal, diagonal] += inactive
+    moments[inactive] = 0.0
+    coef = np.linalg.solve(gram, moments)
+
+    residuals = values - np.einsum('nk,nkm->nm', X, coef[groups])
+    dof = n - active.sum(axis=1)
+    sse = np.add.reduceat(residuals * residuals, starts, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.where((dof > 0)[:, None], np.sqrt(sse / np.maximum(dof, 1)[:, None]), np.nan)
+        cadence = np.where(n > 1, span / np.maximum(n - 1, 1), np.nan)
+
+    future = last_day[:, None] + np.rint(horizons * DAYS_PER_YEAR).astype(np.int64)
+    x0 = _design(future, last_day[:, None]) * active[:, None, :]
+    value = np.einsum('ghk,gkm->ghm', x0, coef)
+    leverage = np.einsum('ghk,ghk->gh', x0, np.linalg.solve(gram[:, None], x0[..., None])[..., 0])
+    half = z * sigma[:, None, :] * np.sqrt(1 + leverage)[..., None]
+    # The annual cycle averages out over whole years, leaving the trend's mean.
+    average = coef[:, None, 0, :] + coef[:, None, 1, :] * horizons[None, :, None] / 2
+    periods = horizons[None, :] * DAYS_PER_YEAR / cadence[:, None]
+
+    # Carbon amounts are never negative.
+    return {
+        'site': sites[starts],
+        'observations': n,
+        'last_day': last_day,
+        'cadence': cadence,
+        'level': coef[:, 0, :],
+        'slope': coef[:, 1, :],
+        'amplitude': np.hypot(coef[:, 2, :], coef[:, 3, :]),
+        'sigma': sigma,
+        'value': np.maximum(value, 0.0),
+        'lower': np.maximum(value - half, 0.0),
+        'upper': np.maximum(value + half, 0.0),
+        'cumulative': np.maximum(average * periods[..., None], 0.0),
+    }
+
+
+def _fit_chunk(arguments):
+    return fit(*arguments)
+
+
+def fit_sites(sites, days, values, horizons, z=1.96, processes=None):
+    """``fit`` for a batch, split by site across ``processes`` forked workers when it is large."""
+    processes = processes or settings.FORECAST_PROCESSES
+    if processes <= 1 or len(sites) < settings.FORECAST_PARALLEL_MIN_ROWS:
+        return fit(sites, days, values, horizons, z)
+
+    starts = np.flatnonzero(np.r_[True, sites[1:] != sites[:-1]])
+    # Cut at site boundaries so no site is split between workers.
+    cuts = np.unique(starts[np.linspace(0, len(starts), processes + 1).astype(int)[:-1]])
+    bounds = list(zip(cuts, np.r_[cuts[1:], len(sites)]))
+    chunks = [(sites[a:b], days[a:b], values[a:b], horizons, z) for a, b in bounds]
+    with multiprocessing.get_context('fork').Pool(len(chunks)) as pool:
+        parts = pool.map(_fit_chunk, chunks)
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def _number(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _forecast_rows(result, horizons, fitted_at):
+    rows = []
+    minimum = settings.FORECAST_MIN_OBSERVATIONS
+    for g, site_id in enumerate(result['site'].tolist()):
+        if result['observations'][g] < minimum:
+            continue
+        last_day = int(result['last_day'][g])
+        dates = [
+            date.fromordinal(last_day + int(round(years * DAYS_PER_YEAR))).isoformat() for years in horizons
+        ]
+        for m, metric in enumerate(FORECAST_METRICS):
+            projections = [
+                {
+                    'years': years,
+                    'date': dates[h],
+                    'value': float(result['value'][g, h, m]),
+                    'lower': _number(result['lower'][g, h, m]),
+                    'upper': _number(result['upper'][g, h, m]),
+                    'cumulative': float(result['cumulative'][g, h, m]),
+                }
+                for h, years in enumerate(horizons)
+            ]
+            rows.append(SiteForecast(
+                site_id=site_id,
+                metric=metric,
+                observations=int(result['observations'][g]),
+                last_observation=date.fromordinal(last_day),
+                cadence_days=float(result['cadence'][g]),
+                level=float(result['level'][g, m]),
+                slope_per_year=float(result['slope'][g, m]),
+                seasonal_amplitude=float(result['amplitude'][g, m]),
+                residual_std=_number(result['sigma'][g, m]),
+                projections=projections,
+                fitted_at=fitted_at,
+            ))
+    return rows
+
+
+def stale_site_ids():
+    """
+    Sites whose forecasts were invalidated since they were fitted, or that have
+    enough analytics for a forecast but none yet. Sites below
+    ``FORECAST_MIN_OBSERVATIONS`` never get one, so they are not "missing".
+    """
+    invalidated = SiteForecast.objects.filter(invalidated_at__gt=F('fitted_at')).values_list('site_id', flat=True)
+    missing = (
+        SiteAnalytics.objects.values('site_id')
+        .annotate(observations=Count('id'))
+        .filter(observations__gte=settings.FORECAST_MIN_OBSERVATIONS)
+        .exclude(site_id__in=SiteForecast.objects.values('site_id'))
+        .values_list('site_id', flat=True)
+    )
+    return sorted(set(invalidated) | set(missing))
+
+
+def refresh_forecasts(site_ids=None, full=False, processes=None, on_progress=None):
+    """
+    Refit forecasts for ``site_ids``, every site with analytics (``full``) or
+    just the stale ones, in batches of ``FORECAST_BATCH_SIZE`` sites.
+
+    Sites left with fewer than ``FORECAST_MIN_OBSERVATIONS`` observations lose
+    their forecasts. Returns ``{'sites': considered, 'fitted': forecast}``.
+    """
+    if site_ids is None:
+        if full:
+            site_ids = list(SiteAnalytics.objects.order_by('site_id').values_list('site_id', flat=True).distinct())
+        else:
+            site_ids = stale_site_ids()
+    site_ids = sorted(set(site_ids))
+    horizons = list(range(1, settings.FORECAST_HORIZON_YEARS + 1))
+    batch_size = settings.FORECAST_BATCH_SIZE
+    fitted = 0
+
+    for offset in range(0, len(site_ids), batch_size):
+        batch = site_ids[offset:offset + batch_size]
+        # Taken before loading so writes that land meanwhile leave the rows stale.
+        fitted_at = timezone.now()
+        sites, days, values = load_histories(batch)
+        result = fit_sites(sites, days, values, horizons, settings.FORECAST_INTERVAL_Z, processes)
+        rows = _forecast_rows(result, horizons, fitted_at)
+        kept = {row.site_id for row in rows}
+
+        with transaction.atomic():
+            dropped = [site_id for site_id in batch if site_id not in kept]
+            if dropped:
+                SiteForecast.objects.filter(site_id__in=dropped).delete()
+            SiteForecast.objects.bulk_create(
+                rows, batch_size=500, update_conflicts=True, unique_fields=['site', 'metric'],
+                update_fields=[
+                    'observations', 'last_observation', 'cadence_days', 'level', 'slope_per_year',
+                    'seasonal_amplitude', 'residual_std', 'projections', 'fitted_at',
+                ],
+            )
+        fitted += len(kept)
+        if on_progress is not None:
+            on_progress(offset + len(batch), len(site_ids))
+
+    return {'sites': len(site_ids), 'fitted': fitted}
+
+
+def _refresh_forecasts(site_ids):
+    from jobs.queue import enqueue
+
+    SiteForecast.objects.filter(site_id__in=site_ids).update(invalidated_at=timezone.now())
+    enqueue(
+        'stats.refresh_forecasts', key='forecasts:refresh',
+        delay=timedelta(seconds=settings.FORECAST_REFRESH_DELAY),
+    )
+
+
+_pending_refreshes = CommitBatch(_refresh_forecasts)
+
+
+def schedule_forecast_refresh(site_id):
+    """Invalidate a site's forecasts and queue one refresh after the current transaction commits."""
+    _pending_refreshes.add(site_id)
+
+
+def aggregate_projections(projections):
+    """
+    Sum per-site projections (lists of horizon dicts) into one list.
+
+    Values and cumulative amounts add up; interval half-widths are combined
+    in quadrature, treating sites as independent.
+    """
+    totals = {}
+    for site_projections in projections:
+        for projection in site_projections:
+            total = totals.setdefault(projection['years'], {'value': 0.0, 'variance': 0.0, 'cumulative': 0.0})
+            total['value'] += projection['value']
+            total['cumulative'] += projection['cumulative']
+            if projection['upper'] is not None:
+                total['variance'] += (projection['upper'] - projection['value']) ** 2
+    return [
+        {
+            'years': years,
+            'value': total['value'],
+            'lower': max(total['value'] - total['variance'] ** 0.5, 0.0),
+            'upper': total['value'] + total['variance'] ** 0.5,
+            'cumulative': total['cumulative'],
+        }
+        for years, total in sorted(totals.items())
+    ]
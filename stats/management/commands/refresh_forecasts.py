@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stats.forecasting import refresh_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Fit carbon forecasts for sites whose forecasts are missing or stale (or all with --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', type=int, action='append', dest='sites',
+                            help='Site id to refit (repeatable)')
+        parser.add_argument('--full', action='store_true', help='Refit every site with analytics')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes for large batches (defaults to FORECAST_PROCESSES)')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} sites')
+
+        started = time.monotonic()
+        result = refresh_forecasts(
+            options['sites'], full=options['full'], processes=options['processes'], on_progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {result['fitted']} of {result['sites']} sites in {time.monotonic() - started:.1f}s"
+        ))
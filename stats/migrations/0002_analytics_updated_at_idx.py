@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="siteanalytics",
+            index=models.Index(fields=["updated_at"], name="analytics_updated_at_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0002_analytics_updated_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="siteanalytics",
+            index=models.Index(fields=["-date", "-id"], name="analytics_date_id_idx"),
+        ),
+    ]
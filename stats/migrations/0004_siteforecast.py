@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-19 12:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0006_change_feed"),
+        ("stats", "0003_analytics_date_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SiteForecast",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        choices=[
+                            ("carbon_sequestered", "Carbon sequestered"),
+                            ("carbon_offset", "Carbon offset"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("observations", models.IntegerField()),
+                ("last_observation", models.DateField()),
+                (
+                    "cadence_days",
+                    models.FloatField(help_text="Average days between observations"),
+                ),
+                (
+                    "level",
+                    models.FloatField(help_text="Trend value at the last observation"),
+                ),
+                ("slope_per_year", models.FloatField()),
+                ("seasonal_amplitude", models.FloatField(default=0.0)),
+                ("residual_std", models.FloatField(blank=True, null=True)),
+                ("projections", models.JSONField(default=list)),
+                ("fitted_at", models.DateTimeField()),
+                ("invalidated_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "site",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="forecasts",
+                        to="projects.site",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["site_id", "metric"],
+                "unique_together": {("site", "metric")},
+            },
+        ),
+    ]
@@ -24,6 +24,44 @@ class SiteAnalytics(models.Model):
     class Meta:
         ordering = ['-date']
         unique_together = ['site', 'date']
+        indexes = [
+            models.Index(fields=['updated_at'], name='analytics_updated_at_idx'),
+            models.Index(fields=['-date', '-id'], name='analytics_date_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.site.name} - {self.date}"
+
+
+class SiteForecast(models.Model):
+    """Trend + seasonal model of one site's metric and its projections, maintained by stats.forecasting."""
+    METRIC_CHOICES = [
+        ('carbon_sequestered', 'Carbon sequestered'),
+        ('carbon_offset', 'Carbon offset'),
+    ]
+    
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='forecasts')
+    metric = models.CharField(max_length=32, choices=METRIC_CHOICES)
+    
+    # Fitted model
+    observations = models.IntegerField()
+    last_observation = models.DateField()
+    cadence_days = models.FloatField(help_text='Average days between observations')
+    level = models.FloatField(help_text='Trend value at the last observation')
+    slope_per_year = models.FloatField()
+    seasonal_amplitude = models.FloatField(default=0.0)
+    residual_std = models.FloatField(null=True, blank=True)
+    
+    # [{years, date, value, lower, upper, cumulative}] for 1..FORECAST_HORIZON_YEARS
+    projections = models.JSONField(default=list)
+    
+    fitted_at = models.DateTimeField()
+    # Set when the site's analytics change after fitted_at; the refresh job refits these rows
+    invalidated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['site_id', 'metric']
+        unique_together = ['site', 'metric']
+    
+    def __str__(self):
+        return f"{self.site_id} - {self.metric}"
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from daruka.oncommit import CommitBatch
+from projects.caching import bump_version
+from projects.models import Site, Tombstone
+from projects.signals import cascaded_from
+
+from .models import SiteAnalytics
+
+ANALYTICS_VERSION_KEY = 'analytics:version'
+
+
+def site_analytics_version_key(site_id):
+    return f'analytics:site:{site_id}:version'
+
+
+def project_analytics_version_key(project_id):
+    return f'analytics:project:{project_id}:version'
+
+
+def _bump_project_analytics_versions(site_ids):
+    # One lookup per transaction however many analytics rows it wrote.
+    project_ids = Site.objects.filter(pk__in=site_ids).values_list('project_id', flat=True).distinct()
+    for project_id in project_ids:
+        bump_version(project_analytics_version_key(project_id))
+
+
+_changed_sites = CommitBatch(_bump_project_analytics_versions)
+
+
+@receiver(post_save, sender=SiteAnalytics)
+@receiver(post_delete, sender=SiteAnalytics)
+def invalidate_analytics_caches(sender, instance, **kwargs):
+    site_id = instance.site_id
+    transaction.on_commit(lambda: bump_version(ANALYTICS_VERSION_KEY))
+    transaction.on_commit(lambda: bump_version(site_analytics_version_key(site_id)))
+    _changed_sites.add(site_id)
+
+
+@receiver(post_save, sender=SiteAnalytics)
+@receiver(post_delete, sender=SiteAnalytics)
+def refresh_site_forecasts(sender, instance, **kwargs):
+    from .forecasting import schedule_forecast_refresh
+
+    schedule_forecast_refresh(instance.site_id)
+
+
+@receiver(post_delete, sender=SiteAnalytics)
+def record_analytics_tombstone(sender, instance, origin=None, **kwargs):
+    # Rows removed together with their site are covered by the site's tombstone.
+    if cascaded_from(origin, SiteAnalytics):
+        return
+    Tombstone.objects.create(model='analytics', object_id=instance.pk, site_id=instance.site_id)
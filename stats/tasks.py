@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timedelta
+
+from jobs.queue import job, report_progress
+
+from .models import SiteAnalytics
+
+
+@job('stats.generate_sample_data')
+def generate_sample_data(site_id):
+    """Generate sample analytics data for demonstration"""
+    from projects.models import Site
+
+    try:
+        site = Site.objects.get(id=site_id)
+    except Site.DoesNotExist:
+        return {'created': 0}
+
+    # Generate data for last 12 months
+    created = 0
+    end_date = datetime.now().date()
+    for i in range(12):
+        date = end_date - timedelta(days=i*30)
+
+        _, was_created = SiteAnalytics.objects.get_or_create(
+            site=site,
+            date=date,
+            defaults={
+                'carbon_sequestered': round(random.uniform(10, 50), 2),
+                'carbon_offset': round(random.uniform(8, 40), 2),
+                'species_count': random.randint(15, 45),
+                'vegetation_index': round(random.uniform(0.4, 0.9), 2),
+                'tree_cover_percentage': round(random.uniform(30, 75), 2),
+                'soil_quality_index': round(random.uniform(50, 90), 2),
+                'water_retention': round(random.uniform(100, 500), 2)
+            }
+        )
+        created += was_created
+    return {'created': created}
+
+
+@job('stats.refresh_forecasts')
+def refresh_forecasts(site_ids=None, full=False):
+    """Refit stale (or all) site forecasts; see stats.forecasting."""
+    from .forecasting import refresh_forecasts as refresh
+
+    def progress(done, total):
+        report_progress(done, total, f'{done}/{total} sites forecast')
+
+    return refresh(site_ids, full=full, on_progress=progress)
@@ -1,3 +1,244 @@
-from django.test import TestCase
+from datetime import date, timedelta
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from projects.models import Project, Site
+
+from .benchmarks import percentile_ranks
+from .forecasting import fit, refresh_forecasts, stale_site_ids
+from .models import SiteAnalytics, SiteForecast
+from .trends import _group_index, linear_fit, moving_average, yoy_delta
+
+User = get_user_model()
+
+
+def square(x, y, size=0.01):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+class TrendMathTests(TestCase):
+    def test_moving_average_restarts_at_each_site(self):
+        sites = np.array([1, 1, 1, 1, 2, 2])
+        values = np.array([1.0, 2.0, 3.0, 4.0, 10.0, 20.0])
+        groups, starts = _group_index(sites)
+        np.testing.assert_allclose(moving_average(values, groups, starts, 2), [1, 1.5, 2.5, 3.5, 10, 15])
+        np.testing.assert_allclose(moving_average(values, groups, starts, 3), [1, 1.5, 2, 3, 10, 15])
+
+    def test_yoy_delta_matches_the_observation_a_year_earlier(self):
+        start = date(2020, 1, 1).toordinal()
+        sites = np.array([1, 1, 1, 2, 2])
+        days = np.array([start, start + 180, start + 370, start, start + 200])
+        values = np.array([1.0, 5.0, 4.0, 7.0, 9.0])
+        groups, _ = _group_index(sites)
+        deltas = yoy_delta(groups, days, values, tolerance=10)
+        np.testing.assert_allclose(deltas, [np.nan, np.nan, 3.0, np.nan, np.nan])
+        self.assertTrue(np.isnan(yoy_delta(groups, days, values, tolerance=2)[2]))
+
+    def test_linear_fit_recovers_each_sites_slope(self):
+        days = np.r_[np.arange(0, 100, 10), np.arange(0, 50, 5)].astype(np.int64)
+        sites = np.r_[np.ones(10), np.full(10, 2)].astype(np.int64)
+        values = np.where(sites == 1, 3 + 0.5 * days, 8 - 0.25 * days)
+        groups, starts = _group_index(sites)
+        slope, mean_x, mean_y = linear_fit(groups, days, values, len(starts))
+        np.testing.assert_allclose(slope, [0.5, -0.25])
+        np.testing.assert_allclose(mean_y, [3 + 0.5 * 45, 8 - 0.25 * 22.5])
+
+
+class TrendApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+        self.site = Site.objects.create(project=self.project, name='s', geometry=square(0, 0), created_by=self.user)
+
+    def add_series(self, values, start=date(2020, 1, 1), step=30):
+        SiteAnalytics.objects.bulk_create([
+            SiteAnalytics(site=self.site, date=start + timedelta(days=step * i), vegetation_index=value)
+            for i, value in enumerate(values)
+        ])
+
+    def trends(self, **params):
+        return self.client.get('/api/analytics/trends/', params)
+
+    def test_flags_an_outlier_against_the_trend(self):
+        values = [0.5 + 0.01 * i + (0.002 if i % 2 else -0.002) for i in range(20)]
+        values[12] -= 0.3
+        self.add_series(values)
+
+        response = self.trends(project=self.project.id)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['sites'][0]
+        self.assertEqual(result['observations'], 20)
+        self.assertAlmostEqual(result['slope_per_year'], 0.01 / 30 * 365.25, delta=0.02)
+        outlier = (date(2020, 1, 1) + timedelta(days=360)).isoformat()
+        self.assertEqual([anomaly['date'] for anomaly in result['anomalies']], [outlier])
+        self.assertEqual(result['anomalies'][0]['direction'], 'drop')
+        self.assertEqual(response.json()['anomalous_sites'], 1)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.trends(project='abc').status_code, 400)
+        self.assertEqual(self.trends(site='1x').status_code, 400)
+        self.assertEqual(self.trends(site=self.site.id, metric='name').status_code, 400)
+        self.assertEqual(self.trends(site=self.site.id, window=0).status_code, 400)
+        self.assertEqual(self.trends().status_code, 400)
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        self.project = Project.objects.create(name='P', created_by=self.user)
+
+    def add_site(self, observations):
+        site = Site.objects.create(
+            project=self.project, name=f's{observations}', geometry=square(observations, 0), created_by=self.user
+        )
+        SiteAnalytics.objects.bulk_create([
+            SiteAnalytics(site=site, date=date(2020, 1, 1) + timedelta(days=30 * i),
+                          carbon_sequestered=10 + i, carbon_offset=5)
+            for i in range(observations)
+        ])
+        return site
+
+    def test_fit_recovers_trend_and_annual_cycle(self):
+        days = date(2020, 1, 1).toordinal() + np.arange(0, 3 * 365, 15)
+        years = (days - days[-1]) / 365.25
+        phase = 2 * np.pi * days / 365.25
+        carbon = 40 + 2.5 * years + 3 * np.sin(phase) - 4 * np.cos(phase)
+        values = np.stack([carbon, np.full(len(days), 7.0)], axis=-1)
+        sites = np.ones(len(days), dtype=np.int64)
+
+        result = fit(sites, days, values, horizons=[1, 2])
+        np.testing.assert_allclose(result['level'][0], [40, 7], atol=1e-6)
+        np.testing.assert_allclose(result['slope'][0], [2.5, 0], atol=1e-6)
+        np.testing.assert_allclose(result['amplitude'][0], [5, 0], atol=1e-6)
+        self.assertEqual(result['observations'][0], len(days))
+        self.assertAlmostEqual(result['cadence'][0], 15)
+        # A whole year ahead the cycle is back where it was, on top of the trend.
+        np.testing.assert_allclose(result['value'][0, 1], [carbon[-1] + 5, 7], atol=0.05)
+        self.assertTrue(np.all(result['lower'] <= result['value']))
+        self.assertTrue(np.all(result['upper'] >= result['value']))
+
+    def test_short_histories_get_a_trend_without_a_cycle(self):
+        days = np.array([0, 30, 60, 90]) + date(2020, 1, 1).toordinal()
+        values = np.stack([1.0 + np.arange(4), np.zeros(4)], axis=-1)
+        result = fit(np.ones(4, dtype=np.int64), days, values, horizons=[1])
+        self.assertAlmostEqual(result['slope'][0, 0], 365.25 / 30)
+        self.assertEqual(result['amplitude'][0, 0], 0)
+
+    def test_only_sites_with_enough_history_are_stale(self):
+        short = self.add_site(2)
+        enough = self.add_site(5)
+        self.assertEqual(stale_site_ids(), [enough.id])
+
+        self.assertEqual(refresh_forecasts(), {'sites': 1, 'fitted': 1})
+        self.assertEqual(stale_site_ids(), [])
+        self.assertFalse(SiteForecast.objects.filter(site=short).exists())
+        self.assertEqual(SiteForecast.objects.filter(site=enough).count(), 2)
+
+        SiteForecast.objects.filter(site=enough).update(invalidated_at=timezone.now())
+        self.assertEqual(stale_site_ids(), [enough.id])
+        refresh_forecasts()
+        self.assertEqual(stale_site_ids(), [])
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile_ranks_share_ties(self):
+        np.testing.assert_allclose(percentile_ranks(np.array([3.0, 1.0, 2.0, 2.0])), [87.5, 12.5, 50, 50])
+
+    def test_other_users_projects_are_not_found(self):
+        owner = User.objects.create_user(email='a@x.io', username='a', password='p')
+        User.objects.create_user(email='b@x.io', username='b', password='p')
+        project = Project.objects.create(name='P', created_by=owner)
+        url = '/api/analytics/benchmarks/'
+
+        self.assertEqual(self.client.get(url, {'user_email': 'a@x.io', 'project': project.id}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'user_email': 'b@x.io', 'project': project.id}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'user_email': 'a@x.io', 'project': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'project': project.id}).status_code, 400)
+
+
+@override_settings(JOBS_EAGER=False)
+class SummaryTests(TestCase):
+    def summary(self, site_id):
+        return self.client.get('/api/analytics/summary/', {'site': site_id})
+
+    def test_sample_data_is_queued_once_per_site(self):
+        user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        project = Project.objects.create(name='P', created_by=user)
+        site = Site.objects.create(project=project, name='s', geometry=square(0, 0), created_by=user)
+
+        first = self.summary(site.id).json()
+        self.assertEqual(first['total_records'], 0)
+        job = Job.objects.get()
+        self.assertEqual(first['job'], job.id)
+
+        Job.objects.filter(pk=job.pk).update(status=Job.SUCCEEDED)
+        self.assertEqual(self.summary(site.id).json()['job'], job.id)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_unknown_sites_do_not_queue_work(self):
+        self.assertEqual(self.summary(999999).status_code, 404)
+        self.assertEqual(self.summary('x').status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@x.io', username='a', password='p')
+        other = User.objects.create_user(email='b@x.io', username='b', password='p')
+        Project.objects.create(name='Not mine', created_by=other)
+
+    def add_project(self, name, sites):
+        project = Project.objects.create(name=name, created_by=self.user)
+        for i, values in enumerate(sites):
+            with self.captureOnCommitCallbacks(execute=True):
+                site = Site.objects.create(
+                    project=project, name=f'{name} {i}', geometry=square(i, 0), created_by=self.user
+                )
+            SiteAnalytics.objects.bulk_create([
+                SiteAnalytics(site=site, date=date(2024, 1, 1) + timedelta(days=day), carbon_sequestered=value,
+                              carbon_offset=1)
+                for day, value in enumerate(values)
+            ])
+        return project
+
+    def dashboard(self):
+        return self.client.get('/api/dashboard/', {'user_email': 'a@x.io'})
+
+    def test_latest_row_and_totals_per_project(self):
+        first = self.add_project('A', [[1, 2, 3], []])
+        self.add_project('B', [[10]])
+
+        data = self.dashboard().json()
+        self.assertEqual([project['name'] for project in data['projects']], ['B', 'A'])
+        project = data['projects'][1]
+        self.assertEqual(project['site_count'], 2)
+        self.assertAlmostEqual(project['total_area'], Project.objects.get(pk=first.pk).total_area)
+        self.assertEqual(
+            project['totals'], {'carbon_sequestered': 6, 'carbon_offset': 3, 'latest_carbon_sequestered': 3}
+        )
+        with_history, empty = project['sites']
+        self.assertEqual((with_history['analytics_count'], with_history['latest']['date']), (3, '2024-01-03'))
+        self.assertEqual((empty['analytics_count'], empty['latest']), (0, None))
+
+        self.assertEqual(data['totals']['projects'], 2)
+        self.assertEqual(data['totals']['sites'], 3)
+        self.assertEqual(data['totals']['carbon_sequestered'], 16)
+
+    def test_query_count_does_not_grow_with_sites(self):
+        self.add_project('A', [[1, 2]])
+        with self.assertNumQueries(3):
+            self.assertEqual(self.dashboard().status_code, 200)
+
+        self.add_project('B', [[1, 2, 3]] * 5)
+        self.add_project('C', [[4]] * 3)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.dashboard().json()['projects']), 3)
+
+    def test_requires_user_email(self):
+        self.assertEqual(self.client.get('/api/dashboard/').status_code, 400)
@@ -0,0 +1,207 @@
+"""
+Rolling statistics, trends and anomaly flags for analytics series.
+
+All requested sites are loaded with one ``values_list`` query into flat NumPy
+arrays sorted by (site, date), and every indicator is computed for all sites
+at once with group-aware array operations:
+
+* moving average over the last ``window`` observations of the same site
+  (cumulative sums, restarted at each site boundary);
+* year-over-year delta against the same site's observation closest to one
+  year earlier (within ``TRENDS_YOY_TOLERANCE_DAYS``), found by binary search
+  on a combined (site, day) key;
+* least-squares slope per site, in metric units per year (per-site sums
+  via ``np.bincount``);
+* anomalies: observations whose residual from the site's trend line is more
+  than ``TRENDS_ANOMALY_Z`` standard deviations away.
+
+Results are cached per site, metric, window and date range, keyed by the
+site's analytics version, so repeated portfolio scans only compute sites whose
+data changed.
+"""
+
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from projects.caching import get_versions
+
+from .models import SiteAnalytics
+from .signals import site_analytics_version_key
+
+METRICS = (
+    'carbon_sequestered', 'carbon_offset', 'species_count', 'vegetation_index',
+    'tree_cover_percentage', 'soil_quality_index', 'water_retention',
+)
+DAYS_PER_YEAR = 365.25
+
+
+def load_series(site_ids, metric, start=None, end=None):
+    """Return ``(sites, days, values)`` arrays sorted by site then date."""
+    analytics = SiteAnalytics.objects.filter(site_id__in=site_ids)
+    if start:
+        analytics = analytics.filter(date__gte=start)
+    if end:
+        analytics = analytics.filter(date__lte=end)
+    rows = analytics.order_by('site_id', 'date').values_list('site_id', 'date', metric)
+
+    sites, days, values = [], [], []
+    for site_id, day, value in rows.iterator(chunk_size=5000):
+        sites.append(site_id)
+        days.append(day.toordinal())
+        values.append(value)
+    return (
+        np.asarray(sites, dtype=np.int64),
+        np.asarray(days, dtype=np.int64),
+        np.asarray(values, dtype=np.float64),
+    )
+
+
+def _group_index(sites):
+    """Group number of every row and the first row of each group."""
+    starts = np.flatnonzero(np.r_[True, sites[1:] != sites[:-1]]) if len(sites) else np.empty(0, dtype=np.int64)
+    groups = np.cumsum(np.r_[False, sites[1:] != sites[:-1]]) if len(sites) else np.empty(0, dtype=np.int64)
+    return groups, starts
+
+
+def moving_average(values, groups, starts, window):
+    positions = np.arange(len(values))
+    first = np.maximum(positions - window + 1, starts[groups])
+    sums = np.r_[0.0, np.cumsum(values)]
+    return (sums[positions + 1] - sums[first]) / (positions - first + 1)
+
+
+def yoy_delta(groups, days, values, tolerance=None):
+    """Change from the same site's observation about one year earlier (NaN if none)."""
+    if tolerance is None:
+        tolerance = settings.TRENDS_YOY_TOLERANCE_DAYS
+    if not len(values):
+        return np.empty(0)
+    # Rows are sorted by (group, day), so this combined key is sorted too.
+    span = int(days.max() - days.min()) + 2 * 366 + 1
+    keys = groups * span + (days - days.min() + 366)
+    targets = keys - 365
+    right = np.clip(np.searchsorted(keys, targets), 0, len(keys) - 1)
+    left = np.clip(right - 1, 0, len(keys) - 1)
+    best = np.where(np.abs(keys[left] - targets) < np.abs(keys[right] - targets), left, right)
+    found = (groups[best] == groups) & (np.abs(keys[best] - targets) <= tolerance) & (best != np.arange(len(keys)))
+    return np.where(found, values - values[best], np.nan)
+
+
+def linear_fit(groups, days, values, count):
+    """Per-group slope (per day) and intercept at the group's mean day."""
+    n = np.bincount(groups, minlength=count).astype(np.float64)
+    mean_x = np.bincount(groups, days, minlength=count) / n
+    mean_y = np.bincount(groups, values, minlength=count) / n
+    dx = days - mean_x[groups]
+    dy = values - mean_y[groups]
+    sxx = np.bincount(groups, dx * dx, minlength=count)
+    sxy = np.bincount(groups, dx * dy, minlength=count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+    return slope, mean_x, mean_y
+
+
+def anomaly_scores(groups, days, values, slope, mean_x, mean_y, count):
+    residuals = values - (mean_y[groups] + slope[groups] * (days - mean_x[groups]))
+    n = np.bincount(groups, minlength=count)
+    # Two parameters were fitted; fewer than four points leave no useful spread.
+    dof = np.maximum(n - 2, 1)
+    scale = np.sqrt(np.bincount(groups, residuals * residuals, minlength=count) / dof)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where((scale[groups] > 1e-12) & (n[groups] >= 4), residuals / scale[groups], 0.0)
+    return z
+
+
+def compute_trends(site_ids, metric, start=None, end=None, window=None, include_series=True):
+    """Indicators for every site in ``site_ids`` as ``{site_id: result}``."""
+    window = window or settings.TRENDS_DEFAULT_WINDOW
+    threshold = settings.TRENDS_ANOMALY_Z
+    sites, days, values = load_series(site_ids, metric, start, end)
+    results = {site_id: _empty_result(site_id, include_series) for site_id in site_ids}
+    if not len(values):
+        return results
+
+    groups, starts = _group_index(sites)
+    count = len(starts)
+    averages = moving_average(values, groups, starts, window)
+    deltas = yoy_delta(groups, days, values)
+    slope, mean_x, mean_y = linear_fit(groups, days, values, count)
+    z = anomaly_scores(groups, days, values, slope, mean_x, mean_y, count)
+    flagged = np.abs(z) >= threshold
+
+    ends = np.r_[starts[1:], len(values)]
+    for group, (first, last) in enumerate(zip(starts, ends)):
+        site_id = int(sites[first])
+        dates = [_iso(day) for day in days[first:last]]
+        anomalies = [
+            {
+                'date': dates[i - first],
+                'value': float(values[i]),
+                'z_score': round(float(z[i]), 3),
+                'direction': 'drop' if z[i] < 0 else 'spike',
+            }
+            for i in np.flatnonzero(flagged[first:last]) + first
+        ]
+        result = {
+            'site': site_id,
+            'observations': int(last - first),
+            'latest': float(values[last - 1]),
+            'latest_date': dates[-1],
+            'slope_per_year': float(slope[group] * DAYS_PER_YEAR),
+            'latest_yoy_delta': _float(deltas[last - 1]),
+            'anomalies': anomalies,
+        }
+        if include_series:
+            result['series'] = {
+                'dates': dates,
+                'values': values[first:last].tolist(),
+                'moving_average': averages[first:last].tolist(),
+                'yoy_delta': [_float(value) for value in deltas[first:last]],
+            }
+        results[site_id] = result
+    return results
+
+
+def _empty_result(site_id, include_series):
+    result = {
+        'site': site_id, 'observations': 0, 'latest': None, 'latest_date': None,
+        'slope_per_year': None, 'latest_yoy_delta': None, 'anomalies': [],
+    }
+    if include_series:
+        result['series'] = {'dates': [], 'values': [], 'moving_average': [], 'yoy_delta': []}
+    return result
+
+
+def _iso(ordinal):
+    return date.fromordinal(int(ordinal)).isoformat()
+
+
+def _float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def site_trends(site_ids, metric, start=None, end=None, window=None, include_series=True):
+    """``compute_trends`` through the per-site cache; only changed sites are recomputed."""
+    window = window or settings.TRENDS_DEFAULT_WINDOW
+    site_ids = list(dict.fromkeys(site_ids))
+    versions = get_versions(site_analytics_version_key(site_id) for site_id in site_ids)
+    keys = {
+        site_id: (
+            f'trends:{site_id}:v{versions[site_analytics_version_key(site_id)]}:'
+            f'{metric}:{window}:{start}:{end}:{int(include_series)}'
+        )
+        for site_id in site_ids
+    }
+    cached = cache.get_many(keys.values())
+    results = {site_id: cached[key] for site_id, key in keys.items() if key in cached}
+    missing = [site_id for site_id in site_ids if site_id not in results]
+    batch_size = settings.TRENDS_BATCH_SIZE
+    for offset in range(0, len(missing), batch_size):
+        batch = missing[offset:offset + batch_size]
+        computed = compute_trends(batch, metric, start, end, window, include_series)
+        cache.set_many({keys[site_id]: computed[site_id] for site_id in batch}, settings.TRENDS_CACHE_TIMEOUT)
+        results.update(computed)
+    return [results[site_id] for site_id in site_ids]
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SiteAnalyticsViewSet
+from .views import SiteAnalyticsViewSet, dashboard
 
 router = DefaultRouter()
 router.register(r'analytics', SiteAnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
+    path('dashboard/', dashboard, name='dashboard'),
     path('', include(router.urls)),
 ]
@@ -1,12 +1,51 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Avg, Sum, Max, Min
+from django.db.models import Avg, Count, F, Prefetch, Sum, Max, Min
+from django.db.models.functions import RowNumber
+from django.db.models import Window
 from .models import SiteAnalytics
 from .serializers import SiteAnalyticsSerializer
-from datetime import datetime, timedelta
-import random
+from daruka.routers import use_replica
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from jobs.models import Job
+from jobs.queue import enqueue
+from daruka.singleflight import SingleFlight
+from projects.caching import get_version
+from .signals import site_analytics_version_key
+
+# Concurrent requests for the same site share one computation.
+SUMMARY_FLIGHT = SingleFlight('analytics.summary')
+TIME_SERIES_FLIGHT = SingleFlight('analytics.time_series')
+
+
+def _flight_key(site_id):
+    return f'{site_id}:v{get_version(site_analytics_version_key(site_id))}'
+
+
+def _sample_data_job(site_id):
+    """
+    The site's sample-data job, queued at most once per site.
+
+    ``summary`` is a GET, so repeated calls reuse the earlier job (finished or
+    not) rather than adding a row each time.
+    """
+    key = f'sample-data:{site_id}'
+    existing = Job.objects.filter(key=key).order_by('-pk').first()
+    if existing is not None:
+        return existing
+    return enqueue('stats.generate_sample_data', site_id, key=key)
+
+
+def parse_window_date(value):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    return parsed
 
 class SiteAnalyticsViewSet(viewsets.ModelViewSet):
     queryset = SiteAnalytics.objects.all()
@@ -21,73 +60,328 @@ class SiteAnalyticsViewSet(viewsets.ModelViewSet):
         return queryset.order_by('-date')
     
     @action(detail=False, methods=['get'])
+    @use_replica
     def summary(self, request):
         """Get summary statistics for a site"""
         site_id = request.query_params.get('site')
         if not site_id:
             return Response({'error': 'Site ID required'}, status=400)
+        if not site_id.isdigit():
+            return Response({'error': 'Site ID must be a number'}, status=400)
+        from projects.models import Site
+        if not Site.objects.filter(pk=site_id).exists():
+            return Response({'error': 'Site not found'}, status=404)
         
-        analytics = SiteAnalytics.objects.filter(site_id=site_id)
-        
-        if not analytics.exists():
-            # Generate sample data if none exists
-            self.generate_sample_data(site_id)
+        def compute():
             analytics = SiteAnalytics.objects.filter(site_id=site_id)
+            
+            job = None
+            if not analytics.exists():
+                # Generate sample data if none exists; runs inline when JOBS_EAGER
+                job = _sample_data_job(int(site_id))
+                analytics = SiteAnalytics.objects.filter(site_id=site_id)
+            
+            summary = {
+                'total_carbon_sequestered': analytics.aggregate(Sum('carbon_sequestered'))['carbon_sequestered__sum'] or 0,
+                'avg_vegetation_index': analytics.aggregate(Avg('vegetation_index'))['vegetation_index__avg'] or 0,
+                'total_species': analytics.aggregate(Max('species_count'))['species_count__max'] or 0,
+                'avg_tree_cover': analytics.aggregate(Avg('tree_cover_percentage'))['tree_cover_percentage__avg'] or 0,
+                'total_records': analytics.count(),
+                'latest_date': analytics.first().date if analytics.exists() else None
+            }
+            if job is not None and not summary['total_records']:
+                summary['job'] = job.id
+            return summary
         
-        summary = {
-            'total_carbon_sequestered': analytics.aggregate(Sum('carbon_sequestered'))['carbon_sequestered__sum'] or 0,
-            'avg_vegetation_index': analytics.aggregate(Avg('vegetation_index'))['vegetation_index__avg'] or 0,
-            'total_species': analytics.aggregate(Max('species_count'))['species_count__max'] or 0,
-            'avg_tree_cover': analytics.aggregate(Avg('tree_cover_percentage'))['tree_cover_percentage__avg'] or 0,
-            'total_records': analytics.count(),
-            'latest_date': analytics.first().date if analytics.exists() else None
-        }
-        
-        return Response(summary)
+        return Response(SUMMARY_FLIGHT.do(_flight_key(site_id), compute))
     
     @action(detail=False, methods=['get'])
+    @use_replica
     def time_series(self, request):
         """Get time series data for charts"""
         site_id = request.query_params.get('site')
         if not site_id:
             return Response({'error': 'Site ID required'}, status=400)
+        if not site_id.isdigit():
+            return Response({'error': 'Site ID must be a number'}, status=400)
         
-        analytics = SiteAnalytics.objects.filter(site_id=site_id).order_by('date')
-        
-        data = {
-            'dates': [a.date.isoformat() for a in analytics],
-            'carbon': [float(a.carbon_sequestered) for a in analytics],
-            'vegetation': [float(a.vegetation_index) for a in analytics],
-            'species': [a.species_count for a in analytics],
-            'tree_cover': [float(a.tree_cover_percentage) for a in analytics]
-        }
+        def compute():
+            analytics = SiteAnalytics.objects.filter(site_id=site_id).order_by('date')
+            
+            return {
+                'dates': [a.date.isoformat() for a in analytics],
+                'carbon': [float(a.carbon_sequestered) for a in analytics],
+                'vegetation': [float(a.vegetation_index) for a in analytics],
+                'species': [a.species_count for a in analytics],
+                'tree_cover': [float(a.tree_cover_percentage) for a in analytics]
+            }
         
-        return Response(data)
+        return Response(TIME_SERIES_FLIGHT.do(_flight_key(site_id), compute))
     
-    def generate_sample_data(self, site_id):
-        """Generate sample analytics data for demonstration"""
+    @action(detail=False, methods=['get'])
+    @use_replica
+    def trends(self, request):
+        """
+        Moving averages, year-over-year deltas, trend slopes and anomaly flags.
+        
+        Pass ?site=<id> (repeatable), ?project=<id> or ?user_email= for the
+        whole portfolio; ?series=0 drops the per-date arrays for fast scans and
+        ?anomalies_only=1 keeps only sites with flagged observations.
+        """
         from projects.models import Site
+        from .trends import METRICS, site_trends
         
+        metric = request.query_params.get('metric', 'vegetation_index')
+        if metric not in METRICS:
+            return Response({'error': f'metric must be one of {", ".join(METRICS)}'}, status=400)
         try:
-            site = Site.objects.get(id=site_id)
-        except Site.DoesNotExist:
-            return
+            window = int(request.query_params.get('window', settings.TRENDS_DEFAULT_WINDOW))
+            start = parse_window_date(request.query_params.get('start'))
+            end = parse_window_date(request.query_params.get('end'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        if window < 1:
+            return Response({'error': 'window must be at least 1'}, status=400)
         
-        # Generate data for last 12 months
-        end_date = datetime.now().date()
-        for i in range(12):
-            date = end_date - timedelta(days=i*30)
-            
-            SiteAnalytics.objects.get_or_create(
-                site=site,
-                date=date,
-                defaults={
-                    'carbon_sequestered': round(random.uniform(10, 50), 2),
-                    'carbon_offset': round(random.uniform(8, 40), 2),
-                    'species_count': random.randint(15, 45),
-                    'vegetation_index': round(random.uniform(0.4, 0.9), 2),
-                    'tree_cover_percentage': round(random.uniform(30, 75), 2),
-                    'soil_quality_index': round(random.uniform(50, 90), 2),
-                    'water_retention': round(random.uniform(100, 500), 2)
-                }
-            )
+        site_ids = request.query_params.getlist('site')
+        if site_ids:
+            if not all(site_id.isdigit() for site_id in site_ids):
+                return Response({'error': 'Site ID must be a number'}, status=400)
+            site_ids = [int(site_id) for site_id in site_ids]
+        else:
+            sites = Site.objects.all()
+            project_id = request.query_params.get('project')
+            if project_id:
+                if not project_id.isdigit():
+                    return Response({'error': 'Project ID must be a number'}, status=400)
+                sites = sites.filter(project_id=project_id)
+            if request.query_params.get('user_email'):
+                sites = sites.filter(project__created_by__email=request.query_params['user_email'])
+            elif not project_id:
+                return Response({'error': 'site, project or user_email required'}, status=400)
+            site_ids = list(sites.order_by('id').values_list('id', flat=True))
+        
+        include_series = request.query_params.get('series', '1') not in ('0', 'false')
+        results = site_trends(site_ids, metric, start, end, window, include_series)
+        if request.query_params.get('anomalies_only') in ('1', 'true'):
+            results = [result for result in results if result['anomalies']]
+        
+        return Response({
+            'metric': metric,
+            'window': window,
+            'start': start,
+            'end': end,
+            'site_count': len(site_ids),
+            'anomalous_sites': sum(1 for result in results if result['anomalies']),
+            'sites': results,
+        })
+
+    @action(detail=False, methods=['get'])
+    @use_replica
+    def forecast(self, request):
+        """
+        Stored carbon forecasts summed per project, 1 to FORECAST_HORIZON_YEARS ahead.
+
+        Pass ?project=<id> (repeatable) or ?user_email=; ?metric= is
+        carbon_sequestered (default) or carbon_offset, ?years=<n> keeps one
+        horizon and ?sites=1 adds each site's own forecast.
+        """
+        from projects.models import Project
+        from .forecasting import FORECAST_METRICS, aggregate_projections
+        from .models import SiteForecast
+
+        metric = request.query_params.get('metric', 'carbon_sequestered')
+        if metric not in FORECAST_METRICS:
+            return Response({'error': f'metric must be one of {", ".join(FORECAST_METRICS)}'}, status=400)
+        years = request.query_params.get('years')
+        if years is not None:
+            if not years.isdigit() or not 1 <= int(years) <= settings.FORECAST_HORIZON_YEARS:
+                return Response(
+                    {'error': f'years must be between 1 and {settings.FORECAST_HORIZON_YEARS}'}, status=400
+                )
+            years = int(years)
+
+        projects = Project.objects.all()
+        project_ids = request.query_params.getlist('project')
+        if project_ids:
+            if not all(project_id.isdigit() for project_id in project_ids):
+                return Response({'error': 'Project ID must be a number'}, status=400)
+            projects = projects.filter(id__in=project_ids)
+        if request.query_params.get('user_email'):
+            projects = projects.filter(created_by__email=request.query_params['user_email'])
+        elif not project_ids:
+            return Response({'error': 'project or user_email required'}, status=400)
+        projects = list(projects.annotate(site_count=Count('sites')).order_by('id').values('id', 'name', 'site_count'))
+
+        forecasts = (
+            SiteForecast.objects.filter(site__project_id__in=[project['id'] for project in projects], metric=metric)
+            .order_by('site_id')
+            .values_list('site__project_id', 'site_id', 'projections', 'fitted_at', 'invalidated_at',
+                         'observations', 'slope_per_year', 'last_observation')
+        )
+        by_project = {}
+        for project_id, site_id, projections, fitted_at, invalidated_at, observations, slope, last in forecasts:
+            if years is not None:
+                projections = [projection for projection in projections if projection['years'] == years]
+            by_project.setdefault(project_id, []).append({
+                'site': site_id,
+                'observations': observations,
+                'last_observation': last,
+                'slope_per_year': slope,
+                'fitted_at': fitted_at,
+                'stale': invalidated_at is not None and invalidated_at > fitted_at,
+                'projections': projections,
+            })
+
+        include_sites = request.query_params.get('sites') in ('1', 'true')
+        results = []
+        for project in projects:
+            sites = by_project.get(project['id'], [])
+            result = {
+                'project': project['id'],
+                'name': project['name'],
+                'site_count': project['site_count'],
+                'forecast_sites': len(sites),
+                'stale_sites': sum(1 for site in sites if site['stale']),
+                'fitted_at': min((site['fitted_at'] for site in sites), default=None),
+                'projections': aggregate_projections(site['projections'] for site in sites),
+            }
+            if include_sites:
+                result['sites'] = sites
+            results.append(result)
+
+        return Response({
+            'metric': metric,
+            'projects': results,
+            'total': aggregate_projections(result['projections'] for result in results),
+        })
+
+    @action(detail=False, methods=['get'])
+    @use_replica
+    def benchmarks(self, request):
+        """
+        Percentile ranks of the user's sites on carbon per hectare, NDVI and species richness.
+
+        Sites are ranked against the user's portfolio, against one of their
+        projects with ?project=<id>, or against every site with ?population=all.
+        """
+        from projects.models import Project, Site
+        from .benchmarks import BENCHMARK_METRICS, distribution, get_benchmarks, site_results
+
+        user_email = request.query_params.get('user_email')
+        if not user_email:
+            return Response({'error': 'user_email is required'}, status=400)
+        sites = Site.objects.filter(project__created_by__email=user_email)
+        project_id = request.query_params.get('project')
+        population = request.query_params.get('population', 'portfolio')
+        if project_id:
+            if not project_id.isdigit():
+                return Response({'error': 'Project ID must be a number'}, status=400)
+            if not Project.objects.filter(pk=project_id, created_by__email=user_email).exists():
+                return Response({'error': 'Project not found'}, status=404)
+            sites = sites.filter(project_id=project_id)
+            population_key = f'project:{project_id}'
+            population_sites = sites
+        elif population == 'all':
+            population_key = 'all'
+            population_sites = None
+        elif population == 'portfolio':
+            population_key = f'owner:{user_email}'
+            population_sites = sites
+        else:
+            return Response({'error': 'population must be portfolio or all'}, status=400)
+
+        benchmarks = get_benchmarks(population_key, population_sites)
+        return Response({
+            'population': 'project' if project_id else population,
+            'population_size': len(benchmarks['site']),
+            'distribution': {metric: distribution(benchmarks[metric]) for metric in BENCHMARK_METRICS},
+            'sites': site_results(benchmarks, sites.values_list('id', flat=True)),
+        })
+
+LATEST_FIELDS = ['date', 'carbon_sequestered', 'carbon_offset', 'species_count', 'vegetation_index',
+                 'tree_cover_percentage', 'soil_quality_index', 'water_retention']
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+@use_replica
+def dashboard(request):
+    """
+    Everything the dashboard shows in one response: the user's projects with
+    their sites, each site's latest analytics row and totals.
+    
+    Three queries whatever the number of projects and sites: projects with
+    site counts, sites with analytics aggregates, and the latest analytics
+    row per site picked with a ROW_NUMBER() window.
+    """
+    from projects.models import Project, Site
+    
+    user_email = request.query_params.get('user_email')
+    if not user_email:
+        return Response({'error': 'user_email is required'}, status=400)
+    
+    latest = SiteAnalytics.objects.annotate(
+        row_number=Window(RowNumber(), partition_by=[F('site_id')], order_by=[F('date').desc(), F('id').desc()])
+    ).filter(row_number=1).only('site_id', *LATEST_FIELDS)
+    sites = (
+        Site.objects.only('id', 'project_id', 'name', 'area', 'created_at', 'updated_at')
+        .annotate(
+            analytics_count=Count('analytics'),
+            total_carbon_sequestered=Sum('analytics__carbon_sequestered'),
+            total_carbon_offset=Sum('analytics__carbon_offset'),
+            avg_vegetation_index=Avg('analytics__vegetation_index'),
+        )
+        .order_by('name')
+        .prefetch_related(Prefetch('analytics', queryset=latest, to_attr='latest_analytics'))
+    )
+    projects = (
+        Project.objects.filter(created_by__email=user_email)
+        .defer('footprint')
+        .annotate(site_count=Count('sites'))
+        .prefetch_related(Prefetch('sites', queryset=sites, to_attr='dashboard_sites'))
+        .order_by('-created_at')
+    )
+    
+    results = []
+    totals = {'projects': 0, 'sites': 0, 'total_area': 0.0, 'carbon_sequestered': 0.0, 'carbon_offset': 0.0}
+    for project in projects:
+        site_rows = []
+        project_totals = {'carbon_sequestered': 0.0, 'carbon_offset': 0.0, 'latest_carbon_sequestered': 0.0}
+        for site in project.dashboard_sites:
+            row = site.latest_analytics[0] if site.latest_analytics else None
+            site_rows.append({
+                'id': site.id,
+                'name': site.name,
+                'area': site.area,
+                'analytics_count': site.analytics_count,
+                'total_carbon_sequestered': site.total_carbon_sequestered or 0,
+                'total_carbon_offset': site.total_carbon_offset or 0,
+                'avg_vegetation_index': site.avg_vegetation_index or 0,
+                'latest': {field: getattr(row, field) for field in LATEST_FIELDS} if row else None,
+            })
+            project_totals['carbon_sequestered'] += site.total_carbon_sequestered or 0
+            project_totals['carbon_offset'] += site.total_carbon_offset or 0
+            if row:
+                project_totals['latest_carbon_sequestered'] += row.carbon_sequestered
+        
+        results.append({
+            'id': project.id,
+            'name': project.name,
+            'description': project.description,
+            'created_at': project.created_at,
+            'updated_at': project.updated_at,
+            'site_count': project.site_count,
+            'total_area': project.total_area,
+            'bbox': [project.min_lon, project.min_lat, project.max_lon, project.max_lat] if project.min_lon is not None else None,
+            'centroid': [project.centroid_lon, project.centroid_lat] if project.centroid_lon is not None else None,
+            'totals': project_totals,
+            'sites': site_rows,
+        })
+        totals['projects'] += 1
+        totals['sites'] += project.site_count
+        totals['total_area'] += project.total_area
+        totals['carbon_sequestered'] += project_totals['carbon_sequestered']
+        totals['carbon_offset'] += project_totals['carbon_offset']
+    
+    return Response({'totals': totals, 'projects': results})